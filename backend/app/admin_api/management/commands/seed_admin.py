@@ -7,7 +7,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         super_role, created_super = AdminRole.objects.get_or_create(name='super', defaults={'description': 'all', 'permissions': [
-            'dashboard:view',
+            'dashboard:view','provider:write',
             'inspection:view','inspection:write','inspection:payment',
             'recycled:view','recycled:write',
             'verified:view','verified:write',
@@ -28,7 +28,7 @@ class Command(BaseCommand):
             super_role.description = super_role.description or 'all'
             super_role.permissions = super_role.permissions or []
             required = set([
-                'dashboard:view',
+                'dashboard:view','provider:write',
                 'inspection:view','inspection:write','inspection:payment',
                 'recycled:view','recycled:write',
                 'verified:view','verified:write',
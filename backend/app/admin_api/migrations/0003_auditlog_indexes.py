@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_api', '0002_admintokenblacklist_adminrole_permissions_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adminauditlog',
+            index=models.Index(fields=['target_type', 'target_id', 'action'], name='auditlog_target_action'),
+        ),
+        migrations.AddIndex(
+            model_name='adminauditlog',
+            index=models.Index(fields=['-created_at'], name='auditlog_created'),
+        ),
+    ]
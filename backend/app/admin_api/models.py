@@ -44,6 +44,13 @@ class AdminAuditLog(models.Model):
     snapshot_json = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # 结算日志按对象查询：target_type + target_id + action
+            models.Index(fields=['target_type', 'target_id', 'action'], name='auditlog_target_action'),
+            models.Index(fields=['-created_at'], name='auditlog_created'),
+        ]
+
 class AdminRefreshToken(models.Model):
     user = models.ForeignKey(AdminUser, on_delete=models.CASCADE)
     token = models.CharField(max_length=128, unique=True)
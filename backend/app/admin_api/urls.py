@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import LoginView, RefreshTokenView, LogoutView, DashboardMetricsView, StatisticsView, InspectionOrdersView, InspectionOrderDetailView, InspectionOrderLogisticsView, InspectionOrderPriceView, InspectionOrderPaymentView, InspectionOrderPublishVerifiedView, InspectionOrdersBatchUpdateView, RecycledProductsView, VerifiedListingsView, AuditQueueView, UsersView, AuditLogsView, RolesView, PaymentOrdersView, PaymentOrderActionView, PaymentOrderSettlementView, SettlementSummaryView, VerifiedOrdersAdminView, ShopsAdminView, AuthMeView, ChangePasswordView, PermissionsView, MenusView, CategoriesAdminView, ProductsAdminView, UsersFrontendAdminView, MessagesAdminView, AddressesAdminView
+from .views import LoginView, RefreshTokenView, LogoutView, DashboardMetricsView, StatisticsView, ProviderHealthView, InspectionOrdersView, InspectionOrderDetailView, InspectionOrderLogisticsView, InspectionOrderPriceView, InspectionOrderPaymentView, InspectionOrderPublishVerifiedView, InspectionOrdersBatchUpdateView, RecycledProductsView, VerifiedListingsView, AuditQueueView, UsersView, AuditLogsView, RolesView, PaymentOrdersView, PaymentOrderActionView, PaymentOrderSettlementView, SettlementSummaryView, VerifiedOrdersAdminView, ShopsAdminView, AuthMeView, ChangePasswordView, PermissionsView, MenusView, CategoriesAdminView, ProductsAdminView, UsersFrontendAdminView, MessagesAdminView, AddressesAdminView
 
 urlpatterns = [
     path('auth/login', LoginView.as_view()),
@@ -11,6 +11,8 @@ urlpatterns = [
     path('menus', MenusView.as_view()),
     path('dashboard/metrics', DashboardMetricsView.as_view()),
     path('statistics', StatisticsView.as_view()),
+    path('providers/health', ProviderHealthView.as_view()),
+    path('providers/<str:name>/reset', ProviderHealthView.as_view()),
     path('inspection-orders', InspectionOrdersView.as_view()),
     path('inspection-orders/<int:order_id>', InspectionOrderDetailView.as_view()),
     path('inspection-orders/<int:order_id>/status', InspectionOrderDetailView.as_view()),
@@ -339,6 +339,38 @@ class StatisticsView(APIView):
             'totalGMV': total_gmv
         })
 
+@method_decorator(csrf_exempt, name='dispatch')
+class ProviderHealthView(APIView):
+    """估价数据源熔断器状态（失败率、耗时EWMA、健康分）"""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        admin = get_admin_from_request(request)
+        if not admin:
+            return Response({'detail': 'Unauthorized'}, status=401)
+        if not has_perms(admin, ['dashboard:view']):
+            return Response({'detail': 'Forbidden'}, status=403)
+        from app.secondhand_app.circuit_breaker import circuit_breakers
+        return Response({'providers': circuit_breakers.snapshot()})
+
+    def post(self, request, name=None):
+        """手动重置某个数据源的熔断器（需要 provider:write 权限，记录审计日志）"""
+        admin = get_admin_from_request(request)
+        if not admin:
+            return Response({'detail': 'Unauthorized'}, status=401)
+        if not has_perms(admin, ['provider:write']):
+            return Response({'detail': 'Forbidden'}, status=403)
+        from app.secondhand_app.circuit_breaker import PROVIDERS, circuit_breakers
+        if name not in PROVIDERS:
+            return Response({'detail': '未知的数据源'}, status=404)
+        breaker = circuit_breakers.get(name)
+        before = breaker.snapshot()
+        breaker.reset()
+        AdminAuditLog.objects.create(actor=admin, target_type='PriceProvider', target_id=0, action='provider_reset',
+                                     snapshot_json={'name': name, 'before': before})
+        return Response(breaker.snapshot())
+
 # 质检订单相关视图
 @method_decorator(csrf_exempt, name='dispatch')
 class InspectionOrdersView(APIView):
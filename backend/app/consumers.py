@@ -1,123 +1,254 @@
+import asyncio
 import json
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from channels.exceptions import ChannelFull
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
-from app.secondhand_app.models import Message, Product
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+from app.secondhand_app.models import Conversation, Message, Product
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
+# 查不到的商品也缓存下来，避免同一个无效ID反复查库
+MISSING = object()
+
+
+class LRUCache:
+    """每个连接独立的有界 LRU 缓存（接收者、商品等只读信息）"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    聊天连接，客户端可发送的事件：
+    - chat_message: {receiver_id, content, product_id?}（不带 type 时默认按此处理）
+    - mark_read: {partner_id, up_to_id}，把对方发来的、ID 不超过 up_to_id 的消息标记为已读
+    - typing: {receiver_id, is_typing}
+    - presence_subscribe / presence_unsubscribe: {user_ids: [...]}（只能订阅有过会话的用户）
+    在线状态只保存在通道层中：每个用户有一个 presence_{id} 组，订阅者加入该组接收上下线通知；
+    订阅时向对方发送探测，在线的连接会直接回复，没有回复即视为离线
+    """
+    cache_size = 256  # 每个连接缓存的接收者/商品数量上限
+    read_flush_delay = 1.0  # 已读回执合并写库的延迟（秒）
+    typing_throttle = 2.0  # 同一状态的输入提示最短转发间隔（秒）
+    max_presence_subscriptions = 100  # 单个连接最多订阅的在线状态数
+
     async def connect(self):
         # 从查询参数中获取token
-        query_string = self.scope['query_string'].decode()
-        token = None
-        
-        for param in query_string.split('&'):
-            if param.startswith('token='):
-                token = param.split('=')[1]
-                break
-        
+        query = parse_qs(self.scope['query_string'].decode())
+        token = (query.get('token') or [None])[0]
+
         if not token:
             await self.close()
             return
-        
-        # 验证token
-        try:
-            token_obj = await database_sync_to_async(Token.objects.get)(key=token)
-            self.user = await database_sync_to_async(User.objects.get)(id=token_obj.user_id)
-        except:
+
+        # 验证token（一次数据库往返）
+        self.user = await self.authenticate(token)
+        if self.user is None:
             await self.close()
             return
-        
+
+        # 接收者：id -> username；商品：id -> title 或 MISSING
+        self.receivers = LRUCache(self.cache_size)
+        self.products = LRUCache(self.cache_size)
+        # 待写入的已读位置：partner_id -> 最大已读消息ID
+        self.pending_reads = {}
+        self.read_flush_task = None
+        self.typing_sent = {}
+        self.typing_partners = set()  # 已确认有会话、可以发送输入提示的用户
+        self.presence_groups = set()
+
         self.user_group_name = f'user_{self.user.id}'
-        
+        self.presence_group_name = f'presence_{self.user.id}'
+
         # 加入用户组
         await self.channel_layer.group_add(
             self.user_group_name,
             self.channel_name
         )
-        
+        # 组成员会在 group_expiry 后过期（清理崩溃进程残留的成员），长连接需要定期续期
+        self.group_refresh_task = asyncio.ensure_future(self.refresh_group_membership())
+
         await self.accept()
-    
+        await self.announce_presence(True)
+
+    @database_sync_to_async
+    def authenticate(self, token):
+        """
+        优先按 JWT 访问令牌校验（前端登录返回的 access），签名校验不需要查库，只需一次查询加载用户；
+        其次兼容 DRF Token（启用 rest_framework.authtoken 时），用 select_related 一次取回用户
+        """
+        try:
+            user_id = AccessToken(token)['user_id']
+            return User.objects.filter(id=user_id, is_active=True).first()
+        except (TokenError, KeyError):
+            pass
+        if Token._meta.abstract:
+            return None
+        token_obj = Token.objects.select_related('user').filter(key=token).first()
+        if token_obj and token_obj.user.is_active:
+            return token_obj.user
+        return None
+
     async def disconnect(self, close_code):
+        if hasattr(self, 'group_refresh_task'):
+            self.group_refresh_task.cancel()
         # 离开用户组
         if hasattr(self, 'user_group_name'):
+            # 断开前把尚未写库的已读位置写入
+            if self.read_flush_task is not None:
+                self.read_flush_task.cancel()
+            await self.flush_reads()
+
             await self.channel_layer.group_discard(
                 self.user_group_name,
                 self.channel_name
             )
-    
+            for group_name in self.presence_groups:
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+
+            # 通知下线；同一用户的其他连接收到 presence_refresh 后会重新宣告在线
+            await self.announce_presence(False)
+            await self.broadcast(self.user_group_name, {'type': 'presence_refresh'})
+
+    async def refresh_group_membership(self):
+        """在组成员过期前重新 group_add，保持在线连接一直能收到消息"""
+        interval = max(getattr(self.channel_layer, 'group_expiry', 86400) / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+                for group_name in self.presence_groups:
+                    await self.channel_layer.group_add(group_name, self.channel_name)
+            except Exception as e:
+                logger.warning(f"续期用户组失败 {self.user_group_name}: {e}")
+
+    async def send_to_group(self, group_name, event):
+        """
+        向用户组投递事件
+        通道积压超过 capacity 时通道层抛出 ChannelFull，这里转成错误提示而不是阻塞或断开连接
+        """
+        try:
+            await self.channel_layer.group_send(group_name, event)
+            return True
+        except ChannelFull:
+            logger.warning(f"通道已满，丢弃事件: {group_name}")
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Channel is busy, please retry later'
+            }))
+            return False
+
+    async def broadcast(self, group_name, event):
+        """投递状态类事件（在线、输入提示），通道已满时直接丢弃，不打扰客户端"""
+        try:
+            await self.channel_layer.group_send(group_name, event)
+        except ChannelFull:
+            logger.warning(f"通道已满，丢弃状态事件: {group_name}")
+
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
-            
-            # 处理消息发送
-            if data.get('type') == 'chat_message':
+
+            # 处理消息发送（前端直接发送 {receiver_id, content} 时也按聊天消息处理）
+            message_type = data.get('type', 'chat_message')
+            if message_type == 'chat_message':
                 await self.handle_chat_message(data)
-        
+            elif message_type == 'mark_read':
+                await self.handle_mark_read(data)
+            elif message_type == 'typing':
+                await self.handle_typing(data)
+            elif message_type == 'presence_subscribe':
+                await self.handle_presence_subscribe(data)
+            elif message_type == 'presence_unsubscribe':
+                await self.handle_presence_unsubscribe(data)
+
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': 'Invalid JSON format'
             }))
-    
+
     async def handle_chat_message(self, data):
         receiver_id = data.get('receiver_id')
         content = data.get('content')
         product_id = data.get('product_id')
-        
+
         if not receiver_id or not content:
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': 'Missing receiver_id or content'
             }))
             return
-        
+
         try:
-            # 创建消息
-            receiver = await database_sync_to_async(User.objects.get)(id=receiver_id)
-            product = None
-            if product_id:
-                try:
-                    product = await database_sync_to_async(Product.objects.get)(id=product_id)
-                except Product.DoesNotExist:
-                    pass
-            
-            message = await database_sync_to_async(Message.objects.create)(
-                sender=self.user,
-                receiver=receiver,
-                content=content,
-                product=product
+            receiver_id = int(receiver_id)
+            product_id = int(product_id) if product_id else None
+            # 接收者和商品优先从连接缓存读取，未命中的部分在写入时一并查询
+            receiver_username = self.receivers.get(receiver_id)
+            product_title = self.products.get(product_id) if product_id else None
+
+            message, receiver_username, product_title = await self.save_message(
+                receiver_id, content, product_id, receiver_username, product_title
             )
-            
+            self.receivers.set(receiver_id, receiver_username)
+            if product_id:
+                self.products.set(product_id, product_title)
+            if product_title is MISSING:
+                product_id, product_title = None, None
+
             # 准备发送数据
             message_data = {
                 'type': 'new_message',
                 'id': message.id,
                 'sender_id': self.user.id,
                 'sender_username': self.user.username,
-                'receiver_id': receiver.id,
-                'receiver_username': receiver.username,
+                'receiver_id': receiver_id,
+                'receiver_username': receiver_username,
                 'content': content,
                 'product_id': product_id,
-                'product_title': product.title if product else None,
+                'product_title': product_title,
                 'created_at': message.created_at.isoformat(),
                 'is_read': False
             }
-            
+
             # 发送给发送者
-            await self.channel_layer.group_send(
-                self.user_group_name,
-                message_data
-            )
-            
+            await self.send_to_group(self.user_group_name, message_data)
+
             # 发送给接收者
             receiver_group_name = f'user_{receiver_id}'
-            await self.channel_layer.group_send(
-                receiver_group_name,
-                message_data
-            )
-            
+            await self.send_to_group(receiver_group_name, message_data)
+
         except User.DoesNotExist:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -128,7 +259,188 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'type': 'error',
                 'message': f'Failed to send message: {str(e)}'
             }))
-    
+
+    @database_sync_to_async
+    def save_message(self, receiver_id, content, product_id, receiver_username=None, product_title=None):
+        """
+        一次线程池往返完成：补查未缓存的接收者/商品、写入消息、更新会话摘要
+        返回 (message, receiver_username, product_title)，商品不存在时 product_title 为 MISSING
+        """
+        if receiver_username is None:
+            receiver_username = User.objects.values_list('username', flat=True).get(id=receiver_id)
+        if product_id and product_title is None:
+            product_title = Product.objects.filter(id=product_id).values_list('title', flat=True).first()
+            if product_title is None:
+                product_title = MISSING
+
+        with transaction.atomic():
+            message = Message.objects.create(
+                sender=self.user,
+                receiver_id=receiver_id,
+                content=content,
+                product_id=product_id if product_title is not MISSING else None
+            )
+            Conversation.record_message(message)
+        return message, receiver_username, product_title
+
+    async def handle_mark_read(self, data):
+        """记录已读位置，延迟 read_flush_delay 后与期间的其他已读请求合并写库"""
+        try:
+            partner_id = int(data.get('partner_id'))
+            up_to_id = int(data.get('up_to_id'))
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Missing partner_id or up_to_id'
+            }))
+            return
+
+        if up_to_id > self.pending_reads.get(partner_id, 0):
+            self.pending_reads[partner_id] = up_to_id
+        if self.read_flush_task is None:
+            self.read_flush_task = asyncio.ensure_future(self.flush_reads_later())
+
+    async def flush_reads_later(self):
+        await asyncio.sleep(self.read_flush_delay)
+        await self.flush_reads()
+
+    async def flush_reads(self):
+        """每个会话一条 UPDATE 写入已读，然后向对方和自己的其他连接发送已读回执"""
+        self.read_flush_task = None
+        pending, self.pending_reads = self.pending_reads, {}
+        if not pending:
+            return
+        try:
+            await self.save_reads(pending)
+        except Exception as e:
+            logger.error(f"写入已读状态失败 user={self.user.id}: {e}")
+            return
+        for partner_id, up_to_id in pending.items():
+            receipt = {
+                'type': 'read_receipt',
+                'reader_id': self.user.id,
+                'partner_id': partner_id,
+                'up_to_id': up_to_id,
+            }
+            await self.broadcast(f'user_{partner_id}', receipt)
+            if partner_id != self.user.id:
+                await self.broadcast(self.user_group_name, receipt)
+
+    @database_sync_to_async
+    def save_reads(self, pending):
+        for partner_id, up_to_id in pending.items():
+            Conversation.mark_read(self.user.id, partner_id, up_to_id)
+
+    async def handle_typing(self, data):
+        """转发输入提示（只能发给有过会话的用户）；相同状态在 typing_throttle 内只转发一次"""
+        try:
+            receiver_id = int(data.get('receiver_id'))
+        except (TypeError, ValueError):
+            return
+        is_typing = bool(data.get('is_typing', True))
+        now = time.monotonic()
+        last_state, last_sent = self.typing_sent.get(receiver_id, (None, 0))
+        if last_state == is_typing and now - last_sent < self.typing_throttle:
+            return
+        self.typing_sent[receiver_id] = (is_typing, now)
+        if receiver_id not in self.typing_partners:
+            if receiver_id not in await self.presence_allowed([receiver_id]):
+                return
+            self.typing_partners.add(receiver_id)
+        await self.broadcast(f'user_{receiver_id}', {
+            'type': 'typing',
+            'sender_id': self.user.id,
+            'is_typing': is_typing,
+        })
+
+    async def handle_presence_subscribe(self, data):
+        # 只能订阅有过会话的用户（以及自己），不能查询任意用户是否在线
+        allowed = await self.presence_allowed(self._user_ids(data))
+        for user_id in self._user_ids(data):
+            if user_id not in allowed:
+                continue
+            group_name = f'presence_{user_id}'
+            if group_name in self.presence_groups:
+                continue
+            if len(self.presence_groups) >= self.max_presence_subscriptions:
+                break
+            self.presence_groups.add(group_name)
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            # 探测对方当前是否在线，在线的连接会直接回复到本连接
+            await self.broadcast(f'user_{user_id}', {
+                'type': 'presence_probe',
+                'reply_channel': self.channel_name,
+            })
+
+    @database_sync_to_async
+    def presence_allowed(self, user_ids):
+        """返回 user_ids 中与当前用户有会话的用户ID（一次查询）"""
+        user_ids = set(user_ids[:self.max_presence_subscriptions * 2])
+        allowed = {self.user.id} & user_ids
+        others = user_ids - allowed
+        if others:
+            rows = Conversation.objects.filter(
+                Q(user_a_id=self.user.id, user_b_id__in=others) | Q(user_b_id=self.user.id, user_a_id__in=others)
+            ).values_list('user_a_id', 'user_b_id')
+            for user_a_id, user_b_id in rows:
+                allowed.add(user_b_id if user_a_id == self.user.id else user_a_id)
+        return allowed
+
+    async def handle_presence_unsubscribe(self, data):
+        for user_id in self._user_ids(data):
+            group_name = f'presence_{user_id}'
+            if group_name in self.presence_groups:
+                self.presence_groups.discard(group_name)
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    @staticmethod
+    def _user_ids(data):
+        user_ids = data.get('user_ids')
+        if not isinstance(user_ids, list):
+            return []
+        result = []
+        for user_id in user_ids:
+            try:
+                result.append(int(user_id))
+            except (TypeError, ValueError):
+                continue
+        return result
+
+    async def announce_presence(self, online):
+        await self.broadcast(self.presence_group_name, {
+            'type': 'presence',
+            'user_id': self.user.id,
+            'online': online,
+        })
+
+    async def new_message(self, event):
+        # 新消息事件（group_send 的 type 为 new_message）转发到WebSocket
+        await self.send(text_data=json.dumps(event))
+
     async def chat_message(self, event):
         # 发送消息到WebSocket
-        await self.send(text_data=json.dumps(event))
\ No newline at end of file
+        await self.send(text_data=json.dumps(event))
+
+    async def read_receipt(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    async def typing(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    async def presence(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    async def presence_probe(self, event):
+        # 回复探测方：本用户在线
+        try:
+            await self.channel_layer.send(event['reply_channel'], {
+                'type': 'presence',
+                'user_id': self.user.id,
+                'online': True,
+            })
+        except ChannelFull:
+            pass
+
+    async def presence_refresh(self, event):
+        # 同一用户的其他连接断开后重新宣告在线
+        await self.announce_presence(True)
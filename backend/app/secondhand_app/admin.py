@@ -4,8 +4,9 @@ from .models import Category, Product, ProductImage, Order, Message, Favorite
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_at']
+    list_display = ['name', 'active_product_count', 'active_verified_product_count', 'created_at']
     search_fields = ['name']
+    readonly_fields = ['active_product_count', 'active_verified_product_count']
 
 
 class ProductImageInline(admin.TabularInline):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SecondhandAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.secondhand_app'
+
+    def ready(self):
+        # 注册模型信号（搜索索引增量更新等）
+        from . import signals  # noqa: F401
@@ -0,0 +1,226 @@
+"""
+外部估价数据源熔断器
+每个数据源（爱回收、回收宝、聚合数据、百度、阿里云、各爬取平台）一个熔断器，状态保存在 Django 缓存中，
+配置 Redis 缓存（CACHE_REDIS_URL）后所有 worker 共享，一个进程发现数据源故障后其他进程也会直接跳过
+- 关闭（closed）：正常请求，按时间桶统计最近 window 秒内的请求数和失败数
+- 打开（open）：失败率超过阈值后 open_seconds 秒内不再请求该数据源
+- 半开（half_open）：打开时间结束后只放行一个探测请求，成功则关闭，失败则重新打开
+另外记录响应耗时的指数加权平均（EWMA），与失败率一起给出健康分，供管理后台展示
+"""
+import logging
+import time
+from typing import Dict, List, Optional
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 已接入的数据源，管理后台按此顺序展示
+PROVIDERS = (
+    'aihuishou', 'huishoubao', 'custom',
+    'juhe', 'baidu', 'aliyun',
+    'scrape_aihuishou', 'scrape_huishoubao', 'scrape_xianyu', 'scrape_api',
+)
+
+DEFAULT_CONFIG = {
+    'window': 60,           # 统计窗口（秒）
+    'buckets': 6,           # 窗口内的时间桶数
+    'min_requests': 5,      # 窗口内请求数达到该值才判断失败率
+    'failure_rate': 0.5,    # 失败率阈值
+    'open_seconds': 30,     # 打开状态持续时间
+    'probe_timeout': 15,    # 半开探测请求的占用时间，超时后允许下一个探测
+    'ewma_alpha': 0.2,      # 耗时 EWMA 的平滑系数
+}
+
+
+# 所有数据源共用的连接池（保持长连接，避免每次估价都重新建立 TLS 连接）
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_connections=len(PROVIDERS), pool_maxsize=32))
+_session.mount('https://', HTTPAdapter(pool_connections=len(PROVIDERS), pool_maxsize=32))
+
+
+class CircuitOpenError(Exception):
+    """数据源处于熔断状态，请求未发出"""
+
+
+class CircuitBreaker:
+    """单个数据源的熔断器（无本地状态，所有状态都在缓存中）"""
+
+    def __init__(self, name: str, config: Optional[Dict] = None):
+        self.name = name
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.bucket_seconds = max(self.config['window'] / self.config['buckets'], 1)
+
+    def _key(self, suffix):
+        return f'circuit:{self.name}:{suffix}'
+
+    def _bucket(self, now=None):
+        return int((now or time.time()) // self.bucket_seconds)
+
+    # ---- 状态 ----
+
+    def state(self) -> str:
+        if cache.get(self._key('open')):
+            return OPEN
+        if cache.get(self._key('tripped')):
+            return HALF_OPEN
+        return CLOSED
+
+    def available(self) -> bool:
+        """是否值得提交请求（不占用半开探测名额）"""
+        state = self.state()
+        if state == OPEN:
+            return False
+        if state == HALF_OPEN:
+            return cache.get(self._key('probe')) is None
+        return True
+
+    def allow(self) -> bool:
+        """请求前调用；半开状态下只有抢到探测名额的请求会被放行"""
+        state = self.state()
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        return cache.add(self._key('probe'), 1, self.config['probe_timeout'])
+
+    def release_probe(self):
+        """请求被取消、没有结果时调用：半开状态下释放探测名额，让下一个请求探测，不用等 probe_timeout"""
+        if cache.get(self._key('tripped')):
+            cache.delete(self._key('probe'))
+
+    # ---- 统计 ----
+
+    def _incr(self, key):
+        ttl = int(self.config['window'] + self.bucket_seconds * 2)
+        cache.add(key, 0, ttl)
+        try:
+            cache.incr(key)
+        except ValueError:  # 键刚好过期
+            cache.set(key, 1, ttl)
+
+    def _bucket_keys(self):
+        current = self._bucket()
+        buckets = range(current - self.config['buckets'] + 1, current + 1)
+        return buckets, [self._key(f'{kind}:{b}') for b in buckets for kind in ('total', 'fail')]
+
+    def _counts(self):
+        """返回窗口内 (请求数, 失败数)"""
+        buckets, keys = self._bucket_keys()
+        values = cache.get_many(keys)
+        total = sum(values.get(self._key(f'total:{b}'), 0) for b in buckets)
+        failures = sum(values.get(self._key(f'fail:{b}'), 0) for b in buckets)
+        return total, failures
+
+    def _record_latency(self, elapsed):
+        key = self._key('ewma')
+        previous = cache.get(key)
+        alpha = self.config['ewma_alpha']
+        value = elapsed if previous is None else alpha * elapsed + (1 - alpha) * previous
+        cache.set(key, value, None)
+
+    def record_success(self, elapsed: float):
+        if cache.get(self._key('tripped')):
+            # 探测成功：关闭熔断器，清空窗口统计，之前的失败不再计入
+            self._clear()
+            logger.info(f"数据源 {self.name} 恢复，熔断器关闭")
+        self._incr(self._key(f'total:{self._bucket()}'))
+        self._record_latency(elapsed)
+
+    def record_failure(self, elapsed: float):
+        bucket = self._bucket()
+        self._incr(self._key(f'total:{bucket}'))
+        self._incr(self._key(f'fail:{bucket}'))
+        self._record_latency(elapsed)
+        if cache.get(self._key('tripped')):
+            self._trip('探测失败')
+            return
+        total, failures = self._counts()
+        if total >= self.config['min_requests'] and failures / total >= self.config['failure_rate']:
+            self._trip(f'失败率 {failures}/{total}')
+
+    def _trip(self, reason):
+        open_seconds = self.config['open_seconds']
+        cache.set(self._key('open'), time.time() + open_seconds, open_seconds)
+        cache.set(self._key('tripped'), time.time(), None)
+        cache.delete(self._key('probe'))
+        logger.warning(f"数据源 {self.name} 熔断 {open_seconds}s（{reason}）")
+
+    def _clear(self):
+        _, keys = self._bucket_keys()
+        cache.delete_many(keys + [self._key('open'), self._key('tripped'), self._key('probe')])
+
+    def reset(self):
+        self._clear()
+        cache.delete(self._key('ewma'))
+
+    # ---- 请求 ----
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        经过熔断器发出 HTTP 请求
+        网络异常、5xx 和 429 计为失败；熔断状态下抛出 CircuitOpenError，不发出请求
+        """
+        if not self.allow():
+            raise CircuitOpenError(f'数据源 {self.name} 已熔断')
+        started = time.monotonic()
+        try:
+            response = _session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.record_failure(time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        if response.status_code >= 500 or response.status_code == 429:
+            self.record_failure(elapsed)
+        else:
+            self.record_success(elapsed)
+        return response
+
+    def snapshot(self) -> Dict:
+        """当前状态，供管理后台展示"""
+        total, failures = self._counts()
+        failure_rate = failures / total if total else 0.0
+        latency = cache.get(self._key('ewma'))
+        open_until = cache.get(self._key('open'))
+        state = self.state()
+        # 健康分：成功率 × 耗时系数（EWMA 1 秒时为 0.5）
+        health = 0.0 if state == OPEN else (1 - failure_rate) / (1 + (latency or 0))
+        return {
+            'name': self.name,
+            'state': state,
+            'requests': total,
+            'failures': failures,
+            'failure_rate': round(failure_rate, 3),
+            'latency_ewma_ms': round(latency * 1000) if latency is not None else None,
+            'open_remaining': max(round(open_until - time.time()), 0) if open_until else 0,
+            'health': round(health * 100),
+        }
+
+
+class CircuitBreakerRegistry:
+    """按数据源名称获取熔断器"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, getattr(settings, 'PRICE_CIRCUIT_BREAKER', None))
+            self._breakers[name] = breaker
+        return breaker
+
+    def snapshot(self) -> List[Dict]:
+        names = list(PROVIDERS) + sorted(set(self._breakers) - set(PROVIDERS))
+        return [self.get(name).snapshot() for name in names]
+
+
+# 全局实例
+circuit_breakers = CircuitBreakerRegistry()
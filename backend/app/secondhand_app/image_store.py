@@ -0,0 +1,133 @@
+"""
+按内容哈希存储商品图片
+- 文件路径由内容的 SHA-256 决定（blobs/ab/cd/<sha256>.jpg），相同内容只存一份
+- 商品图片记录的 image 字段指向共享文件，blob 外键用于引用计数
+- 引用数为 0 的文件由 gc_image_blobs 命令清理
+"""
+import hashlib
+import os
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Union
+
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ImageBlob
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
+
+
+class StoredFile(NamedTuple):
+    """已写入存储的文件（还没有数据库记录）"""
+    sha256: str
+    name: str
+    size: int
+
+
+def blob_path(sha256: str, filename: str = '') -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        ext = '.jpg'
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+
+def _digest(content: File):
+    """返回 (sha256, 大小)；流式上传时接收过程中已计算（见 upload_handlers）"""
+    sha256 = getattr(content, 'sha256', None)
+    if sha256:
+        return sha256, content.size
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _write(name: str, content: File):
+    """文件不存在时写入存储"""
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, content)
+        if saved != name:  # 并发写入同一文件时存储会自动改名，保留先写入的那份
+            default_storage.delete(saved)
+
+
+def save_file(content: Union[bytes, File], filename: str = '') -> StoredFile:
+    """
+    计算哈希并写入存储，同样内容的文件已存在时不再写入
+    只访问存储不访问数据库，可以在下载线程中调用
+    """
+    if isinstance(content, bytes):
+        content = ContentFile(content)
+    sha256, size = _digest(content)
+    name = blob_path(sha256, filename or getattr(content, 'name', '') or '')
+    _write(name, content)
+    return StoredFile(sha256, name, size)
+
+
+def get_blobs(files: Iterable[StoredFile]) -> Dict[str, ImageBlob]:
+    """
+    批量取得（没有则创建）文件对应的 ImageBlob，返回 {sha256: ImageBlob}
+    记录会被锁住直到外层事务结束，调用方应在同一个事务里写入图片记录（见 store_image）
+    """
+    files = {f.sha256: f for f in files}
+    if not files:
+        return {}
+    with transaction.atomic():
+        locked = ImageBlob.objects.select_for_update()
+        blobs = {blob.sha256: blob for blob in locked.filter(sha256__in=files)}
+        missing = [ImageBlob(sha256=f.sha256, file=f.name, size=f.size) for sha, f in files.items() if sha not in blobs]
+        if missing:
+            ImageBlob.objects.bulk_create(missing, ignore_conflicts=True)
+            blobs.update((blob.sha256, blob) for blob in locked.filter(sha256__in=[b.sha256 for b in missing]))
+    return blobs
+
+
+def store_image(content: Union[bytes, File], filename: str = '') -> ImageBlob:
+    """
+    保存一张图片，返回共享的 ImageBlob
+    记录会被锁住直到外层事务结束：调用方应在同一个事务里写入图片记录，
+    这样 gc_image_blobs 不会在图片记录写入前删掉引用数还是 0 的旧记录
+    """
+    if isinstance(content, bytes):
+        content = ContentFile(content)
+    sha256, size = _digest(content)
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            try:
+                with transaction.atomic():
+                    blob = ImageBlob.objects.create(
+                        sha256=sha256, file=blob_path(sha256, filename or getattr(content, 'name', '') or ''),
+                        size=size,
+                    )
+            except IntegrityError:  # 并发上传了同一张图片
+                blob = ImageBlob.objects.select_for_update().get(sha256=sha256)
+        # 拿到记录锁之后再写文件：gc_image_blobs 在同一事务里删除记录和文件，
+        # 这里看到的文件不会再被删掉，缺失时（旧记录刚被清理）用还没移动过的上传内容补写
+        _write(blob.file.name, content)
+    return blob
+
+
+def restore_file(blob: ImageBlob, content: Union[bytes, File]) -> bool:
+    """
+    在记录已被锁住（get_blobs / store_image 之后）时补写缺失的文件
+    内容哈希与记录不一致时不写入，返回 False
+    """
+    if isinstance(content, bytes):
+        content = ContentFile(content)
+    if _digest(content)[0] != blob.sha256:
+        return False
+    _write(blob.file.name, content)
+    return True
+
+
+def add_references(blob_ids: List[int], delta: int = 1):
+    """增加引用数（bulk_create 不触发信号时使用），同一文件出现多次时累加"""
+    by_count: Dict[int, List[int]] = {}
+    for blob_id, count in Counter(pk for pk in blob_ids if pk).items():
+        by_count.setdefault(count, []).append(blob_id)
+    for count, ids in by_count.items():
+        ImageBlob.objects.filter(pk__in=ids).update(ref_count=F('ref_count') + count * delta)
@@ -0,0 +1,156 @@
+"""
+商品图片多尺寸生成
+- 按 IMAGE_VARIANTS 的宽度生成 IMAGE_VARIANT_FORMATS 各格式的图片（默认 WebP 和 JPEG），宽度不足的图片不放大
+- 上传接口在事务提交后提交生成任务；解码、缩放、编码在进程池中执行，不占用请求线程，也不受 GIL 限制
+- 按 ImageBlob 生成，内容相同的图片共享同一组缩略图（variants/ab/cd/<sha256>/thumb.webp）
+注意：进程池使用 spawn 方式启动，子进程只导入本模块，本模块顶层不能导入 models
+"""
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {'thumb': 240, 'card': 480}
+DEFAULT_FORMATS = ['webp', 'jpeg']
+
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def variant_specs() -> Tuple[Dict[str, int], List[str]]:
+    """(尺寸名 -> 宽度, 格式列表)"""
+    return (getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS),
+            getattr(settings, 'IMAGE_VARIANT_FORMATS', DEFAULT_FORMATS))
+
+
+def variant_keys(sizes: Dict[str, int], formats: List[str]) -> List[str]:
+    return [f'{size}.{fmt}' for size in sizes for fmt in formats]
+
+
+def render_variants(data: bytes, sizes: Dict[str, int], formats: List[str]) -> Dict[str, bytes]:
+    """在子进程中执行：解码图片并按各宽度缩放、编码，返回 {"thumb.webp": 内容, ...}"""
+    max_width = max(sizes.values())
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG 解码时直接按 1/2、1/4、1/8 缩小，手机原图解码快很多（结果不小于 max_width）
+        source.draft('RGB', (max_width, max_width))
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'L'):
+            # 透明背景填成白色（JPEG 不支持透明）
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+
+        results = {}
+        for size, width in sizes.items():
+            if image.width > width:
+                resized = image.resize((width, max(round(image.height * width / image.width), 1)),
+                                       Image.Resampling.LANCZOS)
+            else:
+                resized = image
+            for fmt in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, fmt.upper(), **SAVE_OPTIONS.get(fmt, {}))
+                results[f'{size}.{fmt}'] = buffer.getvalue()
+    return results
+
+
+class VariantPipeline:
+    """生成图片多尺寸的后台流水线：线程负责读写存储和数据库，进程池负责图片处理"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._pending = set()  # 已提交还未完成的 blob，同一图片被多个商品同时上传时只生成一次
+
+    @property
+    def worker_count(self) -> int:
+        return self.workers or getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+
+    def _pools(self) -> Tuple[ProcessPoolExecutor, ThreadPoolExecutor]:
+        with self._lock:
+            if self._processes is None:
+                # 请求进程中已有多个线程，fork 出的子进程可能继承被占用的锁，使用 spawn
+                self._processes = ProcessPoolExecutor(self.worker_count, mp_context=multiprocessing.get_context('spawn'))
+                self._threads = ThreadPoolExecutor(self.worker_count * 2, thread_name_prefix='image-variants')
+        return self._processes, self._threads
+
+    def schedule(self, blob_ids: Iterable[int]):
+        """事务提交后在后台生成（上传图片后调用）"""
+        blob_ids = sorted(set(pk for pk in blob_ids if pk))
+        if not blob_ids:
+            return
+
+        def submit():
+            _, threads = self._pools()
+            with self._lock:
+                new = [pk for pk in blob_ids if pk not in self._pending]
+                self._pending.update(new)
+            for pk in new:
+                threads.submit(self._generate_in_background, pk)
+
+        transaction.on_commit(submit)
+
+    def _generate_in_background(self, blob_id: int):
+        try:
+            self.generate(blob_id)
+        except Exception as e:
+            logger.warning(f"生成图片尺寸失败 blob#{blob_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(blob_id)
+            connection.close()
+
+    def generate(self, blob_id: int, force: bool = False) -> bool:
+        """生成缺少的尺寸（force 时全部重新生成），返回是否生成"""
+        from .models import ImageBlob
+
+        blob = ImageBlob.objects.filter(pk=blob_id).first()
+        if blob is None:
+            return False
+        sizes, formats = variant_specs()
+        if not force and set(variant_keys(sizes, formats)) <= set(blob.variants):
+            return False
+
+        with default_storage.open(blob.file.name, 'rb') as f:
+            data = f.read()
+        processes, _ = self._pools()
+        rendered = processes.submit(render_variants, data, sizes, formats).result()
+
+        base = f'variants/{blob.sha256[:2]}/{blob.sha256[2:4]}/{blob.sha256}'
+        variants = {}
+        for key, content in rendered.items():
+            name = f'{base}/{key}'
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[key] = default_storage.save(name, ContentFile(content))
+        ImageBlob.objects.filter(pk=blob.pk).update(variants=variants)
+        return True
+
+    def shutdown(self):
+        # 等待线程结束时不能持有 _lock：后台线程结束前需要它更新 _pending
+        with self._lock:
+            processes, threads = self._processes, self._threads
+        if processes is None:
+            return
+        threads.shutdown()
+        processes.shutdown()
+        with self._lock:
+            self._processes = self._threads = None
+
+
+# 全局实例
+variant_pipeline = VariantPipeline()
@@ -0,0 +1,107 @@
+"""
+用已完成回收订单校准估价模型系数的管理命令
+拟合结果发布为新的校准系数版本，各服务进程自动切换；效果不好时可用 --rollback 回滚
+"""
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.secondhand_app.models import PriceDataVersion, RecycleOrder
+from app.secondhand_app import price_calibration
+from app.secondhand_app.price_calibration import CoefficientFitter
+from app.secondhand_app.price_data import price_data_store
+from app.secondhand_app.price_model import price_model
+
+KIND = 'coefficients'
+
+
+class Command(BaseCommand):
+    help = "用已完成回收订单的成交价校准估价模型的品牌、成色、存储和型号系数"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='每次读取的订单数')
+        parser.add_argument('--days', type=int, default=None, help='只使用最近 N 天完成的订单')
+        parser.add_argument('--ridge', type=float, default=5.0, help='品牌/成色/存储系数的正则强度，越大越接近当前值')
+        parser.add_argument('--model-ridge', type=float, default=20.0, help='型号系数的正则强度')
+        parser.add_argument('--min-samples', type=int, default=50, help='有效订单少于该数量时不发布')
+        parser.add_argument('--dry-run', action='store_true', help='只输出拟合结果，不发布')
+        parser.add_argument(
+            '--rollback',
+            nargs='?',
+            const=-1,
+            type=int,
+            metavar='VERSION',
+            help='回滚到指定版本；不指定版本时回滚到上一个版本，0 表示不使用校准系数',
+        )
+
+    def handle(self, *args, **options):
+        if options['rollback'] is not None:
+            return self.rollback(options['rollback'])
+
+        if price_calibration.np is None:
+            raise CommandError('估价系数校准需要安装 numpy（pip install -r requirements.txt）')
+        fitter = CoefficientFitter(price_model, ridge=options['ridge'], model_ridge=options['model_ridge'])
+
+        orders = RecycleOrder.objects.filter(
+            status='completed', device_type='手机', final_price__gt=0,
+        )
+        if options['days']:
+            orders = orders.filter(updated_at__gte=timezone.now() - timedelta(days=options['days']))
+        rows = (
+            (brand, model, storage, condition, float(final_price))
+            for brand, model, storage, condition, final_price in orders.values_list(
+                'brand', 'model', 'storage', 'condition', 'final_price'
+            ).iterator(chunk_size=options['chunk_size'])
+        )
+        while True:
+            chunk = list(islice(rows, options['chunk_size']))
+            if not chunk:
+                break
+            fitter.add(chunk)
+
+        self.stdout.write(f'有效订单 {fitter.samples} 个，跳过 {fitter.skipped} 个（型号不在价格表中）')
+        if fitter.samples < options['min_samples']:
+            self.stdout.write(self.style.WARNING(f'有效订单少于 {options["min_samples"]} 个，不发布校准系数'))
+            return
+
+        result = fitter.solve()
+        self.stdout.write(
+            f'对数误差 RMSE：{result.rmse_before:.4f} -> {result.rmse_after:.4f}'
+            f'（约 {result.rmse_before * 100:.1f}% -> {result.rmse_after * 100:.1f}%）'
+        )
+        for kind, name, old_value, new_value in fitter.changes(result.coefficients):
+            self.stdout.write(f'  {kind:<10} {name:<10} {old_value:.4f} -> {new_value:.4f}')
+        models = sum(len(items) for items in result.coefficients['model'].values())
+        self.stdout.write(f'  型号系数 {models} 个')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('--dry-run：未发布'))
+            return
+
+        data = {
+            **result.coefficients,
+            'stats': {
+                'samples': result.samples,
+                'rmse_before': round(result.rmse_before, 4),
+                'rmse_after': round(result.rmse_after, 4),
+                'ridge': options['ridge'],
+                'model_ridge': options['model_ridge'],
+                'price_database_version': price_model.data_version,
+            },
+        }
+        record = price_data_store.publish(
+            KIND, data, note=f'{result.samples} 个订单，RMSE {result.rmse_before:.3f} -> {result.rmse_after:.3f}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ 校准系数已发布为版本 {record.version}'))
+
+    def rollback(self, version):
+        if version == -1:
+            version = price_data_store.previous_version(KIND)
+        try:
+            price_data_store.activate(KIND, version)
+        except PriceDataVersion.DoesNotExist as e:
+            raise CommandError(str(e))
+        label = f'版本 {version}' if version else '默认系数（不使用校准系数）'
+        self.stdout.write(self.style.SUCCESS(f'✓ 校准系数已回滚到{label}'))
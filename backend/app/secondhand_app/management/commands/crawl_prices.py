@@ -0,0 +1,76 @@
+"""
+离线批量爬取机型价格的管理命令
+按价格表中的机型和存储容量并发爬取各平台价格，结果按平台取中位数，
+输出为 update_price_database --file 可直接导入的 {品牌: {型号: {存储: 价格}}} 格式
+⚠️ 爬取第三方平台可能违反服务条款，请谨慎使用；并发和请求间隔见 SCRAPER_ENGINE
+"""
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.secondhand_app.price_model import price_model
+from app.secondhand_app.scraper_service import scrape_engine, scraper_service
+
+
+class Command(BaseCommand):
+    help = "按价格表中的机型离线爬取各平台价格，输出可导入的价格表JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--out', type=str, required=True, help='输出JSON路径')
+        parser.add_argument('--platforms', type=str, default='',
+                            help='逗号分隔的平台，默认全部：' + ','.join(scraper_service.platforms))
+        parser.add_argument('--brands', type=str, default='', help='只爬取这些品牌（逗号分隔）')
+        parser.add_argument('--limit', type=int, default=0, help='最多爬取的机型数（调试用）')
+        parser.add_argument('--concurrency', type=int, default=50, help='同时进行的请求数')
+        parser.add_argument('--timeout', type=float, default=10, help='单个请求超时（秒）')
+
+    def handle(self, *args, **options):
+        platforms = [p.strip() for p in options['platforms'].split(',') if p.strip()] or list(scraper_service.platforms)
+        unknown = set(platforms) - set(scraper_service.platforms)
+        if unknown:
+            raise CommandError(f'未知平台: {", ".join(sorted(unknown))}')
+        brands = {b.strip() for b in options['brands'].split(',') if b.strip()}
+
+        devices = []
+        for brand, models in price_model.price_database.items():
+            if brands and brand not in brands:
+                continue
+            for model, storages in models.items():
+                devices.append((brand, model, list(storages)))
+        if options['limit']:
+            devices = devices[:options['limit']]
+
+        jobs = (
+            scraper_service.job(platform, brand, model, storage, key=(brand, model, storage))
+            for brand, model, storages in devices
+            for storage in storages
+            for platform in platforms
+        )
+        total = sum(len(storages) for _, _, storages in devices) * len(platforms)
+        self.stdout.write(f'共 {len(devices)} 个机型，{total} 个请求，并发 {options["concurrency"]}')
+
+        prices = {}
+        done = found = 0
+        started = time.monotonic()
+        for job, price in scrape_engine.crawl(jobs, options['concurrency'], options['timeout']):
+            done += 1
+            if price:
+                found += 1
+                prices.setdefault(job.key, []).append(price)
+            if done % 100 == 0 or done == total:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'  {done}/{total}，有价格 {found}，{done / max(elapsed, 1e-6):.1f} 请求/秒')
+
+        result = {}
+        for (brand, model, storage), values in prices.items():
+            result.setdefault(brand, {}).setdefault(model, {})[storage] = round(statistics.median(values))
+        with open(options['out'], 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 爬取完成：{len(prices)} 个机型/存储有价格，耗时 {elapsed:.1f}s，已写入 {options["out"]}'
+        ))
+        self.stdout.write(f'导入价格表：python manage.py update_price_database --file {options["out"]}')
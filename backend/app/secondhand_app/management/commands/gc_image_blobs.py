@@ -0,0 +1,67 @@
+"""
+清理没有商品图片引用的图片文件
+只清理创建超过 --grace-hours 的文件，避免删掉刚上传、还没写入商品图片记录的文件
+"""
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from app.secondhand_app.models import ImageBlob
+
+
+class Command(BaseCommand):
+    help = "删除引用数为 0 的共享图片文件"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24, help='只清理创建超过多少小时的文件')
+        parser.add_argument('--recount', action='store_true', help='清理前按商品图片表重算全部引用数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计不删除')
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批删除的文件数')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            updated = ImageBlob.rebuild_ref_counts()
+            self.stdout.write(f'已重算 {updated} 个文件的引用数')
+
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        # 引用数可能因异常中断而偏差，删除前再确认确实没有图片记录指向该文件
+        orphans = ImageBlob.objects.filter(
+            ref_count__lte=0, created_at__lt=cutoff,
+            product_images__isnull=True, verified_product_images__isnull=True,
+        )
+        total = ImageBlob.objects.aggregate(files=Sum('size'))['files'] or 0
+        if options['dry_run']:
+            stats = orphans.aggregate(size=Sum('size'))
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ 可清理 {orphans.count()} 个文件，{(stats["size"] or 0) / 1024 / 1024:.1f} MB'
+                f'（共 {total / 1024 / 1024:.1f} MB）'
+            ))
+            return
+
+        deleted = freed = 0
+        last_pk = 0
+        while True:
+            ids = list(orphans.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            # 锁住记录后再确认一次：store_image 持有记录锁直到调用方写入图片记录，
+            # 锁住之后仍没有引用才删除；记录和文件在同一事务里删除，之后的上传会补写文件
+            with transaction.atomic():
+                locked = list(ImageBlob.objects.select_for_update().filter(pk__in=ids).values_list('pk', flat=True))
+                batch = list(orphans.filter(pk__in=locked).values_list('pk', 'file', 'size', 'variants'))
+                ImageBlob.objects.filter(pk__in=[row[0] for row in batch]).delete()
+                for _, name, size, variants in batch:
+                    # 缩略图和原图一起删除
+                    for variant in [name, *variants.values()]:
+                        default_storage.delete(variant)
+                    freed += size
+            deleted += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已清理 {deleted} 个文件，释放 {freed / 1024 / 1024:.1f} MB（清理前共 {total / 1024 / 1024:.1f} MB）'
+        ))
@@ -0,0 +1,84 @@
+"""
+为已有商品图片补生成缩略图等尺寸
+1. 还没有 ImageBlob 的旧图片先按内容哈希存入共享存储（原文件保留，确认无误后可手动删除）
+2. 为缺少尺寸的 ImageBlob 在进程池中生成图片
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.secondhand_app.image_store import add_references, store_image
+from app.secondhand_app.image_variants import VariantPipeline, variant_keys, variant_specs
+from app.secondhand_app.models import ImageBlob, ProductImage, VerifiedProductImage
+
+
+class Command(BaseCommand):
+    help = "为已有商品图片补生成缩略图（WebP/JPEG），旧图片先存入按内容哈希的共享存储"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=0, help='生成图片的进程数，默认 IMAGE_VARIANT_WORKERS')
+        parser.add_argument('--force', action='store_true', help='重新生成全部尺寸（修改尺寸或压缩参数后使用）')
+        parser.add_argument('--skip-adopt', action='store_true', help='不处理没有 ImageBlob 的旧图片')
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批读取的记录数')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if not options['skip_adopt']:
+            for model in (ProductImage, VerifiedProductImage):
+                adopted, missing = self._adopt(model, options['chunk_size'])
+                self.stdout.write(f'{model._meta.verbose_name}：{adopted} 张旧图片已存入共享存储，{missing} 张文件不存在')
+
+        sizes, formats = variant_specs()
+        expected = set(variant_keys(sizes, formats))
+        todo = [
+            pk for pk, variants in ImageBlob.objects.order_by('pk').values_list('pk', 'variants').iterator(
+                chunk_size=options['chunk_size'])
+            if options['force'] or not expected <= set(variants)
+        ]
+        self.stdout.write(f'需要生成的图片 {len(todo)} 张，尺寸 {", ".join(sorted(expected))}')
+
+        pipeline = VariantPipeline(options['workers'] or None)
+        generated = failed = 0
+        try:
+            # 线程数为进程数的两倍：读写存储和数据库时进程池仍有任务可做
+            with ThreadPoolExecutor(max_workers=pipeline.worker_count * 2) as executor:
+                futures = {executor.submit(pipeline.generate, pk, options['force']): pk for pk in todo}
+                for done, future in enumerate(as_completed(futures), 1):
+                    try:
+                        generated += future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'  生成失败 blob#{futures[future]}: {e}')
+                    if done % 100 == 0:
+                        elapsed = time.monotonic() - started
+                        self.stdout.write(f'  {done}/{len(todo)}，{done / max(elapsed, 1e-6):.1f} 张/秒')
+        finally:
+            pipeline.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已生成 {generated} 张图片的缩略图，失败 {failed}，耗时 {elapsed:.1f}s'
+        ))
+
+    def _adopt(self, model, chunk_size):
+        """把没有 ImageBlob 的旧图片存入共享存储，返回 (处理数, 文件不存在数)"""
+        adopted = missing = 0
+        last_pk = 0
+        while True:
+            images = list(model.objects.filter(blob__isnull=True, pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not images:
+                return adopted, missing
+            last_pk = images[-1].pk
+            for image in images:
+                if not image.image or not default_storage.exists(image.image.name):
+                    missing += 1
+                    continue
+                with transaction.atomic(), default_storage.open(image.image.name, 'rb') as f:
+                    blob = store_image(f, image.image.name)
+                    model.objects.filter(pk=image.pk).update(blob=blob, image=blob.file.name)
+                    # update() 不触发信号，手动增加引用
+                    add_references([blob.pk])
+                adopted += 1
@@ -1,17 +1,39 @@
+"""
+导入数据集(JSON)到数据库
+- 流式读取 JSON 数组（或每行一个对象的 JSON Lines），不把整个文件读入内存
+- 按批 bulk_create 商品和图片，每批一个事务
+- 图片用共享连接池的 Session 并发下载，并发数由 --download-workers 限制
+- 图片按内容哈希存储（见 image_store），数据集中重复的图片只存一份
+- 写入图片记录前锁住 ImageBlob 并确认文件仍在，避免与 gc_image_blobs 同时运行时指向被删掉的文件
+- 每批提交后写入断点文件，中断后重新运行会从断点继续
+注意：bulk_create 不触发模型信号，每批提交后手动更新搜索索引和分类商品计数
+"""
 import json
 import os
-import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional, Set
 
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from django.core.files.base import ContentFile
 from django.db import transaction
 import requests
+from requests.adapters import HTTPAdapter
 
-from app.secondhand_app.models import Category, Product, ProductImage
+from app.secondhand_app.image_store import StoredFile, add_references, get_blobs, restore_file, save_file
+from app.secondhand_app.models import Category, ImageBlob, Product, ProductImage
+from app.secondhand_app.search_service import search_index
+
+# 模拟浏览器的请求头
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Referer': 'https://www.goofish.com/',
+    'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+}
+MAX_IMAGES = 5          # 每个商品最多下载的图片数
+MIN_IMAGE_BYTES = 1000  # 过滤掉太小的图片
 
 CATEGORY_ALIASES = {
     "手机": "手机数码",
@@ -65,38 +87,115 @@ CATEGORY_ALIASES = {
     "固态硬盘": "存储设备",
 }
 
-SAFE_NAME_RE = re.compile(r"[^a-zA-Z0-9\u4e00-\u9fa5_\-]+")
 
+def iter_json_items(path: Path, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    流式读取 JSON 数组中的元素（也支持每行一个对象的 JSON Lines）
+    每次读取 chunk_size 个字符，用 raw_decode 逐个解析完整的元素
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+        while True:
+            # 跳过空白、数组开头和元素之间的逗号
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (buffer[pos] == "[" and not started)):
+                started = started or buffer[pos] == "["
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    # 数字等标量可能被切在两块中间，读到后续内容后才能确认完整
+                    if end < len(buffer) or eof:
+                        started = True
+                        pos = end
+                        yield item
+                        continue
+            elif eof:
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+class ImageDownloader:
+    """共享连接池的并发图片下载器，下载结果按内容哈希保存到存储"""
+
+    def __init__(self, workers: int, timeout: int):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(DOWNLOAD_HEADERS)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import-image")
 
-def safe_filename(name: str, default: str = "image") -> str:
-    name = SAFE_NAME_RE.sub("_", name).strip("_")
-    return name or default
+    def download_all(self, urls: List[str]) -> List[Optional[StoredFile]]:
+        """返回与 urls 对应的已保存文件，下载失败为 None"""
+        return list(self.executor.map(self._download, urls))
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        """下载一张图片，失败或不是图片时返回 None"""
+        try:
+            resp = self.session.get(url, timeout=self.timeout, allow_redirects=True)
+            # 检查响应是否成功且有内容，以及是否是图片类型
+            if not (resp.ok and len(resp.content) > MIN_IMAGE_BYTES):
+                return None
+            content_type = resp.headers.get("content-type", "").lower()
+            if "image" not in content_type and not url.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".gif")):
+                return None
+            return resp.content
+        except Exception:
+            return None
+
+    def _download(self, url: str) -> Optional[StoredFile]:
+        content = self.fetch(url)
+        if content is None:
+            return None
+        try:
+            return save_file(content, url.split("?")[0])
+        except Exception:
+            return None
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
 
 
 class Command(BaseCommand):
-    help = "导入数据集(JSON)到数据库，并下载图片到 media/products。"
+    help = "导入数据集(JSON)到数据库，并下载图片到 media/products；中断后重新运行会从断点继续。"
 
     def add_arguments(self, parser):
-        parser.add_argument("--file", type=str, required=True, help="JSON 数据集路径")
-        parser.add_argument("--limit", type=int, default=0, help="最多导入多少条，0 表示全部")
+        parser.add_argument("--file", type=str, required=True, help="JSON 数据集路径（数组或 JSON Lines）")
+        parser.add_argument("--limit", type=int, default=0, help="本次最多导入多少条，0 表示全部")
         parser.add_argument("--username", type=str, default="demo", help="作为卖家的用户名，不存在则自动创建")
         parser.add_argument("--download-timeout", type=int, default=20, help="下载图片超时(秒)")
-        parser.add_argument("--truncate", action="store_true", help="导入前清空该用户名下旧商品")
+        parser.add_argument("--download-workers", type=int, default=16, help="同时下载的图片数")
+        parser.add_argument("--batch-size", type=int, default=500, help="每批写入的商品数")
+        parser.add_argument("--checkpoint", type=str, default="", help="断点文件路径，默认为数据集路径加 .checkpoint")
+        parser.add_argument("--restart", action="store_true", help="忽略已有断点，从头导入")
+        parser.add_argument("--truncate", action="store_true", help="导入前清空该用户名下旧商品（从断点继续时忽略）")
 
     def handle(self, *args, **options):
         file_path: str = options["file"]
         limit: int = options["limit"]
         username: str = options["username"]
-        timeout: int = options["download_timeout"]
-        truncate: bool = options["truncate"]
+        batch_size: int = max(options["batch_size"], 1)
 
         p = Path(file_path)
         if not p.exists():
             raise CommandError(f"文件不存在: {p}")
-
-        data = json.loads(p.read_text(encoding="utf-8"))
-        if not isinstance(data, list):
-            raise CommandError("数据格式错误，应为数组")
+        checkpoint_path = Path(options["checkpoint"] or f"{p}.checkpoint")
+        checkpoint = None if options["restart"] else self._load_checkpoint(checkpoint_path, p)
 
         # 确保分类存在
         needed = [
@@ -119,98 +218,198 @@ class Command(BaseCommand):
         # 确保用户存在
         user, _ = User.objects.get_or_create(username=username, defaults={"password": "demo123456"})
 
-        # 如需清空该用户旧数据
-        if truncate:
-            Product.objects.filter(seller=user).delete()
+        if checkpoint:
+            self.stdout.write(f"从断点继续：已读取 {checkpoint['read']} 条，已创建 {checkpoint['created']} 条")
+        else:
+            checkpoint = {"file": str(p.resolve()), "size": p.stat().st_size, "read": 0, "created": 0, "images": 0}
+            # 如需清空该用户旧数据
+            if options["truncate"]:
+                Product.objects.filter(seller=user).delete()
 
-        created_count = 0
-        total = 0
+        downloader = ImageDownloader(max(options["download_workers"], 1), options["download_timeout"])
+        skip = checkpoint["read"]
+        read = created = images = 0
+        batch: List[Dict[str, Any]] = []
+        started = time.monotonic()
 
-        @transaction.atomic
-        def import_one(item: Dict[str, Any]):
-            nonlocal created_count, total
-            total += 1
+        def flush():
+            nonlocal created, images
+            created_now, images_now = self._import_batch(batch, user, cats, downloader)
+            created += created_now
+            images += images_now
+            checkpoint["read"] = skip + read
+            checkpoint["created"] += created_now
+            checkpoint["images"] += images_now
+            self._save_checkpoint(checkpoint_path, checkpoint)
+            batch.clear()
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"  已读取 {skip + read} 条，本次创建 {created} 条、图片 {images} 张，"
+                f"{read / max(elapsed, 1e-6):.1f} 条/秒"
+            )
 
-            title = (item.get("title") or "").strip()[:200]
-            if not title:
-                return
+        try:
+            for index, item in enumerate(iter_json_items(p)):
+                if index < skip:
+                    continue
+                if limit and created + len(batch) >= limit:
+                    break
+                read += 1
+                if isinstance(item, dict):
+                    batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+            else:
+                if batch:
+                    flush()
+                # 整个文件导入完成，删除断点
+                checkpoint_path.unlink(missing_ok=True)
+                checkpoint_path = None
+            if batch:
+                flush()
+        finally:
+            downloader.close()
 
-            price = item.get("price")
-            try:
-                price = float(price)
-            except Exception:
-                return
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"导入完成：创建 {created} 条/读取 {read} 条，图片 {images} 张，"
+            f"耗时 {elapsed:.1f}s（{read / max(elapsed, 1e-6):.1f} 条/秒）"
+        ))
+        if checkpoint_path is not None:
+            self.stdout.write(f"未读完整个文件，断点已保存到 {checkpoint_path}，重新运行即可继续")
+        if images:
+            self.stdout.write("生成缩略图：python manage.py generate_image_variants")
 
-            city = (item.get("city") or "未知").strip()[:100]
-            keyword = item.get("keyword") or ""
-            raw_cat = item.get("category") or keyword
-            cat_name = self._map_category(str(raw_cat))
-            category = cats.get(cat_name)
-
-            description = (item.get("desc") or item.get("description") or title)[:2000]
-
-            product = Product.objects.create(
-                seller=user,
-                category=category,
-                title=title,
-                description=description,
-                price=price,
-                original_price=None,
-                condition="good",
-                status="active",
-                location=city,
-                contact_phone="",
-                contact_wechat="",
-            )
+    def _parse_item(self, item: Dict[str, Any], user, cats: Dict[str, Category]):
+        """把一条数据转换为未保存的商品和图片URL列表，数据不完整时返回 None"""
+        title = (item.get("title") or "").strip()[:200]
+        if not title:
+            return None
 
-            # 下载主图 + 其余图片
-            all_images = []
-            if item.get("images") and isinstance(item.get("images"), list):
-                all_images = [x for x in item["images"] if isinstance(x, str) and x]
-            elif item.get("image"):
-                all_images = [item.get("image")]  # 退化为单图
+        try:
+            price = float(item.get("price"))
+        except Exception:
+            return None
 
-            downloaded_images = 0
-            for idx_img, img_url in enumerate(all_images[:5]):  # 最多取5张
-                try:
-                    # 添加请求头，模拟浏览器
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Referer': 'https://www.goofish.com/',
-                        'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-                    }
-                    resp = requests.get(img_url, timeout=timeout, headers=headers, allow_redirects=True)
-                    
-                    # 检查响应是否成功且有内容
-                    if resp.ok and resp.content and len(resp.content) > 1000:  # 至少1KB，过滤掉太小的图片
-                        # 检查是否是图片类型
-                        content_type = resp.headers.get('content-type', '').lower()
-                        if 'image' in content_type or img_url.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
-                            base = safe_filename(title[:30] or "product")
-                            fname = f"{base}-{int(time.time()*1000)}-{idx_img}.jpg"
-                            image_file = ContentFile(resp.content, name=fname)
-                            ProductImage.objects.create(product=product, image=image_file, is_primary=(idx_img == 0))
-                            downloaded_images += 1
-                except Exception as e:
-                    continue
+        city = (item.get("city") or "未知").strip()[:100]
+        keyword = item.get("keyword") or ""
+        raw_cat = item.get("category") or keyword
+        category = cats.get(self._map_category(str(raw_cat)))
+
+        description = (item.get("desc") or item.get("description") or title)[:2000]
 
-            # 如果没有成功下载任何图片，删除该商品
-            # if downloaded_images == 0:
-            #     product.delete()
-            #     return
+        product = Product(
+            seller=user,
+            category=category,
+            title=title,
+            description=description,
+            price=price,
+            original_price=None,
+            condition="good",
+            status="active",
+            location=city,
+            contact_phone="",
+            contact_wechat="",
+        )
 
-            created_count += 1
+        # 主图 + 其余图片
+        all_images = []
+        if item.get("images") and isinstance(item.get("images"), list):
+            all_images = [x for x in item["images"] if isinstance(x, str) and x]
+        elif item.get("image"):
+            all_images = [item.get("image")]  # 退化为单图
+        return product, all_images[:MAX_IMAGES]
 
-        # 导入
-        for idx, item in enumerate(data):
-            if limit and created_count >= limit:
-                break
+    def _import_batch(self, items: List[Dict[str, Any]], user, cats: Dict[str, Category], downloader: ImageDownloader):
+        """导入一批数据，返回 (创建的商品数, 图片数)"""
+        parsed = []
+        for item in items:
             try:
-                import_one(item)
+                result = self._parse_item(item, user, cats)
             except Exception:
                 continue
+            if result:
+                parsed.append(result)
+        if not parsed:
+            return 0, 0
+
+        # 先并发下载整批图片，再在一个事务里写入商品和图片
+        all_urls = [url for _, urls in parsed for url in urls]
+        files = downloader.download_all(all_urls)
+        stored = iter(files)
+
+        products = [product for product, _ in parsed]
+        with transaction.atomic():
+            self._bulk_create_products(products, user)
+            blobs = get_blobs(f for f in files if f)
+            unavailable = self._restore_missing(blobs, files, all_urls, downloader)
+            product_images = []
+            for product, urls in parsed:
+                downloaded = [f for f in (next(stored) for _ in urls) if f and f.sha256 not in unavailable]
+                # 图片路径取记录中的文件名：已有记录的扩展名可能与下载地址不同
+                product_images.extend(
+                    ProductImage(product=product, image=blobs[f.sha256].file.name, blob=blobs[f.sha256],
+                                 is_primary=(idx_img == 0))
+                    for idx_img, f in enumerate(downloaded)
+                )
+            ProductImage.objects.bulk_create(product_images)
+            add_references([image.blob_id for image in product_images])
+
+        # bulk_create 不触发信号，手动更新搜索索引、分类计数（图片引用数已在事务内更新）
+        search_index.index_many("product", products)
+        Category.rebuild_product_counters({product.category_id for product in products})
+        return len(products), len(product_images)
+
+    def _restore_missing(self, blobs: Dict[str, ImageBlob], files: List[Optional[StoredFile]], urls: List[str],
+                         downloader: ImageDownloader) -> Set[str]:
+        """
+        记录锁住后确认文件仍在：下载写入到加锁之间 gc_image_blobs 可能删掉了同样内容的旧记录和文件
+        缺失的文件重新下载补写，返回仍无法补写的 sha256（这些图片不写入）
+        """
+        url_of = {}
+        for f, url in zip(files, urls):
+            if f:
+                url_of.setdefault(f.sha256, url)
+        unavailable = set()
+        for sha256, blob in blobs.items():
+            if default_storage.exists(blob.file.name):
+                continue
+            content = downloader.fetch(url_of[sha256])
+            if content is None or not restore_file(blob, content):
+                unavailable.add(sha256)
+        return unavailable
+
+    def _bulk_create_products(self, products: List[Product], user):
+        """批量插入商品并确保每个商品都拿到主键"""
+        last_pk = Product.objects.filter(seller=user).order_by("-pk").values_list("pk", flat=True).first() or 0
+        Product.objects.bulk_create(products)
+        if products[0].pk is not None:
+            return
+        # MySQL 批量插入不返回主键：按主键顺序取回本批插入的商品（导入期间不能有其他途径给该用户写入商品）
+        pks = list(
+            Product.objects.filter(seller=user, pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)
+        )
+        if len(pks) != len(products):
+            raise CommandError("无法确定批量插入的商品ID，请勿在导入期间给该用户发布商品")
+        for product, pk in zip(products, pks):
+            product.pk = pk
+
+    def _load_checkpoint(self, path: Path, data_file: Path) -> Optional[Dict[str, Any]]:
+        if not path.exists():
+            return None
+        try:
+            checkpoint = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            raise CommandError(f"断点文件损坏: {path}，可使用 --restart 从头导入")
+        if checkpoint.get("file") != str(data_file.resolve()) or checkpoint.get("size") != data_file.stat().st_size:
+            raise CommandError(f"断点文件 {path} 与数据集不一致，可使用 --restart 从头导入")
+        return checkpoint
 
-        self.stdout.write(self.style.SUCCESS(f"导入完成：创建 {created_count} 条/读取 {total} 条"))
+    def _save_checkpoint(self, path: Path, checkpoint: Dict[str, Any]):
+        # 先写临时文件再替换，避免中断时留下写了一半的断点
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(checkpoint, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
 
     def _map_category(self, raw: str) -> str:
         """根据商品标题和分类名称智能映射分类"""
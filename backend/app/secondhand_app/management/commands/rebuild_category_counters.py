@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from app.secondhand_app.models import Category
+
+
+class Command(BaseCommand):
+    help = "按商品表重算分类的在售商品计数"
+
+    def handle(self, *args, **options):
+        updated = Category.rebuild_product_counters()
+        self.stdout.write(self.style.SUCCESS(f'✓ 已重算 {updated} 个分类的商品计数'))
+        for category in Category.objects.order_by('-active_product_count', 'name'):
+            self.stdout.write(
+                f'  {category.name}: 在售 {category.active_product_count}，验货 {category.active_verified_product_count}'
+            )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from app.secondhand_app.models import Product, VerifiedProduct
+from app.secondhand_app.search_service import search_index
+
+
+class Command(BaseCommand):
+    help = "重建商品全文搜索索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=['product', 'verified_product', 'all'],
+            default='all',
+            help='要重建的索引类型（默认全部）',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='每批读取的商品数量',
+        )
+
+    def handle(self, *args, **options):
+        targets = {
+            'product': Product.objects.all(),
+            'verified_product': VerifiedProduct.objects.all(),
+        }
+        kind = options['kind']
+        kinds = list(targets) if kind == 'all' else [kind]
+
+        for name in kinds:
+            start = time.time()
+            count = search_index.rebuild(name, targets[name], chunk_size=options['chunk_size'])
+            self.stdout.write(
+                self.style.SUCCESS(f'✓ {name} 索引重建完成：{count} 个上架商品，耗时 {time.time() - start:.1f}s')
+            )
@@ -1,12 +1,17 @@
 """
 更新价格数据库的管理命令
-用于定期更新设备价格数据
+用于定期更新设备价格数据；每次导入都会保存为一个新版本，各服务进程自动切换，无需重启
 """
 from django.core.management.base import BaseCommand
+from app.secondhand_app.models import PriceDataVersion
+from app.secondhand_app.price_data import price_data_store, thaw
 from app.secondhand_app.price_model import price_model
+from app.secondhand_app.price_table import local_price_table
 import json
 import os
 
+KIND = 'price_database'
+
 
 class Command(BaseCommand):
     help = "更新价格数据库"
@@ -15,7 +20,18 @@ class Command(BaseCommand):
         parser.add_argument(
             '--file',
             type=str,
-            help='从JSON文件导入价格数据',
+            help='从JSON文件导入价格数据（发布为新版本）',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='与 --file 一起使用：用文件内容整体替换价格表，默认与当前价格表按品牌合并',
+        )
+        parser.add_argument(
+            '--note',
+            type=str,
+            default='',
+            help='版本说明',
         )
         parser.add_argument(
             '--export',
@@ -27,48 +43,98 @@ class Command(BaseCommand):
             action='store_true',
             help='列出所有支持的品牌和型号',
         )
+        parser.add_argument(
+            '--list-versions',
+            action='store_true',
+            help='列出价格表的所有版本',
+        )
+        parser.add_argument(
+            '--rollback',
+            nargs='?',
+            const=-1,
+            type=int,
+            metavar='VERSION',
+            help='回滚到指定版本；不指定版本时回滚到上一个版本，0 表示内置价格表',
+        )
 
     def handle(self, *args, **options):
         if options['export']:
             self.export_prices(options['export'])
         elif options['file']:
-            self.import_prices(options['file'])
+            self.import_prices(options['file'], options['replace'], options['note'])
+        elif options['rollback'] is not None:
+            self.rollback(options['rollback'])
+        elif options['list_versions']:
+            self.list_versions()
         elif options['list']:
             self.list_prices()
         else:
-            self.stdout.write(self.style.WARNING('请指定操作：--export, --file, 或 --list'))
+            self.stdout.write(self.style.WARNING('请指定操作：--export, --file, --rollback, --list-versions 或 --list'))
 
     def export_prices(self, filename):
         """导出价格数据到JSON文件"""
-        data = price_model.price_database
-        
+        data = thaw(price_model.price_database)
+
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        self.stdout.write(self.style.SUCCESS(f'✓ 价格数据已导出到: {filename}'))
 
-    def import_prices(self, filename):
+        self.stdout.write(self.style.SUCCESS(f'✓ 价格数据（版本 {price_model.data_version}）已导出到: {filename}'))
+
+    def import_prices(self, filename, replace=False, note=''):
         """从JSON文件导入价格数据"""
         if not os.path.exists(filename):
             self.stdout.write(self.style.ERROR(f'文件不存在: {filename}'))
             return
-        
+
         with open(filename, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        
-        # 更新价格数据库
-        price_model.price_database.update(data)
-        
-        self.stdout.write(self.style.SUCCESS(f'✓ 价格数据已从 {filename} 导入'))
-        self.stdout.write(self.style.WARNING('注意：需要重启服务才能生效'))
+
+        if not isinstance(data, dict) or not all(isinstance(models, dict) for models in data.values()):
+            self.stdout.write(self.style.ERROR('文件格式错误，应为 {品牌: {型号: {存储: 价格}}}'))
+            return
+
+        if not replace:
+            merged = thaw(price_model.price_database)
+            for brand, models in data.items():
+                merged.setdefault(brand, {}).update(models)
+            data = merged
+
+        record = price_data_store.publish(KIND, data, note=note or f'导入 {os.path.basename(filename)}')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 价格数据已从 {filename} 导入，发布为版本 {record.version}'))
+
+    def rollback(self, version):
+        """回滚到指定版本或上一个版本"""
+        if version == -1:
+            version = price_data_store.previous_version(KIND)
+        try:
+            price_data_store.activate(KIND, version)
+        except PriceDataVersion.DoesNotExist as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+        label = f'版本 {version}' if version else '内置价格表'
+        self.stdout.write(self.style.SUCCESS(f'✓ 价格表已回滚到{label}'))
+
+    def list_versions(self):
+        """列出价格表的所有版本"""
+        versions = price_data_store.versions(KIND)
+        if not versions:
+            self.stdout.write('尚未发布过价格表版本，正在使用内置价格表')
+            return
+        for item in versions:
+            flag = ' *' if item['is_active'] else '  '
+            created_at = item['created_at'].strftime('%Y-%m-%d %H:%M')
+            self.stdout.write(f"{flag} v{item['version']:<4} {created_at}  {item['note']}")
 
     def list_prices(self):
         """列出所有支持的品牌和型号"""
-        self.stdout.write(self.style.SUCCESS('\n支持的品牌和型号：\n'))
-        
+        self.stdout.write(self.style.SUCCESS(f'\n支持的品牌和型号（版本 {price_model.data_version}）：\n'))
+
         for brand, models in price_model.price_database.items():
             self.stdout.write(f'\n【{brand}】')
             for model, storages in models.items():
                 storage_list = ', '.join(storages.keys())
                 self.stdout.write(f'  - {model}: {storage_list}')
 
+        stats = local_price_table.stats()
+        self.stdout.write(f'\n本地估价表：{stats.entries} 项，约 {stats.bytes / 1024:.0f} KB')
@@ -0,0 +1,64 @@
+"""
+估价缓存预热的管理命令
+按最近的估价请求和回收订单找出热门机型，在估价缓存过期前重新估价，避免用户请求承担外部数据源的延迟
+建议用 cron 每 10 分钟运行一次（--ahead 需大于运行间隔），例如：
+*/10 * * * * cd /path/to/backend && python manage.py warm_price_cache
+需要配置共享缓存（CACHE_REDIS_URL）：进程内缓存下命令看不到 web 进程的估价请求，预热结果也随命令退出丢弃，直接报错退出
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.secondhand_app.price_cache import cache_is_shared
+from app.secondhand_app.price_popularity import popular_estimates
+from app.secondhand_app.price_service import price_service
+
+
+class Command(BaseCommand):
+    help = "在估价缓存过期前刷新热门机型的估价（建议 cron 每 10 分钟运行）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=200, help='最多预热的估价参数组数')
+        parser.add_argument('--ahead', type=int, default=900, help='缓存在多少秒内过期就刷新')
+        parser.add_argument('--concurrency', type=int, default=4, help='同时进行的估价数')
+        parser.add_argument('--hours', type=int, default=24, help='统计最近多少小时的估价请求')
+        parser.add_argument('--days', type=int, default=30, help='统计最近多少天的回收订单（0 表示不统计）')
+        parser.add_argument('--order-weight', type=float, default=5, help='一个回收订单相当于多少次估价请求')
+        parser.add_argument('--time-budget', type=float, default=300, help='最长运行时间（秒），超时后不再开始新的估价')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError('默认缓存是进程内缓存，预热结果无法被 web 进程使用，请先设置 CACHE_REDIS_URL')
+        started = time.monotonic()
+        deadline = started + options['time_budget']
+        keys = popular_estimates(options['limit'], options['hours'], options['days'], options['order_weight'])
+        self.stdout.write(f'热门估价参数 {len(keys)} 组，并发 {options["concurrency"]}')
+
+        def warm(key):
+            # 超出时间预算后排队中的任务直接跳过
+            if time.monotonic() > deadline:
+                return None
+            return price_service.warm(*key, ahead=options['ahead'])
+
+        refreshed = fresh = skipped = failed = 0
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            futures = {executor.submit(warm, key): key for key, _ in keys}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'  预热失败 {futures[future]}: {e}')
+                    continue
+                if result is None:
+                    skipped += 1
+                elif result:
+                    refreshed += 1
+                else:
+                    fresh += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 预热完成：刷新 {refreshed}，未到期 {fresh}，超时跳过 {skipped}，失败 {failed}，耗时 {elapsed:.1f}s'
+        ))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    """按现有商品数据初始化分类计数"""
+    Category = apps.get_model('secondhand_app', 'Category')
+    Product = apps.get_model('secondhand_app', 'Product')
+    VerifiedProduct = apps.get_model('secondhand_app', 'VerifiedProduct')
+
+    def active_counts(model):
+        rows = model.objects.filter(status='active', category__isnull=False).values('category').annotate(total=Count('id'))
+        return {row['category']: row['total'] for row in rows}
+
+    products = active_counts(Product)
+    verified = active_counts(VerifiedProduct)
+    for category in Category.objects.all():
+        category.active_product_count = products.get(category.pk, 0)
+        category.active_verified_product_count = verified.get(category.pk, 0)
+        category.save(update_fields=['active_product_count', 'active_verified_product_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0014_order_settlement_method_order_transfer_order_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_product_count',
+            field=models.IntegerField(default=0, verbose_name='在售商品数'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='active_verified_product_count',
+            field=models.IntegerField(default=0, verbose_name='在售验货商品数'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
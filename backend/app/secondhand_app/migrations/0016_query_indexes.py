@@ -0,0 +1,95 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0015_category_active_product_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', '-created_at'], name='message_pair_created'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', '-created_at'], name='message_receiver_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', '-created_at'], name='order_buyer_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['settlement_status'], name='order_settlement_status'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='order_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'category', '-created_at'], name='product_status_cat_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-created_at'], name='product_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', '-created_at'], name='product_seller_created'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at'], name='product_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recycleorder',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='recycle_user_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recycleorder',
+            index=models.Index(fields=['user', '-created_at'], name='recycle_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recycleorder',
+            index=models.Index(fields=['status', '-created_at'], name='recycle_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recycleorder',
+            index=models.Index(fields=['-created_at'], name='recycle_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedorder',
+            index=models.Index(fields=['buyer', '-created_at'], name='vorder_buyer_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedorder',
+            index=models.Index(fields=['-created_at'], name='vorder_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedproduct',
+            index=models.Index(fields=['status', 'category', '-created_at'], name='vproduct_status_cat_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedproduct',
+            index=models.Index(fields=['status', '-created_at'], name='vproduct_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedproduct',
+            index=models.Index(fields=['seller', '-created_at'], name='vproduct_seller_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedproduct',
+            index=models.Index(fields=['-created_at'], name='vproduct_created'),
+        ),
+    ]
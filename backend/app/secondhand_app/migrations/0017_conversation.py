@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    """按已有消息生成会话摘要"""
+    Message = apps.get_model('secondhand_app', 'Message')
+    Conversation = apps.get_model('secondhand_app', 'Conversation')
+
+    summaries = {}
+    for message in Message.objects.order_by('id').iterator(chunk_size=2000):
+        a, b = sorted((message.sender_id, message.receiver_id))
+        summary = summaries.setdefault((a, b), {'unread_a': 0, 'unread_b': 0})
+        summary['last'] = message
+        if not message.is_read and message.sender_id != message.receiver_id:
+            summary['unread_a' if message.receiver_id == a else 'unread_b'] += 1
+
+    Conversation.objects.bulk_create([
+        Conversation(
+            user_a_id=a,
+            user_b_id=b,
+            last_message_id=summary['last'].id,
+            last_message_preview=summary['last'].content[:100],
+            last_message_at=summary['last'].created_at,
+            unread_count_a=summary['unread_a'],
+            unread_count_b=summary['unread_b'],
+        )
+        for (a, b), summary in summaries.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0016_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_preview', models.CharField(blank=True, max_length=100, verbose_name='最后消息预览')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True, verbose_name='最后活跃时间')),
+                ('unread_count_a', models.IntegerField(default=0, verbose_name='用户A未读数')),
+                ('unread_count_b', models.IntegerField(default=0, verbose_name='用户B未读数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='secondhand_app.message', verbose_name='最后一条消息')),
+                ('user_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_a', to=settings.AUTH_USER_MODEL, verbose_name='用户A')),
+                ('user_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_b', to=settings.AUTH_USER_MODEL, verbose_name='用户B')),
+            ],
+            options={
+                'verbose_name': '会话',
+                'verbose_name_plural': '会话',
+                'ordering': ['-last_message_at'],
+                'indexes': [models.Index(fields=['user_a', '-last_message_at'], name='conversation_a_activity'), models.Index(fields=['user_b', '-last_message_at'], name='conversation_b_activity')],
+                'unique_together': {('user_a', 'user_b')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0017_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceDataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('price_database', '机型价格表')], default='price_database', max_length=30, verbose_name='数据类型')),
+                ('version', models.PositiveIntegerField(verbose_name='版本号')),
+                ('data', models.JSONField(verbose_name='数据')),
+                ('is_active', models.BooleanField(default=False, verbose_name='是否生效')),
+                ('note', models.CharField(blank=True, default='', max_length=200, verbose_name='说明')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '估价数据版本',
+                'verbose_name_plural': '估价数据版本',
+                'ordering': ['kind', '-version'],
+                'unique_together': {('kind', 'version')},
+            },
+        ),
+    ]
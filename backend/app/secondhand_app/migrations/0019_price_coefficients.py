@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0018_price_data_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pricedataversion',
+            name='kind',
+            field=models.CharField(choices=[('price_database', '机型价格表'), ('coefficients', '估价校准系数')], default='price_database', max_length=30, verbose_name='数据类型'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0019_price_coefficients'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(upload_to='blobs/', verbose_name='文件')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='文件大小')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='引用数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '图片文件',
+                'verbose_name_plural': '图片文件',
+                'indexes': [models.Index(fields=['ref_count', 'created_at'], name='imageblob_ref_created')],
+            },
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='product_images', to='secondhand_app.imageblob', verbose_name='图片文件'),
+        ),
+        migrations.AddField(
+            model_name='verifiedproductimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='verified_product_images', to='secondhand_app.imageblob', verbose_name='图片文件'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0020_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, verbose_name='图片尺寸'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('secondhand_app', '0021_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-view_count'], name='product_status_views'),
+        ),
+        migrations.AddIndex(
+            model_name='verifiedproduct',
+            index=models.Index(fields=['status', '-view_count'], name='vproduct_status_views'),
+        ),
+    ]
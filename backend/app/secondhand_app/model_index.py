@@ -0,0 +1,195 @@
+"""
+设备型号名称索引
+把价格表中的 {品牌: {型号: ...}} 在加载时编译成归一化的别名表和三元组（trigram）索引，
+用于把用户输入的自由文本（"iphone15 pro max"、"苹果 15PM"、"xiaomi 14"、"三星S24U"）解析到价格表中的标准型号
+- 归一化：全角转半角、小写、去掉空格和标点，"+" 记为 plus
+- 品牌别名：中文名、英文名、拼音（已安装 pypinyin 时为任意中文名自动生成）
+- 型号别名：去掉品牌词后的核心型号（"Galaxy S24" -> "s24"）以及常见缩写（Pro Max -> pm）
+- 精确命中别名表时置信度为 1；否则用三元组 Dice 系数模糊匹配，数字不一致的候选会被降权
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时只使用内置的品牌拼音
+    lazy_pinyin = None
+
+# 内置品牌别名（英文名、拼音、常见写法）
+BRAND_ALIASES = {
+    '苹果': ['apple', 'pingguo', 'iphone'],
+    '华为': ['huawei', 'hw'],
+    '小米': ['xiaomi', 'mi'],
+    '红米': ['redmi', 'hongmi'],
+    'OPPO': ['oppo'],
+    'vivo': ['vivo'],
+    '荣耀': ['honor', 'rongyao'],
+    '三星': ['samsung', 'sanxing', 'galaxy'],
+    '一加': ['oneplus', 'yijia'],
+    'realme': ['realme', '真我'],
+    '联想': ['lenovo', 'lianxiang'],
+}
+
+# 型号后缀缩写：归一化后的全称 -> 缩写
+SUFFIX_ABBREVIATIONS = {
+    'promax': ['pm'],
+    'ultra': ['u'],
+    'plus': ['p'],
+}
+
+MIN_CONFIDENCE = 0.6  # 低于该置信度的模糊匹配视为未命中
+
+_STRIP_RE = re.compile(r'[\s\-_·.,，。()（）/]+')
+_DIGITS_RE = re.compile(r'\d+')
+
+
+class ModelMatch(NamedTuple):
+    brand: str
+    model: str
+    confidence: float
+
+
+def normalize(text: str) -> str:
+    """全角转半角、小写、去空格和标点"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).lower().replace('+', 'plus')
+    return _STRIP_RE.sub('', text)
+
+
+def _pinyin(text: str) -> Optional[str]:
+    if lazy_pinyin is None or not re.search(r'[一-鿿]', text):
+        return None
+    return normalize(''.join(lazy_pinyin(text)))
+
+
+def _trigrams(key: str) -> set:
+    padded = f'^{key}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ModelNameIndex:
+    """由价格表构建的只读型号索引，构建后不再修改，可在多线程间共享"""
+
+    def __init__(self, table: Mapping[str, Mapping[str, object]]):
+        self.brands: Dict[str, str] = {}  # 品牌别名 -> 标准品牌
+        self._brand_words: Dict[str, List[str]] = {}  # 标准品牌 -> 别名（长的在前，剥离时优先匹配）
+        self._exact: Dict[str, Dict[str, str]] = defaultdict(dict)  # 品牌 -> {核心型号别名: 标准型号}
+        self._any_brand: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        self._grams: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        self._gram_sets: Dict[Tuple[str, str], set] = {}
+        self._build(table)
+
+    # ---- 构建 ----
+
+    def _build(self, table):
+        for brand in table:
+            words = {normalize(brand)}
+            words.update(normalize(alias) for alias in BRAND_ALIASES.get(brand, []))
+            pinyin = _pinyin(brand)
+            if pinyin:
+                words.add(pinyin)
+            words.discard('')
+            for word in words:
+                self.brands.setdefault(word, brand)
+            self._brand_words[brand] = sorted(words, key=len, reverse=True)
+        self._brand_search = sorted(self.brands, key=len, reverse=True)
+
+        for brand, models in table.items():
+            for model in models:
+                for key in self._model_keys(brand, model):
+                    self._exact[brand].setdefault(key, model)
+                    self._any_brand[key].append((brand, model))
+                core = self._core(brand, normalize(model))
+                if (brand, core) not in self._gram_sets:
+                    grams = _trigrams(core)
+                    self._gram_sets[(brand, core)] = grams
+                    for gram in grams:
+                        self._grams[brand][gram].append(core)
+                    self._exact[brand].setdefault(core, model)
+
+    def _model_keys(self, brand, model):
+        full = normalize(model)
+        keys = {full, self._core(brand, full)}
+        pinyin = _pinyin(model)
+        if pinyin:
+            keys.update({pinyin, self._core(brand, pinyin)})
+        for key in list(keys):
+            for suffix, abbreviations in SUFFIX_ABBREVIATIONS.items():
+                if key.endswith(suffix):
+                    keys.update(key[:-len(suffix)] + abbr for abbr in abbreviations)
+        keys.discard('')
+        return keys
+
+    def _core(self, brand, key):
+        """去掉型号中的品牌词（"galaxys24" -> "s24"，"小米14" -> "14"），只去一次"""
+        for word in self._brand_words.get(brand, ()):
+            if key.startswith(word) and len(key) > len(word):
+                return key[len(word):]
+        return key
+
+    # ---- 查询 ----
+
+    def resolve_brand(self, text: str) -> Optional[str]:
+        key = normalize(text)
+        if key in self.brands:
+            return self.brands[key]
+        # 自由文本中包含品牌词（"苹果iphone15"），取最长的品牌词
+        for word in self._brand_search:
+            # 过短的英文别名（mi、hw）只做精确匹配，避免误命中 "mini" 之类的词
+            if (len(word) >= 3 or not word.isascii()) and word in key:
+                return self.brands[word]
+        return None
+
+    def resolve(self, brand: str, model: str) -> Optional[ModelMatch]:
+        """
+        把 (品牌, 型号) 解析为价格表中的标准品牌和型号
+        品牌可以为空或是别名；型号可以带品牌前缀、不同大小写和空格
+        """
+        key = normalize(model)
+        if not key:
+            return None
+        canonical_brand = self.resolve_brand(brand) if brand else None
+        if canonical_brand is None:
+            canonical_brand = self.resolve_brand(model)
+
+        if canonical_brand is not None:
+            exact = self._exact.get(canonical_brand, {})
+            for candidate in (key, self._core(canonical_brand, key)):
+                if candidate in exact:
+                    return ModelMatch(canonical_brand, exact[candidate], 1.0)
+            return self._fuzzy(canonical_brand, self._core(canonical_brand, key))
+
+        # 品牌未知：别名唯一对应一个型号时直接命中，否则在所有品牌中模糊匹配
+        hits = self._any_brand.get(key, [])
+        if len(hits) == 1:
+            return ModelMatch(hits[0][0], hits[0][1], 1.0)
+        best = None
+        for candidate_brand in self._exact:
+            match = self._fuzzy(candidate_brand, self._core(candidate_brand, key))
+            if match and (best is None or match.confidence > best.confidence):
+                best = match
+        return best
+
+    def _fuzzy(self, brand, key) -> Optional[ModelMatch]:
+        grams = _trigrams(key)
+        overlap = defaultdict(int)
+        brand_grams = self._grams.get(brand, {})
+        for gram in grams:
+            for core in brand_grams.get(gram, ()):
+                overlap[core] += 1
+        best_core, best_score = None, 0.0
+        digits = _DIGITS_RE.findall(key)
+        for core, shared in overlap.items():
+            score = 2 * shared / (len(grams) + len(self._gram_sets[(brand, core)]))
+            core_digits = _DIGITS_RE.findall(core)
+            if digits and core_digits and core_digits != digits:
+                score *= 0.5  # 代数/型号数字不同（14 与 15）基本不是同一款设备
+            if score > best_score or (score == best_score and best_core and len(core) < len(best_core)):
+                best_core, best_score = core, score
+        if best_core is None or best_score < MIN_CONFIDENCE:
+            return None
+        return ModelMatch(brand, self._exact[brand][best_core], round(best_score, 3))
+
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -8,6 +8,9 @@ class Category(models.Model):
     name = models.CharField(max_length=50, verbose_name='分类名称')
     description = models.TextField(blank=True, verbose_name='分类描述')
     type = models.CharField(max_length=20, default='digital', verbose_name='分类类型')
+    # 冗余计数：由商品保存/删除信号增量维护，rebuild_category_counters 命令可全量重算
+    active_product_count = models.IntegerField(default=0, verbose_name='在售商品数')
+    active_verified_product_count = models.IntegerField(default=0, verbose_name='在售验货商品数')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
 
     class Meta:
@@ -18,6 +21,26 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def rebuild_product_counters(cls, category_ids=None):
+        """按商品表重新计算在售商品计数（category_ids 为空时重算全部分类）"""
+        from django.db.models import Count, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+
+        def active_count(model):
+            subquery = model.objects.filter(
+                category=OuterRef('pk'), status='active'
+            ).order_by().values('category').annotate(total=Count('pk')).values('total')
+            return Coalesce(Subquery(subquery), 0)
+
+        queryset = cls.objects.all()
+        if category_ids is not None:
+            queryset = queryset.filter(pk__in=[pk for pk in category_ids if pk])
+        return queryset.update(
+            active_product_count=active_count(Product),
+            active_verified_product_count=active_count(VerifiedProduct),
+        )
+
 
 class Shop(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shops', verbose_name='店主')
@@ -75,15 +98,68 @@ class Product(models.Model):
         verbose_name = '商品'
         verbose_name_plural = '商品'
         ordering = ['-created_at']
+        indexes = [
+            # 首页/分类列表：status=active [+ category] 按时间倒序
+            models.Index(fields=['status', 'category', '-created_at'], name='product_status_cat_created'),
+            models.Index(fields=['status', '-created_at'], name='product_status_created'),
+            models.Index(fields=['status', '-view_count'], name='product_status_views'),
+            # 我发布的商品
+            models.Index(fields=['seller', '-created_at'], name='product_seller_created'),
+            # 后台商品列表
+            models.Index(fields=['-created_at'], name='product_created'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class ImageBlob(models.Model):
+    """
+    按内容哈希存储的图片文件，内容相同的图片只存一份，由多条商品图片记录共享
+    ref_count 由信号维护（批量写入时手动增加），引用数为 0 的文件由 gc_image_blobs 命令清理
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    file = models.FileField(upload_to='blobs/', verbose_name='文件')
+    size = models.PositiveIntegerField(default=0, verbose_name='文件大小')
+    ref_count = models.IntegerField(default=0, verbose_name='引用数')
+    # 缩略图等尺寸：{"thumb.webp": 文件路径, ...}，由 image_variants 在后台生成
+    variants = models.JSONField(default=dict, blank=True, verbose_name='图片尺寸')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '图片文件'
+        verbose_name_plural = '图片文件'
+        indexes = [
+            models.Index(fields=['ref_count', 'created_at'], name='imageblob_ref_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]}（引用 {self.ref_count}）"
+
+    @classmethod
+    def rebuild_ref_counts(cls, blob_ids=None):
+        """按商品图片表重新计算引用数（blob_ids 为空时重算全部）"""
+        from django.db.models import Count, OuterRef, Subquery, Value
+        from django.db.models.functions import Coalesce
+
+        def refs(model):
+            subquery = model.objects.filter(
+                blob=OuterRef('pk')
+            ).order_by().values('blob').annotate(total=Count('pk')).values('total')
+            return Coalesce(Subquery(subquery), Value(0))
+
+        queryset = cls.objects.all()
+        if blob_ids is not None:
+            queryset = queryset.filter(pk__in=blob_ids)
+        return queryset.update(ref_count=refs(ProductImage) + refs(VerifiedProductImage))
+
+
 class ProductImage(models.Model):
     """商品图片"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images', verbose_name='商品')
     image = models.ImageField(upload_to='products/', verbose_name='图片')
+    blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name='product_images', verbose_name='图片文件')
     is_primary = models.BooleanField(default=False, verbose_name='主图')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='上传时间')
 
@@ -134,6 +210,12 @@ class Order(models.Model):
         verbose_name = '订单'
         verbose_name_plural = '订单'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['buyer', '-created_at'], name='order_buyer_created'),
+            models.Index(fields=['settlement_status'], name='order_settlement_status'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created'),
+            models.Index(fields=['-created_at'], name='order_created'),
+        ]
 
     def __str__(self):
         return f"订单 #{self.id} - {self.product.title}"
@@ -152,11 +234,107 @@ class Message(models.Model):
         verbose_name = '消息'
         verbose_name_plural = '消息'
         ordering = ['-created_at']
+        indexes = [
+            # 两人之间的聊天记录（双向查询各走一次索引）
+            models.Index(fields=['sender', 'receiver', '-created_at'], name='message_pair_created'),
+            # 收件箱
+            models.Index(fields=['receiver', '-created_at'], name='message_receiver_created'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} -> {self.receiver.username}"
 
 
+class Conversation(models.Model):
+    """
+    会话摘要：每对用户一行，记录最后一条消息和双方未读数
+    user_a 固定为ID较小的一方，user_b 为较大的一方，保证同一对用户只有一行
+    """
+    PREVIEW_LENGTH = 100
+
+    user_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_a', verbose_name='用户A')
+    user_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_b', verbose_name='用户B')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='最后一条消息')
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, verbose_name='最后消息预览')
+    last_message_at = models.DateTimeField(null=True, blank=True, verbose_name='最后活跃时间')
+    unread_count_a = models.IntegerField(default=0, verbose_name='用户A未读数')
+    unread_count_b = models.IntegerField(default=0, verbose_name='用户B未读数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '会话'
+        verbose_name_plural = '会话'
+        unique_together = ['user_a', 'user_b']
+        ordering = ['-last_message_at']
+        indexes = [
+            models.Index(fields=['user_a', '-last_message_at'], name='conversation_a_activity'),
+            models.Index(fields=['user_b', '-last_message_at'], name='conversation_b_activity'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_a_id} <-> {self.user_b_id}"
+
+    @staticmethod
+    def participants(user_id, other_id):
+        """返回 (user_a_id, user_b_id)"""
+        return (user_id, other_id) if user_id <= other_id else (other_id, user_id)
+
+    def side_of(self, user_id):
+        return 'a' if user_id == self.user_a_id else 'b'
+
+    def partner_of(self, user_id):
+        return self.user_b if user_id == self.user_a_id else self.user_a
+
+    def unread_count_for(self, user_id):
+        return self.unread_count_a if self.side_of(user_id) == 'a' else self.unread_count_b
+
+    @classmethod
+    def record_message(cls, message):
+        """
+        新消息写入后更新会话摘要（加行锁，与消息写入处于同一事务）
+        接收方未读数 +1；只有比当前最后一条更新的消息才会替换预览
+        """
+        user_a_id, user_b_id = cls.participants(message.sender_id, message.receiver_id)
+        with transaction.atomic():
+            conversation, _ = cls.objects.select_for_update().get_or_create(
+                user_a_id=user_a_id, user_b_id=user_b_id
+            )
+            if conversation.last_message_id is None or message.pk > conversation.last_message_id:
+                conversation.last_message = message
+                conversation.last_message_preview = message.content[:cls.PREVIEW_LENGTH]
+                conversation.last_message_at = message.created_at
+            if message.sender_id != message.receiver_id:
+                if conversation.side_of(message.receiver_id) == 'a':
+                    conversation.unread_count_a += 1
+                else:
+                    conversation.unread_count_b += 1
+            conversation.save()
+        return conversation
+
+    @classmethod
+    def mark_read(cls, reader_id, partner_id, up_to_id):
+        """
+        把 partner 发给 reader、ID 不超过 up_to_id 的消息一次性标记为已读（单条 UPDATE），
+        并按剩余未读消息重算 reader 一侧的未读数
+        返回本次标记的消息数
+        """
+        unread = Message.objects.filter(sender_id=partner_id, receiver_id=reader_id, is_read=False)
+        with transaction.atomic():
+            updated = unread.filter(id__lte=up_to_id).update(is_read=True)
+            cls.refresh_unread(reader_id, partner_id)
+        return updated
+
+    @classmethod
+    def refresh_unread(cls, reader_id, partner_id):
+        """按消息表重算 reader 一侧的未读数（单条消息改为已读/未读或被删除后调用）"""
+        user_a_id, user_b_id = cls.participants(reader_id, partner_id)
+        unread = Message.objects.filter(sender_id=partner_id, receiver_id=reader_id, is_read=False)
+        if reader_id == partner_id:
+            unread = unread.none()  # 发给自己的消息不计未读
+        field = 'unread_count_a' if reader_id == user_a_id else 'unread_count_b'
+        cls.objects.filter(user_a_id=user_a_id, user_b_id=user_b_id).update(**{field: unread.count()})
+
+
 class Favorite(models.Model):
     """收藏"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites', verbose_name='用户')
@@ -356,6 +534,13 @@ class RecycleOrder(models.Model):
         verbose_name = '回收订单'
         verbose_name_plural = '回收订单'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status', '-created_at'], name='recycle_user_status_created'),
+            models.Index(fields=['user', '-created_at'], name='recycle_user_created'),
+            # 后台回收订单列表按状态筛选
+            models.Index(fields=['status', '-created_at'], name='recycle_status_created'),
+            models.Index(fields=['-created_at'], name='recycle_created'),
+        ]
 
     def __str__(self):
         return f"回收订单 #{self.id} - {self.brand} {self.model}"
@@ -408,6 +593,13 @@ class VerifiedProduct(models.Model):
         verbose_name = '官方验货商品'
         verbose_name_plural = '官方验货商品'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'category', '-created_at'], name='vproduct_status_cat_created'),
+            models.Index(fields=['status', '-created_at'], name='vproduct_status_created'),
+            models.Index(fields=['status', '-view_count'], name='vproduct_status_views'),
+            models.Index(fields=['seller', '-created_at'], name='vproduct_seller_created'),
+            models.Index(fields=['-created_at'], name='vproduct_created'),
+        ]
 
     def __str__(self):
         return self.title
@@ -417,6 +609,8 @@ class VerifiedProductImage(models.Model):
     """官方验货商品图片"""
     product = models.ForeignKey(VerifiedProduct, on_delete=models.CASCADE, related_name='images', verbose_name='商品')
     image = models.ImageField(upload_to='verified_products/', verbose_name='图片')
+    blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name='verified_product_images', verbose_name='图片文件')
     is_primary = models.BooleanField(default=False, verbose_name='主图')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='上传时间')
 
@@ -458,6 +652,10 @@ class VerifiedOrder(models.Model):
         verbose_name = '官方验货订单'
         verbose_name_plural = '官方验货订单'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['buyer', '-created_at'], name='vorder_buyer_created'),
+            models.Index(fields=['-created_at'], name='vorder_created'),
+        ]
 
     def __str__(self):
         return f"验货订单 #{self.id} - {self.product.title}"
@@ -477,3 +675,27 @@ class VerifiedFavorite(models.Model):
 
     def __str__(self):
         return f"{self.user.username} 收藏了 {self.product.title}"
+
+
+class PriceDataVersion(models.Model):
+    """估价数据版本（价格表等），发布后不再修改，通过切换生效版本实现更新和回滚"""
+    KIND_CHOICES = (
+        ('price_database', '机型价格表'),
+        ('coefficients', '估价校准系数'),
+    )
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, default='price_database', verbose_name='数据类型')
+    version = models.PositiveIntegerField(verbose_name='版本号')
+    data = models.JSONField(verbose_name='数据')
+    is_active = models.BooleanField(default=False, verbose_name='是否生效')
+    note = models.CharField(max_length=200, blank=True, default='', verbose_name='说明')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '估价数据版本'
+        verbose_name_plural = '估价数据版本'
+        unique_together = ['kind', 'version']
+        ordering = ['kind', '-version']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} v{self.version}{'（生效中）' if self.is_active else ''}"
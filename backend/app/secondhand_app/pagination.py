@@ -1,4 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -13,12 +22,158 @@ class CustomPageNumberPagination(PageNumberPagination):
     max_page_size = 100  # 每页最大数量限制
 
 
+class KeysetPagination(BasePagination):
+    """
+    游标（keyset）分页，供无限滚动列表使用
+    按 (排序字段, id) 定位下一页：WHERE (field, id) < (上一页末条的值)，
+    不执行 COUNT(*)，也不使用 OFFSET，翻到多深的位置每页耗时都相同
+    排序字段取自 ?ordering=，必须在视图的 ordering_fields 中，否则使用视图默认排序
+    注意：游标分页总是按 (排序字段, id) 排序，搜索请求使用游标分页时不再按相关度排序
+    previous 游标从本页第一条向前取一页（反向查询后再倒回原顺序）
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    default_ordering = '-created_at'
+    invalid_cursor_message = '无效的分页游标'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        """返回 (字段名, 是否倒序)"""
+        allowed = set(getattr(view, 'ordering_fields', None) or []) | {'created_at'}
+        default = (getattr(view, 'ordering', None) or [self.default_ordering])[0]
+        for value in (request.query_params.get(self.ordering_param), default):
+            if value and value.lstrip('-') in allowed:
+                return value.lstrip('-'), value.startswith('-')
+        return 'created_at', True
+
+    def encode_cursor(self, field, descending, value, pk, reverse=False):
+        payload = {'o': ('-' if descending else '') + field, 'v': value, 'id': pk}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor, model, field, descending):
+        """返回 (排序字段的值, id, 是否向前翻页)"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw.decode('utf-8'))
+            if payload['o'] != ('-' if descending else '') + field:
+                raise ValueError('ordering mismatch')
+            value = model._meta.get_field(field).to_python(payload['v'])
+            return value, int(payload['id']), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, FieldDoesNotExist, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        field, descending = self.get_ordering(request, view)
+        return self.paginate_union([queryset], request, field, descending)
+
+    def paginate_union(self, querysets, request, field, descending=True):
+        """
+        对多个互不相交的查询集合并分页（如会话列表的 user_a 侧与 user_b 侧）
+        每个查询集各走自己的索引取一页，再在内存中归并，代价只与页大小有关
+        """
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.field, self.descending = field, descending
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        position = None
+        reverse = False
+        if cursor:
+            value, pk, reverse = self.decode_cursor(cursor, querysets[0].model, field, descending)
+            position = value, pk
+        # 向前翻页时按相反方向查询
+        scan_descending = descending != reverse
+
+        rows = []
+        for queryset in querysets:
+            if scan_descending:
+                queryset = queryset.order_by(f'-{field}', '-id')
+            else:
+                queryset = queryset.order_by(field, 'id')
+            if position is not None:
+                value, pk = position
+                op = 'lt' if scan_descending else 'gt'
+                queryset = queryset.filter(
+                    Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+                )
+            # 多取一条用于判断是否还有下一页
+            rows.extend(queryset[:self.page_size_value + 1])
+
+        if len(querysets) > 1:
+            rows.sort(key=lambda obj: (getattr(obj, field), obj.pk), reverse=scan_descending)
+        more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        self.page = rows
+        return self.page
 
+    def _link(self, obj, reverse):
+        cursor = self.encode_cursor(self.field, self.descending, getattr(obj, self.field), obj.pk, reverse)
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
 
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
 
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
 
 
+class CursorPaginationOptInMixin:
+    """
+    视图集混入：请求带 ?pagination=cursor 或 ?cursor= 时改用游标分页，
+    否则沿用默认的页码分页，保持现有客户端不变
+    显式请求游标分页时按 ?ordering= 的字段排序，覆盖搜索结果的相关度排序（search_rank）
+    """
+    cursor_pagination_class = KeysetPagination
 
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        return params.get('pagination') == 'cursor' or bool(params.get('cursor'))
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and self.cursor_pagination_class and self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
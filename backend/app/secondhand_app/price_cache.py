@@ -0,0 +1,145 @@
+"""
+估价结果缓存（PriceEstimateService、PublicAPIService、PriceScraperService 共用）
+- 过期后继续返回旧值（stale-while-revalidate），同时在后台线程刷新，调用方不再阻塞在数据源请求上
+- 同一个键同一时间只有一个刷新（single-flight，锁通过 cache.add 实现，配置 Redis 缓存后跨进程生效），
+  没有旧值时其他请求等待第一个请求的结果，而不是一起打到数据源
+- 查不到价格（None 或 0）也会缓存，但只保留 PRICE_CACHE_NEGATIVE_TTL 秒，避免未知型号反复请求数据源
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def cache_is_shared() -> bool:
+    """默认缓存能否被多个进程共享（进程内缓存和 DummyCache 不能）"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _default_is_negative(value) -> bool:
+    return not value or (isinstance(value, (int, float)) and value <= 0)
+
+
+class PriceCache:
+    """带后台刷新和单飞锁的缓存层，缓存值为 {'value': 值, 'fresh_until': 时间戳}"""
+
+    lock_timeout = 30  # 刷新锁最长持有时间（秒），刷新线程异常退出时锁自动失效
+    poll_interval = 0.05
+
+    def __init__(self, max_workers: int = 4):
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers, thread_name_prefix='price-cache'
+                    )
+        return self._executor
+
+    @staticmethod
+    def _lock_key(key):
+        return f'{key}:refreshing'
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], fresh_ttl: Optional[int] = None,
+                       is_negative: Callable[[Any], bool] = _default_is_negative) -> Tuple[Any, bool]:
+        """
+        返回 (值, 是否来自缓存)
+        compute 只会在缓存缺失或过期时调用；过期时在后台调用，本次直接返回旧值
+        """
+        fresh_ttl = fresh_ttl or getattr(settings, 'PRICE_CACHE_TIMEOUT', 3600)
+        entry = cache.get(key)
+        if entry is not None:
+            if time.time() >= entry['fresh_until']:
+                self._refresh_in_background(key, compute, fresh_ttl, is_negative)
+            return entry['value'], True
+
+        if cache.add(self._lock_key(key), 1, self.lock_timeout):
+            try:
+                return self._compute_and_store(key, compute, fresh_ttl, is_negative), False
+            finally:
+                cache.delete(self._lock_key(key))
+
+        # 其他请求正在计算同一个键，等待其结果
+        entry = self._wait_for(key)
+        if entry is not None:
+            return entry['value'], True
+        return self._compute_and_store(key, compute, fresh_ttl, is_negative), False
+
+    def refresh_if_expiring(self, key: str, compute: Callable[[], Any], fresh_ttl: Optional[int] = None,
+                            is_negative: Callable[[Any], bool] = _default_is_negative, ahead: float = 0) -> bool:
+        """
+        缓存缺失或将在 ahead 秒内过期时同步刷新（预热用），返回是否刷新
+        与用户请求触发的刷新共用同一个锁，正在刷新的键直接跳过
+        """
+        fresh_ttl = fresh_ttl or getattr(settings, 'PRICE_CACHE_TIMEOUT', 3600)
+        entry = cache.get(key)
+        if entry is not None and entry['fresh_until'] - time.time() > ahead:
+            return False
+        if not cache.add(self._lock_key(key), 1, self.lock_timeout):
+            return False
+        try:
+            self._compute_and_store(key, compute, fresh_ttl, is_negative)
+            return True
+        finally:
+            cache.delete(self._lock_key(key))
+
+    def _store(self, key, value, fresh_ttl, is_negative):
+        if is_negative(value):
+            ttl = getattr(settings, 'PRICE_CACHE_NEGATIVE_TTL', 300)
+            fresh_until = time.time() + ttl
+        else:
+            ttl = fresh_ttl + getattr(settings, 'PRICE_CACHE_STALE_TTL', 86400)
+            fresh_until = time.time() + fresh_ttl
+        cache.set(key, {'value': value, 'fresh_until': fresh_until}, ttl)
+
+    def _compute_and_store(self, key, compute, fresh_ttl, is_negative):
+        value = compute()
+        self._store(key, value, fresh_ttl, is_negative)
+        return value
+
+    def _refresh_in_background(self, key, compute, fresh_ttl, is_negative):
+        if not cache.add(self._lock_key(key), 1, self.lock_timeout):
+            return  # 已有刷新在进行
+        try:
+            self.executor.submit(self._refresh, key, compute, fresh_ttl, is_negative)
+        except RuntimeError:  # 解释器退出时线程池已关闭
+            cache.delete(self._lock_key(key))
+
+    def _refresh(self, key, compute, fresh_ttl, is_negative):
+        try:
+            self._compute_and_store(key, compute, fresh_ttl, is_negative)
+        except Exception as e:
+            logger.warning(f"后台刷新价格缓存失败 {key}: {e}")
+        finally:
+            cache.delete(self._lock_key(key))
+            close_old_connections()
+
+    def _wait_for(self, key):
+        timeout = getattr(settings, 'PRICE_ESTIMATE_DEADLINE', 3.0) + 1
+        give_up_at = time.monotonic() + timeout
+        while time.monotonic() < give_up_at:
+            time.sleep(self.poll_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            if cache.get(self._lock_key(key)) is None:
+                return cache.get(key)
+        return None
+
+
+# 全局实例
+price_cache = PriceCache()
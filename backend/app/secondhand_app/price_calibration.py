@@ -0,0 +1,144 @@
+"""
+估价系数校准
+用已完成回收订单的最终成交价拟合估价模型的系数：
+    log(成交价) = log(基础价格) + log(存储系数) + log(品牌系数) + log(成色系数) + log(型号系数)
+以当前生效的系数为起点，拟合各系数的对数修正量（岭回归：样本少的系数修正量趋近 0，保持当前值）
+订单按块读取，每块累加一次法方程 XᵀX、Xᵀy，内存占用只与系数个数有关，与订单数量无关
+"""
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 校准命令需要 numpy
+    np = None
+
+from .price_model import PriceEstimateModel
+
+# 每行订单数据：(品牌, 型号, 存储, 成色, 成交价)
+Row = Tuple[str, str, str, str, float]
+
+
+class CalibrationResult(NamedTuple):
+    coefficients: Dict
+    samples: int
+    skipped: int
+    rmse_before: float  # 对数误差的均方根，约等于相对误差
+    rmse_after: float
+
+
+class CoefficientFitter:
+    """按块累加订单数据，最后一次求解"""
+
+    def __init__(self, model: PriceEstimateModel, ridge: float = 5.0, model_ridge: float = 20.0):
+        if np is None:
+            raise RuntimeError('估价系数校准需要安装 numpy（pip install -r requirements.txt）')
+        self.model = model
+        self.snapshot = model.snapshot
+        self.current = model.coefficients
+        self.ridge = ridge
+        self.model_ridge = model_ridge
+
+        features = [('storage', storage) for storage in model.storage_multipliers]
+        features += [('brand', brand) for brand in self.snapshot.data]
+        features += [('condition', condition) for condition in model.condition_multipliers]
+        features += [('model', (brand, name)) for brand, models in self.snapshot.data.items() for name in models]
+        self.features = features
+        self.index = {feature: i for i, feature in enumerate(features)}
+
+        size = len(features)
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.yty = 0.0
+        self.samples = 0
+        self.skipped = 0
+        self._matches = {}
+
+    def _row(self, brand, model, storage, condition, price):
+        """返回 (特征下标, 当前估价的对数误差)，无法估价的订单返回 None"""
+        key = (brand, model)
+        if key not in self._matches:
+            self._matches[key] = self.snapshot.derived.resolve(brand, self.model._normalize_model(model))
+        match = self._matches[key]
+        if match is None or not price or price <= 0:
+            return None
+        base_price = self.model._get_base_price(match.brand, match.model, storage, self.snapshot.data)
+        if not base_price:
+            return None
+        multipliers = self.model.multipliers(match.brand, match.model, storage, condition, self.current)
+        estimate = base_price
+        for multiplier in multipliers:
+            estimate *= multiplier
+        columns = [self.index[feature] for feature in (
+            ('storage', storage), ('brand', match.brand), ('condition', condition), ('model', (match.brand, match.model))
+        ) if feature in self.index]
+        return columns, float(np.log(price) - np.log(estimate))
+
+    def add(self, rows: Iterable[Row]):
+        """累加一块订单"""
+        columns, residuals = [], []
+        for row in rows:
+            parsed = self._row(*row)
+            if parsed is None:
+                self.skipped += 1
+                continue
+            columns.append(parsed[0])
+            residuals.append(parsed[1])
+        if not residuals:
+            return
+        x = np.zeros((len(residuals), len(self.features)))
+        for i, cols in enumerate(columns):
+            x[i, cols] = 1.0
+        y = np.array(residuals)
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.yty += float(y @ y)
+        self.samples += len(residuals)
+
+    def solve(self) -> CalibrationResult:
+        penalty = np.array([self.model_ridge if kind == 'model' else self.ridge for kind, _ in self.features])
+        delta = np.linalg.solve(self.xtx + np.diag(penalty), self.xty)
+        # ‖y - Xδ‖² = yᵀy - 2δᵀXᵀy + δᵀXᵀXδ
+        sse_after = self.yty - 2 * delta @ self.xty + delta @ self.xtx @ delta
+        samples = max(self.samples, 1)
+        return CalibrationResult(
+            coefficients=self._coefficients(delta),
+            samples=self.samples,
+            skipped=self.skipped,
+            rmse_before=float(np.sqrt(self.yty / samples)),
+            rmse_after=float(np.sqrt(max(sse_after, 0.0) / samples)),
+        )
+
+    def _current(self, kind, name):
+        """当前生效的系数值；未校准过的型号返回 None"""
+        if kind == 'model':
+            return self.current.get('model', {}).get(name[0], {}).get(name[1])
+        args = {'brand': '', 'model': '', 'storage': '', 'condition': '', kind: name}
+        position = ('storage', 'brand', 'condition').index(kind)
+        return self.model.multipliers(args['brand'], args['model'], args['storage'], args['condition'],
+                                      self.current)[position]
+
+    def _coefficients(self, delta) -> Dict:
+        observed = np.diag(self.xtx) > 0
+        coefficients: Dict = {'storage': {}, 'brand': {}, 'condition': {}, 'model': {}}
+        for i, (kind, name) in enumerate(self.features):
+            value = self._current(kind, name)
+            if kind == 'model':
+                if value is None and not observed[i]:
+                    continue  # 没有样本也没有校准过的型号不写入，使用默认值 1
+                value = value or 1.0
+            new_value = round(float(value * np.exp(delta[i])), 4)
+            if kind == 'model':
+                coefficients['model'].setdefault(name[0], {})[name[1]] = new_value
+            else:
+                coefficients[kind][name] = new_value
+        return coefficients
+
+    def changes(self, coefficients: Dict) -> List[Tuple[str, str, float, float]]:
+        """品牌、成色、存储系数与当前值的差异：(类型, 名称, 原值, 新值)"""
+        rows = []
+        for kind in ('brand', 'condition', 'storage'):
+            for name, new_value in coefficients[kind].items():
+                old_value = self._current(kind, name)
+                if abs(new_value - old_value) >= 0.0005:
+                    rows.append((kind, name, old_value, new_value))
+        return rows
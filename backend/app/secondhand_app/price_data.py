@@ -0,0 +1,194 @@
+"""
+估价数据版本管理
+价格表保存在 PriceDataVersion 中，每次更新都是一个新版本，同一类型只有一个生效版本
+- 读取：各进程持有一份只读快照（MappingProxyType），估价时直接读取，不加锁
+- 切换：每隔 PRICE_DATA_POLL_INTERVAL 秒比较一次缓存中的生效版本号，版本变化时在一个线程中加载新快照，
+  构建完成后整体替换引用，读取方拿到的要么是旧快照要么是新快照
+  默认缓存不能跨进程共享（进程内缓存）时，其他进程看不到缓存中的新版本号，改为每次直接查询数据库
+- 回滚：把旧版本重新设为生效版本即可，版本 0 表示代码中内置的默认数据
+"""
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+
+from .price_cache import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+
+class PriceDataSnapshot(NamedTuple):
+    kind: str
+    version: int
+    data: Mapping  # 只读数据
+    derived: Any   # 由数据构建的附属结构（如型号索引），随快照一起替换
+
+
+def freeze(value):
+    """把 JSON 数据转成只读结构"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """只读结构转回普通 dict/list，用于导出和保存"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class _Kind:
+    def __init__(self, default: Callable[[], Mapping], build: Optional[Callable[[Mapping], Any]]):
+        self.default = default
+        self.build = build
+        self.snapshot: Optional[PriceDataSnapshot] = None
+        self.next_check = 0.0
+        self.lock = threading.Lock()
+
+
+class PriceDataStore:
+    """各类估价数据的当前快照"""
+
+    def __init__(self):
+        self._kinds: Dict[str, _Kind] = {}
+
+    def register(self, kind: str, default: Callable[[], Mapping], build: Optional[Callable[[Mapping], Any]] = None):
+        """
+        注册数据类型
+        default 返回没有发布过版本时使用的内置数据；build 用于从数据构建附属结构
+        """
+        self._kinds[kind] = _Kind(default, build)
+
+    @staticmethod
+    def _version_key(kind):
+        return f'price_data:{kind}:version'
+
+    # ---- 读取 ----
+
+    def get(self, kind: str) -> PriceDataSnapshot:
+        entry = self._kinds[kind]
+        snapshot = entry.snapshot
+        now = time.monotonic()
+        if snapshot is None or now >= entry.next_check:
+            snapshot = self._check(kind, entry, now)
+        return snapshot
+
+    def _check(self, kind, entry, now):
+        entry.next_check = now + getattr(settings, 'PRICE_DATA_POLL_INTERVAL', 5)
+        current = entry.snapshot
+        version = self.active_version(kind)
+        if current is not None and current.version == version:
+            return current
+        # 已有快照时不等待：其他线程正在加载则继续使用旧快照
+        if not entry.lock.acquire(blocking=current is None):
+            return current
+        try:
+            if entry.snapshot is None or entry.snapshot.version != version:
+                entry.snapshot = self._load(kind, entry, version)
+                if current is not None:
+                    logger.info(f"估价数据 {kind} 切换到版本 {entry.snapshot.version}（原版本 {current.version}）")
+            return entry.snapshot
+        finally:
+            entry.lock.release()
+
+    def active_version(self, kind: str) -> int:
+        """当前生效版本号，0 表示使用内置数据"""
+        shared = cache_is_shared()
+        version = cache.get(self._version_key(kind)) if shared else None
+        if version is None:
+            from .models import PriceDataVersion
+            try:
+                version = PriceDataVersion.objects.filter(kind=kind, is_active=True) \
+                    .values_list('version', flat=True).first() or 0
+            except DatabaseError as e:  # 尚未迁移或数据库不可用时使用内置数据
+                logger.warning(f"读取估价数据版本失败: {e}")
+                return 0
+            if shared:
+                cache.set(self._version_key(kind), version, getattr(settings, 'PRICE_DATA_VERSION_TTL', 60))
+        return version
+
+    def _load(self, kind, entry, version):
+        data = None
+        if version:
+            from .models import PriceDataVersion
+            try:
+                data = PriceDataVersion.objects.filter(kind=kind, version=version) \
+                    .values_list('data', flat=True).first()
+            except DatabaseError as e:
+                logger.warning(f"加载估价数据 {kind} 版本 {version} 失败: {e}")
+            if data is None:
+                if entry.snapshot is not None:
+                    return entry.snapshot
+                version = 0
+        if data is None:
+            data = entry.default()
+        frozen = freeze(data)
+        derived = entry.build(frozen) if entry.build else None
+        return PriceDataSnapshot(kind, version, frozen, derived)
+
+    # ---- 发布和回滚 ----
+
+    def publish(self, kind: str, data: Mapping, note: str = ''):
+        """保存为新版本并设为生效版本，返回 PriceDataVersion"""
+        from .models import PriceDataVersion
+        entry = self._kinds[kind]
+        if entry.build:
+            entry.build(freeze(data))  # 发布前先构建一次，数据有问题时直接报错，不影响线上版本
+        with transaction.atomic():
+            last = PriceDataVersion.objects.select_for_update().filter(kind=kind).order_by('-version').first()
+            PriceDataVersion.objects.filter(kind=kind, is_active=True).update(is_active=False)
+            record = PriceDataVersion.objects.create(
+                kind=kind,
+                version=(last.version if last else 0) + 1,
+                data=thaw(data),
+                is_active=True,
+                note=note,
+            )
+            transaction.on_commit(lambda: self._announce(kind, record.version))
+        return record
+
+    def activate(self, kind: str, version: int):
+        """把指定版本设为生效版本（回滚），version 为 0 时恢复内置数据"""
+        from .models import PriceDataVersion
+        with transaction.atomic():
+            if version and not PriceDataVersion.objects.filter(kind=kind, version=version).exists():
+                raise PriceDataVersion.DoesNotExist(f'{kind} 版本 {version} 不存在')
+            PriceDataVersion.objects.filter(kind=kind, is_active=True).exclude(version=version).update(is_active=False)
+            if version:
+                PriceDataVersion.objects.filter(kind=kind, version=version).update(is_active=True)
+            transaction.on_commit(lambda: self._announce(kind, version))
+
+    def previous_version(self, kind: str) -> int:
+        """当前生效版本之前的一个版本，没有时返回 0"""
+        from .models import PriceDataVersion
+        current = self.active_version(kind)
+        if not current:
+            return 0
+        return PriceDataVersion.objects.filter(kind=kind, version__lt=current) \
+            .order_by('-version').values_list('version', flat=True).first() or 0
+
+    def versions(self, kind: str) -> List[Dict]:
+        from .models import PriceDataVersion
+        return list(PriceDataVersion.objects.filter(kind=kind).order_by('-version')
+                    .values('version', 'is_active', 'note', 'created_at'))
+
+    def _announce(self, kind, version):
+        """写入新的生效版本号；本进程立即切换，其他进程在下次检查时切换"""
+        cache.set(self._version_key(kind), version, getattr(settings, 'PRICE_DATA_VERSION_TTL', 60))
+        entry = self._kinds.get(kind)
+        if entry is not None:
+            entry.next_check = 0.0
+
+
+# 全局实例
+price_data_store = PriceDataStore()
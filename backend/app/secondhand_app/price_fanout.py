@@ -0,0 +1,140 @@
+"""
+估价数据源并发查询
+把多个数据源同时提交到线程池，在全局截止时间（settings.PRICE_ESTIMATE_DEADLINE）内取结果：
+- first: 第一个有效价格到达即返回
+- quorum: 收集到 PRICE_FANOUT_QUORUM 个有效价格（或到截止时间）后取中位数
+截止时间到达后，尚未开始的数据源直接取消；已经在请求中的数据源通过 request_timeout
+拿到的超时不会超过剩余时间，之后的请求直接放弃，因此不会长期占用线程
+处于熔断状态的数据源（见 circuit_breaker）不会被提交
+"""
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .circuit_breaker import circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+# 数据源：(名称, 无参调用，返回价格或 None)
+Provider = Tuple[str, Callable[[], Optional[float]]]
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """本次估价的截止时间已到，数据源应放弃后续请求"""
+
+
+def request_timeout(default: float) -> float:
+    """
+    数据源发起 HTTP 请求时使用的超时时间
+    在并发查询的工作线程中不超过剩余时间，其他场景（直接调用）保持原超时
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return default
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded('估价截止时间已到')
+    return min(default, remaining)
+
+
+class PriceFanout:
+    """并发查询多个估价数据源"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers or getattr(settings, 'PRICE_FANOUT_WORKERS', 16),
+                        thread_name_prefix='price-fanout',
+                    )
+        return self._executor
+
+    @staticmethod
+    def _call(func, deadline):
+        if time.monotonic() >= deadline:
+            return None
+        _local.deadline = deadline
+        try:
+            price = func()
+        finally:
+            _local.deadline = None
+        if price and price > 0:
+            return float(price)
+        return None
+
+    def run(self, providers: Sequence[Provider], deadline: Optional[float] = None,
+            policy: Optional[str] = None, quorum: Optional[int] = None) -> Optional[Tuple[str, float]]:
+        """
+        返回 (数据源名称, 价格)，没有任何数据源在截止时间内给出有效价格时返回 None
+        deadline 为相对秒数，默认 settings.PRICE_ESTIMATE_DEADLINE
+        """
+        # 熔断中的数据源直接跳过，不占用线程
+        skipped = [name for name, _ in providers if not circuit_breakers.get(name).available()]
+        if skipped:
+            logger.info(f"跳过熔断中的估价数据源: {', '.join(skipped)}")
+            providers = [(name, func) for name, func in providers if name not in skipped]
+        if not providers:
+            return None
+        if deadline is None:
+            deadline = getattr(settings, 'PRICE_ESTIMATE_DEADLINE', 3.0)
+        policy = policy or getattr(settings, 'PRICE_FANOUT_POLICY', 'first')
+        quorum = min(quorum or getattr(settings, 'PRICE_FANOUT_QUORUM', 2), len(providers))
+        started = time.monotonic()
+        deadline_at = started + deadline
+
+        futures = {
+            self.executor.submit(self._call, func, deadline_at): name
+            for name, func in providers
+        }
+        results: List[Tuple[str, float]] = []
+        pending = set(futures)
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    price = future.result()
+                except Exception as e:
+                    logger.warning(f"估价数据源 {futures[future]} 失败: {e}")
+                    continue
+                if price is not None:
+                    results.append((futures[future], price))
+            if policy == 'first' and results:
+                break
+            if policy == 'quorum' and len(results) >= quorum:
+                break
+
+        # 取消未完成的数据源
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.info(f"放弃未完成的估价数据源: {', '.join(sorted(futures[f] for f in pending))}")
+
+        elapsed = time.monotonic() - started
+        if not results:
+            logger.info(f"估价数据源均无结果，耗时 {elapsed:.2f}s")
+            return None
+        if policy == 'quorum' and len(results) > 1:
+            names = ','.join(name for name, _ in results)
+            return f'quorum({names})', statistics.median(price for _, price in results)
+        return results[0]
+
+
+# 全局实例
+price_fanout = PriceFanout()
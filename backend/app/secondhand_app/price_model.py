@@ -4,10 +4,20 @@
 """
 import logging
 from datetime import datetime
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
 from django.core.cache import cache
 
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时批量估价逐个计算
+    np = None
+
+from .model_index import ModelMatch, ModelNameIndex
+from .price_data import PriceDataSnapshot, price_data_store
+
 logger = logging.getLogger(__name__)
+if np is None:
+    logger.warning('未安装 numpy，批量估价逐个计算（pip install -r requirements.txt）')
 
 
 class PriceEstimateModel:
@@ -62,22 +72,28 @@ class PriceEstimateModel:
         返回:
             估算价格（元）
         """
-        # 1. 获取基础价格
-        base_price = self._get_base_price(brand, model, storage)
+        # 1. 获取基础价格（型号先解析到价格表中的标准品牌和型号；整个估价使用同一个价格表版本）
+        snapshot = self.snapshot
+        match = snapshot.derived.resolve(brand, self._normalize_model(model))
+        if match is None:
+            logger.warning(f"未找到 {brand} {model} {storage} 的价格数据")
+            return 0
+        brand = match.brand
+        base_price = self._get_base_price(match.brand, match.model, storage, snapshot.data)
         if base_price == 0:
             logger.warning(f"未找到 {brand} {model} {storage} 的价格数据")
             return 0
         
+        storage_mult, brand_mult, condition_mult, model_mult = self.multipliers(
+            match.brand, match.model, storage, condition)
+        
         # 2. 应用存储系数
-        storage_mult = self.storage_multipliers.get(storage, 1.0)
         adjusted_price = base_price * storage_mult
         
-        # 3. 应用品牌系数
-        brand_mult = self.brand_multipliers.get(brand, 0.75)
-        adjusted_price = adjusted_price * brand_mult
+        # 3. 应用品牌系数（以及校准得到的型号系数）
+        adjusted_price = adjusted_price * brand_mult * model_mult
         
         # 4. 应用成色系数
-        condition_mult = self.condition_multipliers.get(condition, 0.7)
         adjusted_price = adjusted_price * condition_mult
         
         # 5. 应用时间衰减（如果提供了发布年份）
@@ -87,14 +103,107 @@ class PriceEstimateModel:
         
         return round(adjusted_price, 2)
     
-    def _get_base_price(self, brand: str, model: str, storage: str) -> float:
-        """获取基础价格（128GB版本的价格）"""
-        # 标准化型号名称
-        model_normalized = self._normalize_model(model)
-        
-        # 查找价格数据
-        brand_data = self.price_database.get(brand, {})
-        model_data = brand_data.get(model_normalized, {})
+    def estimate_many(self, items: Sequence[Mapping]) -> List[Tuple[float, Optional[ModelMatch]]]:
+        """
+        批量估价，items 为包含 brand、model、storage、condition、release_year（可选）的字典
+        相同输入只计算一次，所有系数组成数组后一次相乘；返回与 items 一一对应的 (价格, 型号匹配结果)，
+        未找到价格时价格为 0
+        """
+        snapshot = self.snapshot
+        coefficients = self.coefficients
+        positions = {}  # 去重后的输入 -> 结果下标
+        order = []
+        for item in items:
+            key = (item.get('brand') or '', item.get('model') or '', item.get('storage') or '',
+                   item.get('condition') or 'good', item.get('release_year') or None)
+            order.append(positions.setdefault(key, len(positions)))
+
+        matches = {}
+        results: List[Tuple[float, Optional[ModelMatch]]] = []
+        factors = []  # 每个唯一输入的 (基础价格, 存储系数, 品牌系数, 成色系数, 型号系数, 时间系数)
+        for brand, model, storage, condition, release_year in positions:
+            if (brand, model) not in matches:
+                matches[(brand, model)] = snapshot.derived.resolve(brand, self._normalize_model(model))
+            match = matches[(brand, model)]
+            if match is None:
+                factors.append((0, 0, 0, 0, 0, 0))
+                results.append((0, None))
+                continue
+            base_price = self._get_base_price(match.brand, match.model, storage, snapshot.data)
+            factors.append((
+                base_price,
+                *self.multipliers(match.brand, match.model, storage, condition, coefficients),
+                self._calculate_age_multiplier(int(release_year)) if release_year else 1.0,
+            ))
+            results.append((0, match if base_price else None))
+
+        if np is not None and factors:
+            prices = np.round(np.prod(np.array(factors, dtype=float), axis=1), 2).tolist()
+        else:
+            prices = []
+            for row in factors:
+                price = 1.0
+                for factor in row:
+                    price *= factor
+                prices.append(round(price, 2))
+        results = [(price, match) for price, (_, match) in zip(prices, results)]
+        return [results[i] for i in order]
+    
+    def multipliers(self, brand: str, model: str, storage: str, condition: str,
+                    coefficients: Optional[Mapping] = None) -> Tuple[float, float, float, float]:
+        """
+        返回 (存储系数, 品牌系数, 成色系数, 型号系数)，brand/model 为价格表中的标准名称
+        有校准系数时优先使用校准值，否则使用默认系数
+        """
+        if coefficients is None:
+            coefficients = self.coefficients
+        calibrated = coefficients.get('storage', {}).get(storage)
+        storage_mult = calibrated or self.storage_multipliers.get(storage, 1.0)
+        calibrated = coefficients.get('brand', {}).get(brand)
+        brand_mult = calibrated or self.brand_multipliers.get(brand, 0.75)
+        calibrated = coefficients.get('condition', {}).get(condition)
+        condition_mult = calibrated or self.condition_multipliers.get(condition, 0.7)
+        model_mult = coefficients.get('model', {}).get(brand, {}).get(model, 1.0)
+        return storage_mult, brand_mult, condition_mult, model_mult
+    
+    @property
+    def coefficients(self) -> Mapping:
+        """当前生效的校准系数（calibrate_price_model 生成），未校准时为空"""
+        return price_data_store.get('coefficients').data
+    
+    @property
+    def coefficients_version(self) -> int:
+        return price_data_store.get('coefficients').version
+    
+    @property
+    def snapshot(self) -> PriceDataSnapshot:
+        """当前生效的价格表快照（只读），发布新版本后自动切换"""
+        return price_data_store.get('price_database')
+    
+    @property
+    def price_database(self) -> Dict:
+        return self.snapshot.data
+    
+    @property
+    def data_version(self) -> int:
+        """当前价格表版本号，0 为内置价格表"""
+        return self.snapshot.version
+    
+    @property
+    def model_index(self) -> ModelNameIndex:
+        """当前价格表的型号索引，随价格表版本一起构建和切换"""
+        return self.snapshot.derived
+    
+    def match(self, brand: str, model: str) -> Optional[ModelMatch]:
+        """把用户输入的品牌和型号解析为价格表中的标准名称，返回 ModelMatch(品牌, 型号, 置信度)"""
+        return self.model_index.resolve(brand, self._normalize_model(model))
+    
+    def _get_base_price(self, brand: str, model: str, storage: str, price_database: Optional[Dict] = None) -> float:
+        """获取基础价格（128GB版本的价格），brand/model 为价格表中的标准名称"""
+        if price_database is None:
+            price_database = self.price_database
+        brand_data = price_database.get(brand, {})
+        model_data = brand_data.get(model, {})
         
         # 优先使用128GB作为基准
         base_storage = '128GB'
@@ -139,8 +248,8 @@ class PriceEstimateModel:
         else:
             return max(0.25, 1.0 - age * 0.15)
     
-    # 价格数据库（2024年12月市场价格，单位：元）
-    price_database = {
+    # 内置价格表（2024年12月市场价格，单位：元），没有发布过价格表版本时使用
+    default_price_database = {
         '苹果': {
             # iPhone 15 系列
             'iPhone 15 Pro Max': {
@@ -429,6 +538,9 @@ class PriceEstimateModel:
     }
 
 
+price_data_store.register('price_database', lambda: PriceEstimateModel.default_price_database, ModelNameIndex)
+price_data_store.register('coefficients', dict)
+
 # 全局模型实例
 price_model = PriceEstimateModel()
 
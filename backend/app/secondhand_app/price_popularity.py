@@ -0,0 +1,88 @@
+"""
+估价请求热度统计（缓存预热使用）
+每个进程先在内存中计数，每隔 flush_interval 秒合并到缓存中按小时分桶的计数表，
+每个桶只保留访问最多的 max_keys 个 (设备类型, 品牌, 型号, 存储, 成色)；合并是读-改-写，并发时可能丢少量计数，
+只用于排序热门机型，不要求精确
+popular_estimates() 再合并最近的回收订单，得到需要预热的估价参数
+计数表和预热的估价都存放在默认缓存中，需要配置多进程共享的缓存（CACHE_REDIS_URL）：
+进程内缓存（LocMem）下 cron 运行的 warm_price_cache 看不到 web 进程的请求，预热结果也随命令退出丢弃
+"""
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import List, Tuple
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+EstimateKey = Tuple[str, str, str, str, str]
+
+
+class PopularityTracker:
+    bucket_seconds = 3600
+    flush_interval = 30
+    max_keys = 2000
+    retention_hours = 48
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def _bucket_key(self, bucket):
+        return f'price_hot:{bucket}'
+
+    def record(self, device_type: str, brand: str, model: str, storage: str, condition: str):
+        with self._lock:
+            self._counts[(device_type, brand, model, storage, condition)] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把本进程的计数合并到缓存"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+        key = self._bucket_key(int(time.time() // self.bucket_seconds))
+        merged = Counter(cache.get(key) or {})
+        merged.update(counts)
+        cache.set(key, dict(merged.most_common(self.max_keys)), self.retention_hours * self.bucket_seconds)
+
+    def top(self, hours: int = 24) -> Counter:
+        """最近 hours 小时内各估价参数的请求次数"""
+        self.flush()
+        current = int(time.time() // self.bucket_seconds)
+        keys = [self._bucket_key(bucket) for bucket in range(current - hours + 1, current + 1)]
+        total: Counter = Counter()
+        for counts in cache.get_many(keys).values():
+            total.update(counts)
+        return total
+
+
+# 全局实例
+price_popularity = PopularityTracker()
+
+
+def popular_estimates(limit: int = 200, hours: int = 24, days: int = 30,
+                      order_weight: float = 5) -> List[Tuple[EstimateKey, float]]:
+    """
+    最热门的 limit 组估价参数及其得分，按得分从高到低排列
+    得分 = 最近 hours 小时的估价请求数 + 最近 days 天的回收订单数 × order_weight
+    """
+    from .models import RecycleOrder
+
+    scores = {key: float(count) for key, count in price_popularity.top(hours).items()}
+    if days and order_weight:
+        since = timezone.now() - timedelta(days=days)
+        rows = (RecycleOrder.objects.filter(created_at__gte=since)
+                .values_list('device_type', 'brand', 'model', 'storage', 'condition')
+                .annotate(n=Count('id')).order_by('-n')[:limit])
+        for device_type, brand, model, storage, condition, n in rows:
+            key = (device_type, brand, model, storage or '', condition)
+            scores[key] = scores.get(key, 0) + n * order_weight
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
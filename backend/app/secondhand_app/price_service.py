@@ -2,12 +2,18 @@
 第三方估价服务接口
 支持接入多个第三方估价API提供商
 """
-import requests
 import logging
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from django.conf import settings
 from django.core.cache import cache
 
+from .circuit_breaker import circuit_breakers
+from .model_index import ModelMatch, ModelNameIndex
+from .price_cache import price_cache
+from .price_fanout import Provider, price_fanout, request_timeout
+from .price_popularity import price_popularity
+from .price_table import local_price_table
+
 logger = logging.getLogger(__name__)
 
 # 可选：启用爬取服务（仅供学习研究，不推荐用于生产环境）
@@ -33,6 +39,106 @@ else:
     public_api_service = None
 
 
+# 基础价格表（智能估价模型没有覆盖的设备类型使用）：{设备类型: {品牌: {型号: {存储: 价格}}}}
+LOCAL_BASE_PRICES = {
+    '手机': {
+        '苹果': {
+            'iPhone 15 Pro Max': {'128GB': 6500, '256GB': 7200, '512GB': 8500, '1TB': 10000},
+            'iPhone 15 Pro': {'128GB': 5500, '256GB': 6200, '512GB': 7500},
+            'iPhone 15': {'128GB': 4500, '256GB': 5200, '512GB': 6500},
+            'iPhone 14 Pro Max': {'128GB': 5500, '256GB': 6200, '512GB': 7500, '1TB': 9000},
+            'iPhone 14 Pro': {'128GB': 4800, '256GB': 5500, '512GB': 6800},
+            'iPhone 14': {'128GB': 3800, '256GB': 4500, '512GB': 5800},
+            'iPhone 13 Pro Max': {'128GB': 4500, '256GB': 5200, '512GB': 6500, '1TB': 8000},
+            'iPhone 13 Pro': {'128GB': 4000, '256GB': 4700, '512GB': 6000},
+            'iPhone 13': {'128GB': 3200, '256GB': 3900, '512GB': 5200},
+        },
+        '华为': {
+            'Mate 60 Pro': {'256GB': 4500, '512GB': 5500, '1TB': 6500},
+            'Mate 60': {'256GB': 3800, '512GB': 4800},
+            'P60 Pro': {'256GB': 3500, '512GB': 4500},
+            'P60': {'128GB': 2800, '256GB': 3500},
+        },
+        '小米': {
+            '小米14 Pro': {'256GB': 2800, '512GB': 3500, '1TB': 4200},
+            '小米14': {'256GB': 2200, '512GB': 2800},
+            '小米13 Ultra': {'256GB': 3000, '512GB': 3800},
+            '小米13': {'128GB': 1800, '256GB': 2400, '512GB': 3000},
+        },
+        'vivo': {
+            'X100 Pro': {'256GB': 3200, '512GB': 4000},
+            'X100': {'256GB': 2500, '512GB': 3200},
+        },
+        'OPPO': {
+            'Find X6 Pro': {'256GB': 3000, '512GB': 3800},
+            'Find X6': {'256GB': 2400, '512GB': 3000},
+        },
+    },
+    '平板': {
+        '苹果': {
+            'iPad Pro 12.9': {'128GB': 4500, '256GB': 5500, '512GB': 7000, '1TB': 9000},
+            'iPad Pro 11': {'128GB': 3500, '256GB': 4500, '512GB': 6000, '1TB': 8000},
+            'iPad Air': {'64GB': 2500, '256GB': 3500},
+            'iPad': {'64GB': 1800, '256GB': 2800},
+        },
+        '华为': {
+            'MatePad Pro': {'128GB': 2500, '256GB': 3200},
+            'MatePad': {'64GB': 1200, '128GB': 1800},
+        },
+    },
+    '笔记本': {
+        '苹果': {
+            'MacBook Pro 16': {'512GB': 8000, '1TB': 10000, '2TB': 12000},
+            'MacBook Pro 14': {'512GB': 7000, '1TB': 9000, '2TB': 11000},
+            'MacBook Air': {'256GB': 5500, '512GB': 7000, '1TB': 9000},
+        },
+        '联想': {
+            'ThinkPad X1': {'512GB': 4500, '1TB': 5500},
+            '小新16': {'512GB': 3000, '1TB': 4000},
+        },
+    },
+}
+
+# 成色系数（外部数据源价格和基础价格表使用）
+CONDITION_MULTIPLIERS = {
+    'new': 1.0,
+    'like_new': 0.85,
+    'good': 0.7,
+    'fair': 0.5,
+    'poor': 0.3,
+}
+
+_local_indexes: Dict[str, ModelNameIndex] = {}
+
+
+def match_local_model(device_type: str, brand: str, model: str) -> Optional[ModelMatch]:
+    """把型号解析到基础价格表中的标准品牌和型号"""
+    table = LOCAL_BASE_PRICES.get(device_type)
+    if not table:
+        return None
+    index = _local_indexes.get(device_type)
+    if index is None:
+        index = _local_indexes.setdefault(device_type, ModelNameIndex(table))
+    return index.resolve(brand, model)
+
+
+def lookup_local_base_price(device_type: str, brand: str, model: str, storage: str) -> float:
+    """
+    在基础价格表中查找价格（未按成色调整）
+    型号通过索引解析（大小写、空格、品牌前缀、拼音等写法都能命中），存储容量没有对应价格时取该型号的第一个价格
+    """
+    match = match_local_model(device_type, brand, model)
+    if match is None:
+        return 0
+    prices = LOCAL_BASE_PRICES[device_type][match.brand][match.model]
+    return prices.get(storage) or next(iter(prices.values()), 0)
+
+
+def _no_price(value) -> bool:
+    """(价格, 是否来自API) 中没有价格"""
+    return not value[0]
+
+
 class PriceEstimateService:
     """估价服务基类"""
     
@@ -46,62 +152,124 @@ class PriceEstimateService:
         估价方法
         返回: (价格, 是否来自API)
         """
-        # 生成缓存key
-        cache_key = f"price_estimate_{device_type}_{brand}_{model}_{storage}_{condition}"
+        cache_key = self._cache_key(device_type, brand, model, storage, condition)
+        # 记录访问次数，缓存预热（warm_price_cache）优先刷新热门机型
+        price_popularity.record(device_type, brand, model, storage, condition)
         
-        # 尝试从缓存获取
-        cached_price = cache.get(cache_key)
-        if cached_price is not None:
-            logger.info(f"从缓存获取价格: {cache_key} = {cached_price}")
-            return cached_price, False
+        # 缓存过期后先返回旧价格并在后台刷新；查不到价格（0）短时间缓存
+        (price, from_api), cached = price_cache.get_or_compute(
+            cache_key,
+            lambda: self._estimate_uncached(device_type, brand, model, storage, condition),
+            fresh_ttl=self.cache_timeout,
+            is_negative=_no_price,
+        )
+        if cached:
+            logger.info(f"从缓存获取价格: {cache_key} = {price}")
+            return price, False
+        return price, from_api
+    
+    def warm(self, device_type: str, brand: str, model: str, storage: str, condition: str, ahead: float) -> bool:
+        """缓存缺失或将在 ahead 秒内过期时重新估价并写入缓存，返回是否刷新"""
+        return price_cache.refresh_if_expiring(
+            self._cache_key(device_type, brand, model, storage, condition),
+            lambda: self._estimate_uncached(device_type, brand, model, storage, condition),
+            fresh_ttl=self.cache_timeout,
+            is_negative=_no_price,
+            ahead=ahead,
+        )
+    
+    @staticmethod
+    def _cache_key(device_type: str, brand: str, model: str, storage: str, condition: str) -> str:
+        """缓存key（带上价格表和校准系数版本，发布新版本后不再命中旧版本算出的价格）"""
+        from .price_model import price_model
+        version = f"{price_model.data_version}.{price_model.coefficients_version}"
+        return f"price_estimate_v{version}_{device_type}_{brand}_{model}_{storage}_{condition}"
+    
+    def estimate_many(self, items: List[Dict]) -> List[Dict]:
+        """
+        批量估价，不请求外部数据源
+        已缓存的估价结果（包括外部数据源的价格）直接使用，其余手机用智能估价模型批量计算，
+        其他设备类型用基础价格表；返回与 items 一一对应的 {price, source, confidence, brand, model}，
+        source 为 api/model/local，未找到价格时 price 为 0、source 为 None
+        """
+        from .price_model import price_model
+        keys = [self._cache_key(item['device_type'], item['brand'], item['model'],
+                                item.get('storage') or '', item.get('condition') or 'good') for item in items]
+        cached = cache.get_many(set(keys))
         
-        # 如果启用了API，尝试调用第三方接口
-        if self.api_enabled and self.api_provider != 'local':
-            try:
-                price = self._call_third_party_api(device_type, brand, model, storage, condition)
-                if price and price > 0:
-                    # 根据成色调整价格
-                    adjusted_price = self._adjust_by_condition(price, condition)
-                    # 缓存结果
-                    cache.set(cache_key, adjusted_price, self.cache_timeout)
-                    logger.info(f"第三方API返回价格: {cache_key} = {adjusted_price}")
-                    return adjusted_price, True
-            except Exception as e:
-                logger.warning(f"第三方API调用失败: {e}，降级到本地价格表")
+        results = [None] * len(items)
+        phones = []
+        for i, (item, key) in enumerate(zip(items, keys)):
+            entry = cached.get(key)
+            if entry and entry['value'][0]:
+                price, from_api = entry['value']
+                results[i] = {'price': price, 'source': 'api' if from_api else 'model'}
+            elif item['device_type'] == '手机':
+                phones.append(i)
         
-        # 如果启用了公开API服务
-        if ENABLE_PUBLIC_API and public_api_service:
-            try:
-                price = public_api_service.estimate(device_type, brand, model, storage, condition)
-                if price and price > 0:
-                    # 根据成色调整价格
-                    adjusted_price = self._adjust_by_condition(price, condition)
-                    # 缓存结果
-                    cache.set(cache_key, adjusted_price, self.cache_timeout)
-                    logger.info(f"公开API返回价格: {cache_key} = {adjusted_price}")
-                    return adjusted_price, True
-            except Exception as e:
-                logger.warning(f"公开API失败: {e}，降级到本地价格表")
+        # 手机：智能估价模型一次算完
+        estimates = price_model.estimate_many([items[i] for i in phones])
+        for i, (price, match) in zip(phones, estimates):
+            if price > 0:
+                results[i] = {'price': price, 'source': 'model', 'match': match}
         
-        # 如果启用了爬取服务（仅供学习研究）
-        if ENABLE_SCRAPER and scraper_service:
+        for i, item in enumerate(items):
+            result = results[i]
+            if result is None:
+                # 其他设备类型和智能估价模型中没有的手机：基础价格表
+                match = match_local_model(item['device_type'], item['brand'], item['model'])
+                price = lookup_local_base_price(item['device_type'], item['brand'], item['model'],
+                                                item.get('storage') or '') if match else 0
+                price = self._adjust_by_condition(price, item.get('condition') or 'good')
+                result = {'price': price, 'source': 'local' if price else None, 'match': match if price else None}
+            elif 'match' not in result:
+                result['match'] = price_model.match(item['brand'], item['model']) if item['device_type'] == '手机' \
+                    else match_local_model(item['device_type'], item['brand'], item['model'])
+            match = result.pop('match')
+            result.update({
+                'confidence': match.confidence if match else None,
+                'brand': match.brand if match else None,
+                'model': match.model if match else None,
+            })
+            results[i] = result
+        return results
+    
+    def _estimate_uncached(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Tuple[float, bool]:
+        """不经过缓存的估价，返回 (价格, 是否来自API)"""
+        # 第三方API、公开API、爬取服务并发查询，总耗时不超过 PRICE_ESTIMATE_DEADLINE
+        result = price_fanout.run(self._providers(device_type, brand, model, storage, condition))
+        if result:
+            source, price = result
+            # 根据成色调整价格
+            adjusted_price = self._adjust_by_condition(price, condition)
+            logger.info(f"数据源 {source} 返回价格: {brand} {model} {storage} {condition} = {adjusted_price}")
+            return adjusted_price, True
+        
+        # 公开API的本地市场价格数据（无网络请求，在外部数据源都没有结果时使用）
+        if ENABLE_PUBLIC_API and public_api_service:
             try:
-                price = scraper_service.estimate(device_type, brand, model, storage, condition)
+                price = public_api_service._market_price_database(brand, model, storage)
                 if price and price > 0:
-                    # 根据成色调整价格
-                    adjusted_price = self._adjust_by_condition(price, condition)
-                    # 缓存结果
-                    cache.set(cache_key, adjusted_price, self.cache_timeout)
-                    logger.info(f"爬取服务返回价格: {cache_key} = {adjusted_price}")
-                    return adjusted_price, True
+                    return self._adjust_by_condition(price, condition), True
             except Exception as e:
-                logger.warning(f"爬取服务失败: {e}，降级到本地价格表")
+                logger.warning(f"市场价格数据库失败: {e}，降级到本地价格表")
         
         # 降级到本地价格表
-        price = self._get_local_price(device_type, brand, model, storage, condition)
-        if price > 0:
-            cache.set(cache_key, price, self.cache_timeout)
-        return price, False
+        return self._get_local_price(device_type, brand, model, storage, condition), False
+    
+    def _providers(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> List[Provider]:
+        """按配置收集所有外部数据源（展开到单个接口，避免在线程池内再嵌套并发）"""
+        providers = []
+        if self.api_enabled and self.api_provider != 'local':
+            providers.append((
+                self.api_provider,
+                lambda: self._call_third_party_api(device_type, brand, model, storage, condition)
+            ))
+        if ENABLE_PUBLIC_API and public_api_service:
+            providers.extend(public_api_service.providers(brand, model, storage))
+        if ENABLE_SCRAPER and scraper_service:
+            providers.extend(scraper_service.providers(device_type, brand, model, storage, condition))
+        return providers
     
     def _call_third_party_api(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
         """调用第三方API"""
@@ -141,11 +309,12 @@ class PriceEstimateService:
                 'Content-Type': 'application/json',
             }
             
-            response = requests.post(
+            response = circuit_breakers.get('aihuishou').request(
+                'POST',
                 api_url,
                 json=params,
                 headers=headers,
-                timeout=5
+                timeout=request_timeout(5)
             )
             
             if response.status_code == 200:
@@ -191,11 +360,12 @@ class PriceEstimateService:
                 'Content-Type': 'application/json',
             }
             
-            response = requests.post(
+            response = circuit_breakers.get('huishoubao').request(
+                'POST',
                 api_url,
                 json=params,
                 headers=headers,
-                timeout=5
+                timeout=request_timeout(5)
             )
             
             if response.status_code == 200:
@@ -244,10 +414,11 @@ class PriceEstimateService:
             elif api_auth_type == 'query' and api_key:
                 params['api_key'] = api_key
             
+            breaker = circuit_breakers.get('custom')
             if api_method == 'POST':
-                response = requests.post(api_url, json=params, headers=headers, timeout=5)
+                response = breaker.request('POST', api_url, json=params, headers=headers, timeout=request_timeout(5))
             else:
-                response = requests.get(api_url, params=params, headers=headers, timeout=5)
+                response = breaker.request('GET', api_url, params=params, headers=headers, timeout=request_timeout(5))
             
             if response.status_code == 200:
                 data = response.json()
@@ -271,19 +442,17 @@ class PriceEstimateService:
     
     def _adjust_by_condition(self, base_price: float, condition: str) -> float:
         """根据成色调整价格"""
-        condition_multipliers = {
-            'new': 1.0,
-            'like_new': 0.85,
-            'good': 0.7,
-            'fair': 0.5,
-            'poor': 0.3
-        }
-        multiplier = condition_multipliers.get(condition, 0.7)
+        multiplier = CONDITION_MULTIPLIERS.get(condition, 0.7)
         return base_price * multiplier
     
     def _get_local_price(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> float:
         """从本地价格表获取价格"""
-        # 优先使用智能估价模型
+        # 预先展开的本地估价表（智能估价模型 + 基础价格表），常见存储和成色一次查找
+        price = local_price_table.lookup(device_type, brand, model, storage, condition)
+        if price is not None:
+            return price
+        
+        # 估价表中没有的存储/成色：优先使用智能估价模型
         try:
             from .price_model import price_model
             if device_type == '手机':
@@ -295,76 +464,7 @@ class PriceEstimateService:
             logger.warning(f"智能估价模型失败: {e}，降级到基础价格表")
         
         # 降级到基础价格表
-        base_prices = {
-            '手机': {
-                '苹果': {
-                    'iPhone 15 Pro Max': {'128GB': 6500, '256GB': 7200, '512GB': 8500, '1TB': 10000},
-                    'iPhone 15 Pro': {'128GB': 5500, '256GB': 6200, '512GB': 7500},
-                    'iPhone 15': {'128GB': 4500, '256GB': 5200, '512GB': 6500},
-                    'iPhone 14 Pro Max': {'128GB': 5500, '256GB': 6200, '512GB': 7500, '1TB': 9000},
-                    'iPhone 14 Pro': {'128GB': 4800, '256GB': 5500, '512GB': 6800},
-                    'iPhone 14': {'128GB': 3800, '256GB': 4500, '512GB': 5800},
-                    'iPhone 13 Pro Max': {'128GB': 4500, '256GB': 5200, '512GB': 6500, '1TB': 8000},
-                    'iPhone 13 Pro': {'128GB': 4000, '256GB': 4700, '512GB': 6000},
-                    'iPhone 13': {'128GB': 3200, '256GB': 3900, '512GB': 5200},
-                },
-                '华为': {
-                    'Mate 60 Pro': {'256GB': 4500, '512GB': 5500, '1TB': 6500},
-                    'Mate 60': {'256GB': 3800, '512GB': 4800},
-                    'P60 Pro': {'256GB': 3500, '512GB': 4500},
-                    'P60': {'128GB': 2800, '256GB': 3500},
-                },
-                '小米': {
-                    '小米14 Pro': {'256GB': 2800, '512GB': 3500, '1TB': 4200},
-                    '小米14': {'256GB': 2200, '512GB': 2800},
-                    '小米13 Ultra': {'256GB': 3000, '512GB': 3800},
-                    '小米13': {'128GB': 1800, '256GB': 2400, '512GB': 3000},
-                },
-                'vivo': {
-                    'X100 Pro': {'256GB': 3200, '512GB': 4000},
-                    'X100': {'256GB': 2500, '512GB': 3200},
-                },
-                'OPPO': {
-                    'Find X6 Pro': {'256GB': 3000, '512GB': 3800},
-                    'Find X6': {'256GB': 2400, '512GB': 3000},
-                },
-            },
-            '平板': {
-                '苹果': {
-                    'iPad Pro 12.9': {'128GB': 4500, '256GB': 5500, '512GB': 7000, '1TB': 9000},
-                    'iPad Pro 11': {'128GB': 3500, '256GB': 4500, '512GB': 6000, '1TB': 8000},
-                    'iPad Air': {'64GB': 2500, '256GB': 3500},
-                    'iPad': {'64GB': 1800, '256GB': 2800},
-                },
-                '华为': {
-                    'MatePad Pro': {'128GB': 2500, '256GB': 3200},
-                    'MatePad': {'64GB': 1200, '128GB': 1800},
-                },
-            },
-            '笔记本': {
-                '苹果': {
-                    'MacBook Pro 16': {'512GB': 8000, '1TB': 10000, '2TB': 12000},
-                    'MacBook Pro 14': {'512GB': 7000, '1TB': 9000, '2TB': 11000},
-                    'MacBook Air': {'256GB': 5500, '512GB': 7000, '1TB': 9000},
-                },
-                '联想': {
-                    'ThinkPad X1': {'512GB': 4500, '1TB': 5500},
-                    '小新16': {'512GB': 3000, '1TB': 4000},
-                },
-            },
-        }
-        
-        # 获取基础价格
-        try:
-            base_price = base_prices.get(device_type, {}).get(brand, {}).get(model, {}).get(storage, 0)
-            if base_price == 0:
-                # 如果没有找到精确匹配，尝试模糊匹配
-                for key, value in base_prices.get(device_type, {}).get(brand, {}).items():
-                    if key in model or model in key:
-                        base_price = value.get(storage, list(value.values())[0] if value else 0)
-                        break
-        except:
-            base_price = 1000  # 默认价格
+        base_price = lookup_local_base_price(device_type, brand, model, storage)
         
         # 根据成色调整价格
         return self._adjust_by_condition(base_price, condition)
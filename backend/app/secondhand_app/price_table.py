@@ -0,0 +1,137 @@
+"""
+本地估价表
+把智能估价模型（价格表 × 存储/品牌/型号/成色系数）和基础价格表预先展开成一个扁平字典：
+    (设备类型, 标准品牌, 归一化型号, 存储, 成色) -> 价格
+本地估价只需要一次字典查找。价格表或校准系数发布新版本后，下一次查询时构建新表再整体替换，
+构建期间其他线程继续使用旧表
+"""
+import logging
+import sys
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from .model_index import normalize
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str, str, str]
+
+
+class PriceTableStats(NamedTuple):
+    versions: Tuple[int, int]  # (价格表版本, 校准系数版本)
+    entries: int
+    bytes: int                 # 字典、键元组、价格和字符串的总内存（近似值）
+
+
+class _Table(NamedTuple):
+    versions: Tuple[int, int]
+    prices: Dict[Key, float]
+    stats: PriceTableStats
+
+
+def _footprint(prices: Dict[Key, float]) -> int:
+    size = sys.getsizeof(prices)
+    strings = {}
+    for key, price in prices.items():
+        size += sys.getsizeof(key) + sys.getsizeof(price)
+        for part in key:
+            strings[id(part)] = part
+    return size + sum(sys.getsizeof(part) for part in strings.values())
+
+
+class LocalPriceTable:
+    """预先展开的本地估价表"""
+
+    def __init__(self):
+        self._table: Optional[_Table] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _versions():
+        from .price_model import price_model
+        return price_model.data_version, price_model.coefficients_version
+
+    def _current(self) -> _Table:
+        table = self._table
+        versions = self._versions()
+        if table is not None and table.versions == versions:
+            return table
+        # 已有旧表时不等待其他线程的构建
+        if not self._lock.acquire(blocking=table is None):
+            return table
+        try:
+            if self._table is None or self._table.versions != versions:
+                self._table = self._build()
+            return self._table
+        finally:
+            self._lock.release()
+
+    def _build(self) -> _Table:
+        from .price_data import price_data_store
+        from .price_model import price_model
+        from .price_service import CONDITION_MULTIPLIERS, LOCAL_BASE_PRICES
+
+        snapshot = price_model.snapshot
+        coefficients = price_data_store.get('coefficients')
+        prices: Dict[Key, float] = {}
+
+        # 基础价格表（存储为空时取该型号的第一个价格，与 lookup_local_base_price 一致）
+        for device_type, brands in LOCAL_BASE_PRICES.items():
+            for brand, models in brands.items():
+                for model, storages in models.items():
+                    model_key = normalize(model)
+                    entries = list(storages.items()) + [('', next(iter(storages.values())))]
+                    for storage, price in entries:
+                        for condition, multiplier in CONDITION_MULTIPLIERS.items():
+                            prices[(device_type, brand, model_key, storage, condition)] = price * multiplier
+
+        # 智能估价模型（手机），与 PriceEstimateModel.estimate 的计算顺序一致，覆盖基础价格表中的同名项
+        storages = list(price_model.storage_multipliers) + ['']
+        for brand, models in snapshot.data.items():
+            for model in models:
+                model_key = normalize(model)
+                for storage in storages:
+                    base_price = price_model._get_base_price(brand, model, storage, snapshot.data)
+                    if not base_price:
+                        continue
+                    for condition in price_model.condition_multipliers:
+                        storage_mult, brand_mult, condition_mult, model_mult = price_model.multipliers(
+                            brand, model, storage, condition, coefficients.data)
+                        price = base_price * storage_mult
+                        price = price * brand_mult * model_mult
+                        price = price * condition_mult
+                        prices[('手机', brand, model_key, storage, condition)] = round(price, 2)
+
+        versions = (snapshot.version, coefficients.version)
+        stats = PriceTableStats(versions, len(prices), _footprint(prices))
+        logger.info(f"本地估价表已构建: 版本 {versions}，{stats.entries} 项，约 {stats.bytes / 1024:.0f} KB")
+        return _Table(versions, prices, stats)
+
+    def lookup(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
+        """
+        查找本地估价，没有对应项时返回 None（调用方按原有方式计算）
+        品牌和型号为标准名称时只需一次字典查找，否则先通过型号索引解析
+        """
+        prices = self._current().prices
+        price = prices.get((device_type, brand, normalize(model), storage, condition))
+        if price is not None:
+            return price
+        if device_type == '手机':
+            from .price_model import price_model
+            match = price_model.match(brand, model)
+            if match is not None:
+                price = prices.get((device_type, match.brand, normalize(match.model), storage, condition))
+                if price is not None:
+                    return price
+        from .price_service import match_local_model
+        match = match_local_model(device_type, brand, model)
+        if match is None:
+            return None
+        return prices.get((device_type, match.brand, normalize(match.model), storage, condition))
+
+    def stats(self) -> PriceTableStats:
+        return self._current().stats
+
+
+# 全局实例
+local_price_table = LocalPriceTable()
@@ -2,11 +2,13 @@
 公开API服务集成
 支持接入多种公开的数据API服务
 """
-import requests
 import logging
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from django.conf import settings
-from django.core.cache import cache
+
+from .circuit_breaker import circuit_breakers
+from .price_cache import price_cache
+from .price_fanout import Provider, price_fanout, request_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -23,55 +25,37 @@ class PublicAPIService:
         支持多种数据源
         """
         cache_key = f"public_api_price_{device_type}_{brand}_{model}_{storage}_{condition}"
-        
-        # 检查缓存
-        cached_price = cache.get(cache_key)
-        if cached_price:
-            return cached_price
-        
-        # 尝试多个数据源
-        price = None
-        
-        # 1. 聚合数据API（如果有配置）
-        if getattr(settings, 'JUHE_API_KEY', None):
-            try:
-                price = self._juhe_api(brand, model, storage)
-                if price:
-                    cache.set(cache_key, price, self.cache_timeout)
-                    return price
-            except Exception as e:
-                logger.warning(f"聚合数据API失败: {e}")
-        
-        # 2. 百度API（如果有配置）
-        if getattr(settings, 'BAIDU_API_KEY', None):
-            try:
-                price = self._baidu_api(brand, model, storage)
-                if price:
-                    cache.set(cache_key, price, self.cache_timeout)
-                    return price
-            except Exception as e:
-                logger.warning(f"百度API失败: {e}")
-        
-        # 3. 阿里云API（如果有配置）
-        if getattr(settings, 'ALIYUN_API_KEY', None):
-            try:
-                price = self._aliyun_api(brand, model, storage)
-                if price:
-                    cache.set(cache_key, price, self.cache_timeout)
-                    return price
-            except Exception as e:
-                logger.warning(f"阿里云API失败: {e}")
-        
-        # 4. 使用公开的价格数据库（基于市场数据）
+        price, _ = price_cache.get_or_compute(
+            cache_key, lambda: self._estimate_uncached(brand, model, storage), fresh_ttl=self.cache_timeout
+        )
+        return price
+
+    def _estimate_uncached(self, brand: str, model: str, storage: str) -> Optional[float]:
+        # 已配置的外部数据源并发查询，截止时间内没有结果再使用本地市场价格数据
+        result = price_fanout.run(self.providers(brand, model, storage))
+        if result:
+            source, price = result
+            logger.info(f"公开API数据源 {source} 返回价格: {price}")
+            return price
+
+        # 使用公开的价格数据库（基于市场数据）
         try:
-            price = self._market_price_database(brand, model, storage)
-            if price:
-                cache.set(cache_key, price, self.cache_timeout)
-                return price
+            return self._market_price_database(brand, model, storage)
         except Exception as e:
             logger.warning(f"市场价格数据库失败: {e}")
         
         return None
+
+    def providers(self, brand: str, model: str, storage: str) -> List[Provider]:
+        """已配置密钥的外部数据源列表，供并发查询使用"""
+        providers = []
+        if getattr(settings, 'JUHE_API_KEY', None):
+            providers.append(('juhe', lambda: self._juhe_api(brand, model, storage)))
+        if getattr(settings, 'BAIDU_API_KEY', None):
+            providers.append(('baidu', lambda: self._baidu_api(brand, model, storage)))
+        if getattr(settings, 'ALIYUN_API_KEY', None):
+            providers.append(('aliyun', lambda: self._aliyun_api(brand, model, storage)))
+        return providers
     
     def _juhe_api(self, brand: str, model: str, storage: str) -> Optional[float]:
         """
@@ -92,7 +76,7 @@ class PublicAPIService:
                 'storage': storage,
             }
             
-            response = requests.get(api_url, params=params, timeout=10)
+            response = circuit_breakers.get('juhe').request('GET', api_url, params=params, timeout=request_timeout(10))
             if response.status_code == 200:
                 data = response.json()
                 if data.get('error_code') == 0:
@@ -122,7 +106,7 @@ class PublicAPIService:
                 'model': model,
             }
             
-            response = requests.get(api_url, params=params, timeout=10)
+            response = circuit_breakers.get('baidu').request('GET', api_url, params=params, timeout=request_timeout(10))
             if response.status_code == 200:
                 data = response.json()
                 # 根据实际API响应格式解析
@@ -159,7 +143,7 @@ class PublicAPIService:
             # signature = self._generate_aliyun_signature(params, api_secret)
             # params['signature'] = signature
             
-            response = requests.get(api_url, params=params, timeout=10)
+            response = circuit_breakers.get('aliyun').request('GET', api_url, params=params, timeout=request_timeout(10))
             if response.status_code == 200:
                 data = response.json()
                 price = data.get('price') or data.get('data', {}).get('price')
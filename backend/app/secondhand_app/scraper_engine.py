@@ -0,0 +1,342 @@
+"""
+异步爬取引擎（PriceScraperService 和离线爬取命令 crawl_prices 使用）
+- 所有爬取请求运行在同一个后台事件循环中，共用一个连接池：已安装 aiohttp 时使用 aiohttp，
+  否则使用 requests.Session 的连接池，在专用线程池中执行
+- 按主机限制并发数和请求间隔，离线爬取几千个型号时不会把单个站点打满
+- 流式读取响应，边读边解析，找到价格后立即停止读取，不再把整个页面读入内存再用正则扫描
+- 经过数据源熔断器：熔断中的平台直接跳过，网络异常、5xx、429 计为失败；请求被取消（估价截止时间到）时
+  只释放半开探测名额，不计成功或失败
+- fetch_body 读取完整响应内容（上限 max_bytes），供需要自行解析 JSON/HTML 的调用方使用
+"""
+import asyncio
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # 未安装 aiohttp 时在线程池中使用 requests 连接池
+    aiohttp = None
+
+from .circuit_breaker import circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'pool_size': 100,            # 连接池总连接数（requests 方式下同时也是线程数）
+    'per_host_concurrency': 4,   # 单个主机的最大并发请求数
+    'per_host_interval': 0.5,    # 同一主机两次请求开始的最小间隔（秒）
+    'chunk_size': 8192,          # 每次读取的字节数
+    'max_bytes': 2 * 1024 * 1024,  # 单个响应最多读取的字节数
+}
+
+PRICE_MIN = 100
+PRICE_MAX = 50000
+
+# JSON 中的价格字段（"price": 1234、"estimatePrice": "1,234.5"）或 class 含 price 的 HTML 元素（<span class="price">¥1234</span>）
+_PRICE_RE = re.compile(
+    rb'"(?:price|estimate_?price|estimated_?price|recycle_?price|max_?price)"\s*:\s*"?(\d[\d,]*(?:\.\d+)?)'
+    rb'|class="[^"]*price[^"]*"[^>]*>(?:\s|<[^>]+>|\xc2\xa5|\xef\xbf\xa5|&yen;)*(\d[\d,]*(?:\.\d+)?)',
+    re.IGNORECASE,
+)
+
+
+class PriceExtractor:
+    """
+    增量价格解析器：逐块喂入响应内容，找到 limit 个合理价格后 done 为 True
+    直接在字节上匹配，不需要解码；保留上一块末尾的一段内容，避免价格被切在两块中间
+    """
+
+    overlap = 1024  # 跨块保留的字节数
+    guard = 64      # 距离当前块末尾太近的匹配可能不完整，等下一块再确认
+
+    def __init__(self, limit: int = 1):
+        self.limit = limit
+        self.prices: List[float] = []
+        self.done = False
+        self._buffer = b''
+        self._pos = 0
+
+    def feed(self, chunk: bytes, final: bool = False) -> bool:
+        data = self._buffer + chunk
+        end = len(data) if final else len(data) - self.guard
+        for match in _PRICE_RE.finditer(data, self._pos):
+            if match.end() > end:
+                break
+            self._pos = match.end()
+            try:
+                price = float((match.group(1) or match.group(2)).replace(b',', b''))
+            except ValueError:
+                continue
+            if PRICE_MIN <= price <= PRICE_MAX:
+                self.prices.append(price)
+                if len(self.prices) >= self.limit:
+                    self.done = True
+                    return True
+        cut = max(len(data) - self.overlap, 0)
+        self._buffer = data[cut:]
+        self._pos = max(self._pos - cut, 0)
+        return False
+
+    def first(self) -> Optional[float]:
+        return self.prices[0] if self.prices else None
+
+    def trimmed_mean(self) -> Optional[float]:
+        """去掉最高和最低价后的平均价"""
+        prices = sorted(self.prices)
+        if len(prices) > 2:
+            prices = prices[1:-1]
+        return sum(prices) / len(prices) if prices else None
+
+
+class ScrapeJob(NamedTuple):
+    provider: str                   # 熔断器名称（scrape_aihuishou 等）
+    url: str
+    params: Optional[Dict] = None
+    limit: int = 1                  # 需要的价格个数
+    average: bool = False           # True 时返回去掉最高最低价后的平均价，否则返回第一个价格
+    key: Optional[Tuple] = None     # 调用方自定义标识，离线爬取时原样返回
+
+
+class _BodyReader:
+    """读取完整响应内容（与 PriceExtractor.feed 接口相同）"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def feed(self, chunk: bytes, final: bool = False) -> bool:
+        self.chunks.append(chunk)
+        return False
+
+    def body(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+class _HostLimiter:
+    """单个主机的并发数和请求间隔限制（只在事件循环线程中使用）"""
+
+    def __init__(self, concurrency: int, interval: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = interval
+        self.next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class ScrapeEngine:
+    """共享事件循环和连接池的爬取引擎"""
+
+    def __init__(self, config: Optional[Dict] = None, headers: Optional[Dict] = None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.headers = headers or {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostLimiter] = {}
+        self._session = None
+
+    # ---- 事件循环 ----
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    loop.set_default_executor(ThreadPoolExecutor(
+                        max_workers=self.config['pool_size'], thread_name_prefix='scrape-io'
+                    ))
+                    threading.Thread(target=loop.run_forever, name='scrape-engine', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """在引擎的事件循环中执行协程并等待结果（供同步代码调用）"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _limiter(self, url: str) -> _HostLimiter:
+        host = urlsplit(url).netloc
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = _HostLimiter(self.config['per_host_concurrency'], self.config['per_host_interval'])
+            self._hosts[host] = limiter
+        return limiter
+
+    def _get_session(self):
+        if self._session is None:
+            if aiohttp is not None:
+                connector = aiohttp.TCPConnector(
+                    limit=self.config['pool_size'], limit_per_host=self.config['per_host_concurrency']
+                )
+                self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+            else:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.config['pool_size'], pool_maxsize=self.config['pool_size'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(self.headers)
+                self._session = session
+        return self._session
+
+    # ---- 请求 ----
+
+    async def fetch_price(self, job: ScrapeJob, timeout: float = 10) -> Optional[float]:
+        """请求一个页面并流式解析价格，没有价格、熔断或请求失败时返回 None"""
+        extractor = PriceExtractor(job.limit)
+        if not await self._fetch(job, extractor, timeout):
+            return None
+        price = extractor.trimmed_mean() if job.average else extractor.first()
+        if price is not None:
+            logger.info(f"爬取 {job.provider} 获取价格: {price}")
+        return price
+
+    async def fetch_body(self, job: ScrapeJob, timeout: float = 10) -> Optional[bytes]:
+        """请求一个页面并返回响应内容（最多 max_bytes），熔断或请求失败时返回 None"""
+        reader = _BodyReader()
+        if not await self._fetch(job, reader, timeout):
+            return None
+        return reader.body()
+
+    async def _fetch(self, job: ScrapeJob, reader, timeout: float) -> bool:
+        """经过熔断器和主机限速发出请求，把响应内容逐块交给 reader.feed，返回是否得到 2xx/3xx 响应"""
+        breaker = circuit_breakers.get(job.provider)
+        if not breaker.allow():
+            return False
+        started = time.monotonic()
+        try:
+            async with self._limiter(job.url):
+                started = time.monotonic()
+                if aiohttp is not None:
+                    status = await self._stream_aiohttp(job, reader, timeout)
+                else:
+                    status = await asyncio.get_running_loop().run_in_executor(
+                        None, self._stream_requests, job, reader, timeout
+                    )
+        except asyncio.CancelledError:
+            # 没有结果，不计成功或失败；半开状态下释放探测名额，否则要等 probe_timeout 才能再次探测
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            breaker.record_failure(time.monotonic() - started)
+            logger.error(f"爬取 {job.provider} 异常: {e}")
+            return False
+
+        elapsed = time.monotonic() - started
+        if status >= 500 or status == 429:
+            breaker.record_failure(elapsed)
+            return False
+        breaker.record_success(elapsed)
+        if status >= 400:
+            logger.warning(f"爬取 {job.provider} 返回状态码 {status}")
+            return False
+        return True
+
+    async def _stream_aiohttp(self, job, reader, timeout) -> int:
+        session = self._get_session()
+        async with session.get(job.url, params=job.params, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status >= 400:
+                return response.status
+            read = 0
+            async for chunk in response.content.iter_chunked(self.config['chunk_size']):
+                read += len(chunk)
+                if reader.feed(chunk) or read >= self.config['max_bytes']:
+                    break
+            else:
+                reader.feed(b'', final=True)
+            return response.status
+
+    def _stream_requests(self, job, reader, timeout) -> int:
+        session = self._get_session()
+        with session.get(job.url, params=job.params, timeout=timeout, stream=True) as response:
+            if response.status_code >= 400:
+                return response.status_code
+            read = 0
+            for chunk in response.iter_content(self.config['chunk_size']):
+                read += len(chunk)
+                if reader.feed(chunk) or read >= self.config['max_bytes']:
+                    break
+            else:
+                reader.feed(b'', final=True)
+            return response.status_code
+
+    def fetch_price_sync(self, job: ScrapeJob, timeout: float = 10) -> Optional[float]:
+        """同步调用 fetch_price，超时返回 None"""
+        try:
+            return self.run(self.fetch_price(job, timeout), timeout + 1)
+        except FutureTimeoutError:
+            logger.warning(f"爬取 {job.provider} 超时")
+            return None
+
+    def fetch_body_sync(self, job: ScrapeJob, timeout: float = 10) -> Optional[bytes]:
+        """同步调用 fetch_body，超时返回 None"""
+        try:
+            return self.run(self.fetch_body(job, timeout), timeout + 1)
+        except FutureTimeoutError:
+            logger.warning(f"爬取 {job.provider} 超时")
+            return None
+
+    # ---- 离线批量爬取 ----
+
+    def crawl(self, jobs: Iterable[ScrapeJob], concurrency: int = 50,
+              timeout: float = 10) -> Iterator[Tuple[ScrapeJob, Optional[float]]]:
+        """
+        批量爬取，按完成顺序逐个返回 (job, 价格)
+        jobs 可以是生成器，同时进行的请求不超过 concurrency（再受每个主机的并发和间隔限制）
+        """
+        results: queue.Queue = queue.Queue()
+        done = object()
+        jobs = iter(jobs)
+        jobs_lock = threading.Lock()
+
+        def next_job():
+            with jobs_lock:
+                return next(jobs, None)
+
+        async def worker():
+            while True:
+                job = await asyncio.get_running_loop().run_in_executor(None, next_job)
+                if job is None:
+                    return
+                price = await self.fetch_price(job, timeout)
+                results.put_nowait((job, price))
+
+        async def run_all():
+            try:
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+            finally:
+                results.put_nowait(done)
+
+        future = asyncio.run_coroutine_threadsafe(run_all(), self.loop)
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                yield item
+            future.result()
+        finally:
+            future.cancel()
@@ -3,13 +3,16 @@
 ⚠️ 警告：爬取第三方平台可能违反服务条款，请谨慎使用
 建议：优先使用官方API接口
 """
-import requests
+import json
 import re
-import time
 import logging
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from bs4 import BeautifulSoup
-from django.core.cache import cache
+from django.conf import settings
+
+from .price_cache import price_cache
+from .price_fanout import Provider, price_fanout, request_timeout
+from .scraper_engine import ScrapeEngine, ScrapeJob
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +30,12 @@ class PriceScraperService:
             'Upgrade-Insecure-Requests': '1',
         }
         self.cache_timeout = 3600  # 1小时缓存
-        self.request_delay = 2  # 请求间隔（秒），避免过于频繁
+        # 各平台搜索页：(URL, 搜索参数名, 其他参数, 需要的价格个数)；请求间隔和并发见 SCRAPER_ENGINE
+        self.platforms = {
+            'scrape_aihuishou': ('https://www.aihuishou.com/search', 'q', {}, 1),
+            'scrape_huishoubao': ('https://www.huishoubao.com/search', 'keyword', {}, 1),
+            'scrape_xianyu': ('https://s.2.taobao.com/list/list.htm', 'q', {'sort': 'sale-desc'}, 10),
+        }
         
     def estimate(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
         """
@@ -35,154 +43,61 @@ class PriceScraperService:
         返回: 价格（元）或None
         """
         cache_key = f"scraped_price_{device_type}_{brand}_{model}_{storage}_{condition}"
-        
-        # 检查缓存
-        cached_price = cache.get(cache_key)
-        if cached_price:
-            logger.info(f"从缓存获取爬取价格: {cache_key} = {cached_price}")
-            return cached_price
-        
-        # 尝试多个平台
-        price = None
-        
-        # 1. 尝试爱回收
-        try:
-            price = self._scrape_aihuishou(device_type, brand, model, storage, condition)
-            if price:
-                cache.set(cache_key, price, self.cache_timeout)
-                return price
-        except Exception as e:
-            logger.warning(f"爬取爱回收失败: {e}")
-        
-        # 2. 尝试回收宝
-        try:
-            price = self._scrape_huishoubao(device_type, brand, model, storage, condition)
-            if price:
-                cache.set(cache_key, price, self.cache_timeout)
-                return price
-        except Exception as e:
-            logger.warning(f"爬取回收宝失败: {e}")
-        
-        # 3. 尝试闲鱼（作为参考）
-        try:
-            price = self._scrape_xianyu(device_type, brand, model, storage, condition)
-            if price:
-                cache.set(cache_key, price, self.cache_timeout)
-                return price
-        except Exception as e:
-            logger.warning(f"爬取闲鱼失败: {e}")
+        price, cached = price_cache.get_or_compute(
+            cache_key,
+            lambda: self._estimate_uncached(device_type, brand, model, storage, condition),
+            fresh_ttl=self.cache_timeout,
+        )
+        if cached:
+            logger.info(f"从缓存获取爬取价格: {cache_key} = {price}")
+        return price
+
+    def _estimate_uncached(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
+        # 多个平台并发爬取，取截止时间内最先返回的有效价格
+        result = price_fanout.run(self.providers(device_type, brand, model, storage, condition))
+        if result:
+            source, price = result
+            logger.info(f"爬取数据源 {source} 返回价格: {price}")
+            return price
         
         return None
+
+    def providers(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> List[Provider]:
+        """各平台爬取数据源，供并发查询使用"""
+        args = (device_type, brand, model, storage, condition)
+        return [
+            ('scrape_aihuishou', lambda: self._scrape_aihuishou(*args)),
+            ('scrape_huishoubao', lambda: self._scrape_huishoubao(*args)),
+            ('scrape_xianyu', lambda: self._scrape_xianyu(*args)),
+        ]
     
-    def _scrape_aihuishou(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
+    def job(self, provider: str, brand: str, model: str, storage: str, key=None) -> ScrapeJob:
+        """构建某个平台的爬取任务"""
+        url, query_param, extra_params, limit = self.platforms[provider]
+        params = {query_param: f"{brand} {model} {storage}".strip(), **extra_params}
+        return ScrapeJob(provider, url, params, limit=limit, average=limit > 1, key=key)
+    
+    def _scrape(self, provider: str, brand: str, model: str, storage: str) -> Optional[float]:
         """
-        爬取爱回收价格
-        注意：网站结构可能随时变化，需要定期更新
+        爬取单个平台的价格
+        注意：网站结构可能随时变化，价格解析规则见 scraper_engine.PriceExtractor
         """
-        try:
-            # 构建搜索URL（示例，实际URL需要根据网站结构调整）
-            search_query = f"{brand} {model} {storage}"
-            # 爱回收的搜索URL格式（需要根据实际情况调整）
-            url = f"https://www.aihuishou.com/search?q={search_query}"
-            
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 查找价格元素（需要根据实际HTML结构调整选择器）
-            # 示例选择器，实际需要检查网站HTML结构
-            price_elements = soup.select('.price, .estimated-price, [class*="price"]')
-            
-            for element in price_elements:
-                text = element.get_text(strip=True)
-                # 提取数字
-                price_match = re.search(r'[\d,]+', text.replace(',', ''))
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    # 验证价格合理性（通常在100-50000之间）
-                    if 100 <= price <= 50000:
-                        logger.info(f"从爱回收获取价格: {price}")
-                        return price
-            
-            # 如果没找到，尝试其他选择器
-            # 这里需要根据实际网站结构调整
-            
-        except Exception as e:
-            logger.error(f"爬取爱回收异常: {e}")
-        
-        return None
+        return scrape_engine.fetch_price_sync(self.job(provider, brand, model, storage), timeout=request_timeout(10))
+    
+    def _scrape_aihuishou(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
+        """爬取爱回收价格"""
+        return self._scrape('scrape_aihuishou', brand, model, storage)
     
     def _scrape_huishoubao(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
-        """
-        爬取回收宝价格
-        """
-        try:
-            search_query = f"{brand} {model} {storage}"
-            url = f"https://www.huishoubao.com/search?keyword={search_query}"
-            
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 查找价格元素
-            price_elements = soup.select('.price, .estimated-price, [class*="price"]')
-            
-            for element in price_elements:
-                text = element.get_text(strip=True)
-                price_match = re.search(r'[\d,]+', text.replace(',', ''))
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    if 100 <= price <= 50000:
-                        logger.info(f"从回收宝获取价格: {price}")
-                        return price
-            
-        except Exception as e:
-            logger.error(f"爬取回收宝异常: {e}")
-        
-        return None
+        """爬取回收宝价格"""
+        return self._scrape('scrape_huishoubao', brand, model, storage)
     
     def _scrape_xianyu(self, device_type: str, brand: str, model: str, storage: str, condition: str) -> Optional[float]:
         """
         爬取闲鱼价格（作为市场参考价）
-        注意：闲鱼是C2C平台，价格波动较大，仅供参考
+        注意：闲鱼是C2C平台，价格波动较大，取前10个价格去掉最高最低后的平均价，仅供参考
         """
-        try:
-            search_query = f"{brand} {model} {storage}"
-            # 闲鱼搜索URL
-            url = f"https://s.2.taobao.com/list/list.htm?q={search_query}&sort=sale-desc"
-            
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 查找价格元素
-            price_elements = soup.select('.price, .item-price, [class*="price"]')
-            
-            prices = []
-            for element in price_elements[:10]:  # 取前10个价格
-                text = element.get_text(strip=True)
-                price_match = re.search(r'[\d.]+', text)
-                if price_match:
-                    price = float(price_match.group())
-                    if 100 <= price <= 50000:
-                        prices.append(price)
-            
-            if prices:
-                # 计算平均价格（去除最高和最低）
-                prices.sort()
-                if len(prices) > 2:
-                    prices = prices[1:-1]
-                avg_price = sum(prices) / len(prices)
-                logger.info(f"从闲鱼获取平均价格: {avg_price}")
-                return avg_price
-            
-        except Exception as e:
-            logger.error(f"爬取闲鱼异常: {e}")
-        
-        return None
+        return self._scrape('scrape_xianyu', brand, model, storage)
     
     def _scrape_api_endpoint(self, url: str, params: Dict = None) -> Optional[Dict]:
         """
@@ -190,17 +105,20 @@ class PriceScraperService:
         注意：这需要分析网站的网络请求
         """
         try:
-            response = requests.get(url, params=params, headers=self.headers, timeout=10)
-            response.raise_for_status()
+            # 与页面爬取共用引擎的连接池、主机限速和熔断器
+            body = scrape_engine.fetch_body_sync(ScrapeJob('scrape_api', url, params), timeout=request_timeout(10))
+            if body is None:
+                return None
+            text = body.decode('utf-8', errors='replace')
             
             # 尝试解析JSON
             try:
-                return response.json()
+                return json.loads(text)
             except:
                 pass
             
             # 尝试解析HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(text, 'html.parser')
             # 查找JSON数据（可能在script标签中）
             scripts = soup.find_all('script')
             for script in scripts:
@@ -208,7 +126,6 @@ class PriceScraperService:
                     # 尝试提取JSON
                     json_match = re.search(r'\{.*"price".*\}', script.string)
                     if json_match:
-                        import json
                         try:
                             data = json.loads(json_match.group())
                             return data
@@ -223,4 +140,5 @@ class PriceScraperService:
 
 # 全局服务实例
 scraper_service = PriceScraperService()
+scrape_engine = ScrapeEngine(getattr(settings, 'SCRAPER_ENGINE', None), headers=scraper_service.headers)
 
@@ -0,0 +1,359 @@
+"""
+商品全文检索服务
+为商品列表的 search 参数提供倒排索引检索，替代 title/description 上的 icontains 全表扫描
+索引字段：标题、品牌、型号、描述（普通商品没有品牌/型号字段，对应列留空）
+支持两种后端（settings.SEARCH_BACKEND）：
+- sqlite_fts: 基于 SQLite FTS5 的独立索引文件，多进程共享（默认）
+- memory: 纯 Python 倒排索引，仅当前进程可见，适用于测试和单进程开发环境
+中文分词优先使用 jieba（如已安装），否则退化为二元切分（bigram）
+"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Q, When
+
+try:
+    import jieba
+except ImportError:  # 未安装 jieba 时使用二元切分
+    jieba = None
+
+logger = logging.getLogger(__name__)
+
+# 索引类型：普通商品与官方验货商品分别建索引
+INDEX_KINDS = ('product', 'verified_product')
+
+# 字段及其排序权重：标题 > 品牌/型号 > 描述
+FIELDS = ('title', 'brand', 'model', 'description')
+FIELD_WEIGHTS = {'title': 3.0, 'brand': 2.0, 'model': 2.0, 'description': 1.0}
+
+_CJK = r'\u4e00-\u9fff'
+_CHUNK_RE = re.compile(rf'[{_CJK}]+|[a-z]+|\d+')
+_CJK_RE = re.compile(rf'^[{_CJK}]+$')
+
+
+def tokenize(text: str, for_query: bool = False) -> List[str]:
+    """
+    把文本切分成索引词
+    - 英文按字母/数字边界切分并转小写（iPhone15Pro -> iphone, 15, pro）
+    - 中文使用 jieba 搜索引擎模式；没有 jieba 时切成二元组，并补上每段的末字，
+      保证任意单字都能作为某个词的前缀被检索到
+    """
+    if not text:
+        return []
+    tokens = []
+    for chunk in _CHUNK_RE.findall(text.lower()):
+        if not _CJK_RE.match(chunk):
+            tokens.append(chunk)
+            continue
+        if jieba is not None:
+            tokens.extend(w for w in jieba.cut_for_search(chunk) if w.strip())
+            continue
+        if len(chunk) == 1:
+            tokens.append(chunk)
+            continue
+        tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        if not for_query:
+            tokens.append(chunk[-1])
+    return tokens
+
+
+def _query_terms(query: str):
+    """
+    把用户输入转换成 (词, 是否前缀匹配) 列表
+    单个汉字和最后一个英文/数字词按前缀匹配，方便输入过程中的联想检索
+    """
+    tokens = tokenize(query, for_query=True)
+    terms = []
+    seen = set()
+    for i, token in enumerate(tokens):
+        prefix = (len(token) == 1 and bool(_CJK_RE.match(token))) or (
+            i == len(tokens) - 1 and not _CJK_RE.match(token)
+        )
+        if (token, prefix) not in seen:
+            seen.add((token, prefix))
+            terms.append((token, prefix))
+    return terms
+
+
+def build_document(kind: str, obj) -> Dict[str, str]:
+    """从商品对象提取索引文档"""
+    return {
+        'title': obj.title or '',
+        'brand': getattr(obj, 'brand', '') or '',
+        'model': getattr(obj, 'model', '') or '',
+        'description': obj.description or '',
+    }
+
+
+class MemorySearchBackend:
+    """纯 Python 倒排索引：词 -> {文档ID: 加权词频}"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {kind: defaultdict(dict) for kind in INDEX_KINDS}
+        self._doc_terms = {kind: {} for kind in INDEX_KINDS}
+
+    def upsert(self, kind: str, doc_id: int, document: Dict[str, str]):
+        weights = defaultdict(float)
+        for field in FIELDS:
+            for token in tokenize(document.get(field, '')):
+                weights[token] += FIELD_WEIGHTS[field]
+        with self._lock:
+            self._remove_locked(kind, doc_id)
+            postings = self._postings[kind]
+            for token, weight in weights.items():
+                postings[token][doc_id] = weight
+            self._doc_terms[kind][doc_id] = tuple(weights)
+
+    def delete(self, kind: str, doc_id: int):
+        with self._lock:
+            self._remove_locked(kind, doc_id)
+
+    def _remove_locked(self, kind, doc_id):
+        postings = self._postings[kind]
+        for token in self._doc_terms[kind].pop(doc_id, ()):
+            docs = postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del postings[token]
+
+    def clear(self, kind: str):
+        with self._lock:
+            self._postings[kind] = defaultdict(dict)
+            self._doc_terms[kind] = {}
+
+    def search(self, kind: str, terms, limit: int) -> List[int]:
+        with self._lock:
+            postings = self._postings[kind]
+            total = max(len(self._doc_terms[kind]), 1)
+            scores = None
+            for token, prefix in terms:
+                if prefix:
+                    matched = defaultdict(float)
+                    for key, docs in postings.items():
+                        if key.startswith(token):
+                            for doc_id, weight in docs.items():
+                                matched[doc_id] += weight
+                else:
+                    matched = postings.get(token, {})
+                if not matched:
+                    return []
+                idf = math.log(1 + total / len(matched))
+                if scores is None:
+                    scores = {doc_id: weight * idf for doc_id, weight in matched.items()}
+                else:
+                    # 所有词都必须命中（AND 语义，与原 icontains 的包含语义一致）
+                    scores = {
+                        doc_id: score + matched[doc_id] * idf
+                        for doc_id, score in scores.items() if doc_id in matched
+                    }
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [doc_id for doc_id, _ in ranked[:limit]]
+
+
+class SQLiteFTSSearchBackend:
+    """
+    SQLite FTS5 索引
+    文本在写入前已由 tokenize 切好词并以空格拼接，FTS5 只负责倒排和 bm25 排序，
+    因此中文分词规则在两种后端之间保持一致
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        if not self._schema_ready:
+            for kind in INDEX_KINDS:
+                conn.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {kind}_fts USING fts5("
+                    f"{', '.join(FIELDS)}, tokenize='unicode61')"
+                )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _table(kind):
+        if kind not in INDEX_KINDS:
+            raise ValueError(f'未知的索引类型: {kind}')
+        return f'{kind}_fts'
+
+    def upsert(self, kind: str, doc_id: int, document: Dict[str, str]):
+        self.upsert_many(kind, [(doc_id, document)])
+
+    def upsert_many(self, kind: str, items):
+        table = self._table(kind)
+        rows = [
+            (doc_id, *(' '.join(tokenize(document.get(field, ''))) for field in FIELDS))
+            for doc_id, document in items
+        ]
+        if not rows:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(f'DELETE FROM {table} WHERE rowid = ?', [(row[0],) for row in rows])
+            conn.executemany(
+                f'INSERT INTO {table} (rowid, {", ".join(FIELDS)}) VALUES (?, ?, ?, ?, ?)', rows
+            )
+
+    def delete(self, kind: str, doc_id: int):
+        conn = self._connect()
+        with conn:
+            conn.execute(f'DELETE FROM {self._table(kind)} WHERE rowid = ?', (doc_id,))
+
+    def clear(self, kind: str):
+        conn = self._connect()
+        with conn:
+            conn.execute(f'DELETE FROM {self._table(kind)}')
+
+    def search(self, kind: str, terms, limit: int) -> List[int]:
+        table = self._table(kind)
+        expression = ' '.join(
+            '"{}"{}'.format(token.replace('"', '""'), '*' if prefix else '')
+            for token, prefix in terms
+        )
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in FIELDS)
+        rows = self._connect().execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH ? '
+            f'ORDER BY bm25({table}, {weights}) LIMIT ?',
+            (expression, limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+class ProductSearchIndex:
+    """检索入口：负责文档提取、增量更新与查询"""
+
+    filter_chunk_size = 1000  # 按筛选条件过滤检索结果时每条查询的 id 数
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            name = getattr(settings, 'SEARCH_BACKEND', 'sqlite_fts')
+            if name == 'memory':
+                self._backend = MemorySearchBackend()
+            else:
+                path = getattr(settings, 'SEARCH_INDEX_PATH', None) or os.path.join(
+                    settings.BASE_DIR, 'data', 'search_index.sqlite3'
+                )
+                self._backend = SQLiteFTSSearchBackend(str(path))
+        return self._backend
+
+    def update(self, kind: str, obj):
+        """商品保存后调用：上架商品写入索引，其余状态从索引移除"""
+        try:
+            if obj.status == 'active':
+                self.backend.upsert(kind, obj.pk, build_document(kind, obj))
+            else:
+                self.backend.delete(kind, obj.pk)
+        except Exception as e:
+            logger.warning(f"更新搜索索引失败 {kind}#{obj.pk}: {e}")
+
+    def remove(self, kind: str, pk: int):
+        try:
+            self.backend.delete(kind, pk)
+        except Exception as e:
+            logger.warning(f"删除搜索索引失败 {kind}#{pk}: {e}")
+
+    def index_many(self, kind: str, objects: Iterable):
+        """批量写入（重建索引、批量导入时使用）"""
+        items = [(obj.pk, build_document(kind, obj)) for obj in objects if obj.status == 'active']
+        if hasattr(self.backend, 'upsert_many'):
+            self.backend.upsert_many(kind, items)
+        else:
+            for doc_id, document in items:
+                self.backend.upsert(kind, doc_id, document)
+        return len(items)
+
+    def rebuild(self, kind: str, queryset, chunk_size: int = 2000) -> int:
+        """清空并按主键顺序重建指定类型的索引"""
+        self.backend.clear(kind)
+        count = 0
+        batch = []
+        for obj in queryset.filter(status='active').order_by('pk').iterator(chunk_size=chunk_size):
+            batch.append(obj)
+            if len(batch) >= chunk_size:
+                count += self.index_many(kind, batch)
+                batch = []
+        if batch:
+            count += self.index_many(kind, batch)
+        return count
+
+    def search(self, kind: str, query: str, limit: Optional[int] = None) -> Optional[List[int]]:
+        """
+        返回按相关度排序的商品ID列表
+        无法分词或索引不可用时返回 None，调用方应回退到数据库模糊查询
+        """
+        terms = _query_terms(query)
+        if not terms:
+            return None
+        limit = limit or getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+        try:
+            return self.backend.search(kind, terms, limit)
+        except Exception as e:
+            logger.warning(f"搜索索引查询失败，回退到数据库查询: {e}")
+            return None
+
+    def filter_queryset(self, queryset, kind: str, query: str):
+        """
+        把检索结果应用到查询集上，并按相关度排序
+        queryset 应已带上分类、价格、成色等筛选条件：先用这些条件过滤检索结果再截断到 SEARCH_MAX_RESULTS，
+        否则宽泛的关键词加上筛选条件时，相关度靠前的结果都被筛掉，实际有匹配的商品却返回空列表
+        """
+        max_results = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+        max_candidates = max(getattr(settings, 'SEARCH_MAX_CANDIDATES', 20000), max_results)
+        limit = max_results
+        checked = 0
+        kept: List[int] = []
+        while True:
+            ids = self.search(kind, query, limit)
+            if ids is None:
+                return queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            # 只检查新增的候选，按相关度顺序保留满足筛选条件的商品
+            for start in range(checked, len(ids), self.filter_chunk_size):
+                chunk = ids[start:start + self.filter_chunk_size]
+                matched = set(queryset.filter(pk__in=chunk).values_list('pk', flat=True))
+                kept.extend(pk for pk in chunk if pk in matched)
+            checked = len(ids)
+            # 已够数、检索结果已全部检查或达到候选上限时停止
+            if len(kept) >= max_results or len(ids) < limit or limit >= max_candidates:
+                break
+            limit = min(limit * 4, max_candidates)
+
+        kept = kept[:max_results]
+        if not kept:
+            return queryset.none()
+        rank = Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(kept)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=kept).annotate(search_rank=rank).order_by('search_rank')
+
+
+# 全局索引实例
+search_index = ProductSearchIndex()
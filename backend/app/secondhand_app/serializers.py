@@ -1,12 +1,58 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import models
 from django.contrib.auth.password_validation import validate_password
+from django.core.files.storage import default_storage
 from .models import (
-    Category, Product, ProductImage, Order, Message, Favorite, Address, UserProfile, RecycleOrder,
+    Category, Product, ProductImage, Order, Message, Conversation, Favorite, Address, UserProfile, RecycleOrder,
     VerifiedProduct, VerifiedProductImage, VerifiedOrder, VerifiedFavorite, Shop
 )
 
 
+def _prime_favorite_state(serializer, objects):
+    """
+    批量加载当前用户对本页商品的收藏状态，写入 context['favorite_state']
+    每个列表只查询一次，替代逐行 exists() 查询
+    """
+    source = getattr(serializer, 'favorite_source', None)
+    request = serializer.context.get('request')
+    if source is None or not request or not request.user.is_authenticated:
+        return
+    favorite_model, attr = source
+    product_ids = {getattr(obj, attr, None) for obj in objects} - {None}
+    state = serializer.context.setdefault('favorite_state', {}).setdefault(favorite_model, {})
+    missing = product_ids - state.keys()
+    if not missing:
+        return
+    favorited = set(
+        favorite_model.objects.filter(user=request.user, product_id__in=missing)
+        .values_list('product_id', flat=True)
+    )
+    for product_id in missing:
+        state[product_id] = product_id in favorited
+
+
+def _resolve_favorite_state(serializer, favorite_model, product):
+    """读取预加载的收藏状态；单个对象序列化时回退为一次查询"""
+    request = serializer.context.get('request')
+    if not request or not request.user.is_authenticated:
+        return False
+    state = serializer.context.get('favorite_state', {}).get(favorite_model)
+    if state is not None and product.pk in state:
+        return state[product.pk]
+    return favorite_model.objects.filter(user=request.user, product=product).exists()
+
+
+class FavoriteStateListSerializer(serializers.ListSerializer):
+    """列表序列化器：序列化前按页批量加载收藏状态"""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(iterable)
+        _prime_favorite_state(self.child, items)
+        return super().to_representation(items)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """用户序列化器"""
     avatar = serializers.SerializerMethodField()
@@ -286,11 +332,16 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
 class CategorySerializer(serializers.ModelSerializer):
     """分类序列化器"""
-    product_count = serializers.IntegerField(read_only=True, help_text='该分类下的商品数量（热度）')
+    product_count = serializers.IntegerField(
+        source='active_product_count', read_only=True, help_text='该分类下的商品数量（热度）'
+    )
+    verified_product_count = serializers.IntegerField(
+        source='active_verified_product_count', read_only=True, help_text='该分类下的官方验货商品数量'
+    )
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description', 'product_count', 'created_at']
+        fields = ['id', 'name', 'description', 'product_count', 'verified_product_count', 'created_at']
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -301,11 +352,31 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ['owner','created_at','updated_at']
 
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    """
+    输出缩略图等尺寸的地址：{"thumb": {"webp": url, "jpeg": url}, "card": {...}}
+    尚未生成（或旧图片未补生成）时为空对象，前端使用 image 原图
+    """
+    variants = serializers.SerializerMethodField()
+
+    def get_variants(self, obj):
+        blob = obj.blob
+        if blob is None:
+            return {}
+        request = self.context.get('request')
+        result = {}
+        for key, name in blob.variants.items():
+            size, fmt = key.rsplit('.', 1)
+            url = default_storage.url(name)
+            result.setdefault(size, {})[fmt] = request.build_absolute_uri(url) if request else url
+        return result
+
+
+class ProductImageSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """商品图片序列化器"""
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_primary']
+        fields = ['id', 'image', 'is_primary', 'variants']
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -317,9 +388,11 @@ class ProductSerializer(serializers.ModelSerializer):
     shop_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     images = ProductImageSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
+    favorite_source = (Favorite, 'id')
 
     class Meta:
         model = Product
+        list_serializer_class = FavoriteStateListSerializer
         fields = [
             'id', 'seller', 'category', 'category_id', 'shop', 'shop_id', 'title', 'description',
             'price', 'original_price', 'condition', 'status', 'location',
@@ -329,10 +402,7 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['seller', 'view_count', 'created_at', 'updated_at']
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user, product=obj).exists()
-        return False
+        return _resolve_favorite_state(self, Favorite, obj)
 
     def create(self, validated_data):
         category_id = validated_data.pop('category_id', None)
@@ -359,9 +429,11 @@ class OrderSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
     settlement_account = serializers.SerializerMethodField()
+    favorite_source = (Favorite, 'product_id')
 
     class Meta:
         model = Order
+        list_serializer_class = FavoriteStateListSerializer
         fields = [
             'id', 'buyer', 'product', 'product_id', 'total_price', 'status',
             'shipping_address', 'shipping_name', 'shipping_phone', 'carrier', 'tracking_number', 'shipped_at', 'delivered_at', 'note',
@@ -410,18 +482,21 @@ class MessageSerializer(serializers.ModelSerializer):
     receiver_id = serializers.IntegerField(write_only=True)
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
+    favorite_source = (Favorite, 'product_id')
 
     class Meta:
         model = Message
+        list_serializer_class = FavoriteStateListSerializer
         fields = [
             'id', 'sender', 'receiver', 'receiver_id', 'product', 'product_id',
             'content', 'is_read', 'created_at'
         ]
-        read_only_fields = ['sender', 'is_read', 'created_at']
+        read_only_fields = ['sender', 'created_at']
 
     def create(self, validated_data):
         receiver_id = validated_data.pop('receiver_id')
         product_id = validated_data.pop('product_id', None)
+        validated_data.pop('is_read', None)  # 新消息总是未读
         
         try:
             receiver = User.objects.get(id=receiver_id)
@@ -439,15 +514,50 @@ class MessageSerializer(serializers.ModelSerializer):
         
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        # 已发送的消息不能更换接收方和商品，否则会话摘要和未读数对不上
+        validated_data.pop('receiver_id', None)
+        validated_data.pop('product_id', None)
+        return super().update(instance, validated_data)
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """会话列表序列化器（以当前用户视角输出对方用户和未读数）"""
+    user = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'user', 'last_message', 'unread_count']
+
+    def _current_user_id(self):
+        return self.context['request'].user.id
+
+    def get_user(self, obj):
+        return UserSerializer(obj.partner_of(self._current_user_id()), context=self.context).data
+
+    def get_last_message(self, obj):
+        return {
+            'id': obj.last_message_id,
+            'content': obj.last_message_preview,
+            'created_at': obj.last_message_at,
+        }
+
+    def get_unread_count(self, obj):
+        return obj.unread_count_for(self._current_user_id())
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     """收藏序列化器"""
     user = UserSerializer(read_only=True)
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
+    favorite_source = (Favorite, 'product_id')
 
     class Meta:
         model = Favorite
+        list_serializer_class = FavoriteStateListSerializer
         fields = ['id', 'user', 'product', 'product_id', 'created_at']
         read_only_fields = ['user', 'created_at']
 
@@ -560,11 +670,11 @@ class RecycleOrderSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class VerifiedProductImageSerializer(serializers.ModelSerializer):
+class VerifiedProductImageSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """官方验货商品图片序列化器"""
     class Meta:
         model = VerifiedProductImage
-        fields = ['id', 'image', 'is_primary']
+        fields = ['id', 'image', 'is_primary', 'variants']
 
 
 class VerifiedProductSerializer(serializers.ModelSerializer):
@@ -576,9 +686,11 @@ class VerifiedProductSerializer(serializers.ModelSerializer):
     shop_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     images = VerifiedProductImageSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
+    favorite_source = (VerifiedFavorite, 'id')
 
     class Meta:
         model = VerifiedProduct
+        list_serializer_class = FavoriteStateListSerializer
         fields = [
             'id', 'seller', 'category', 'category_id', 'shop', 'shop_id', 'title', 'description',
             'price', 'original_price', 'condition', 'status', 'location',
@@ -590,10 +702,7 @@ class VerifiedProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['seller', 'view_count', 'sales_count', 'verified_at', 'verified_by', 'created_at', 'updated_at']
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return VerifiedFavorite.objects.filter(user=request.user, product=obj).exists()
-        return False
+        return _resolve_favorite_state(self, VerifiedFavorite, obj)
 
     def create(self, validated_data):
         category_id = validated_data.pop('category_id', None)
@@ -618,9 +727,11 @@ class VerifiedOrderSerializer(serializers.ModelSerializer):
     buyer = UserSerializer(read_only=True)
     product = VerifiedProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
+    favorite_source = (VerifiedFavorite, 'product_id')
 
     class Meta:
         model = VerifiedOrder
+        list_serializer_class = FavoriteStateListSerializer
         fields = [
             'id', 'buyer', 'product', 'product_id', 'total_price', 'status',
             'shipping_address', 'shipping_name', 'shipping_phone', 'carrier', 'tracking_number', 'shipped_at', 'delivered_at', 'note',
@@ -646,9 +757,11 @@ class VerifiedFavoriteSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     product = VerifiedProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
+    favorite_source = (VerifiedFavorite, 'product_id')
 
     class Meta:
         model = VerifiedFavorite
+        list_serializer_class = FavoriteStateListSerializer
         fields = ['id', 'user', 'product', 'product_id', 'created_at']
         read_only_fields = ['user', 'created_at']
 
@@ -0,0 +1,98 @@
+"""
+模型信号处理
+- 商品保存/删除的事务提交后同步更新搜索索引（回滚时索引不变）
+- 商品上下架、换分类时增量维护分类的在售商品计数
+- 商品图片创建/删除时维护共享图片文件的引用数
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Category, ImageBlob, Product, ProductImage, VerifiedProduct, VerifiedProductImage
+from .search_service import search_index
+
+# 商品模型 -> 分类上对应的计数字段
+CATEGORY_COUNTER_FIELDS = {
+    Product: 'active_product_count',
+    VerifiedProduct: 'active_verified_product_count',
+}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search_index.update('product', instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search_index.remove('product', pk))
+
+
+@receiver(post_save, sender=VerifiedProduct)
+def index_verified_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search_index.update('verified_product', instance))
+
+
+@receiver(post_delete, sender=VerifiedProduct)
+def unindex_verified_product(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search_index.remove('verified_product', pk))
+
+
+def _counter_state(instance):
+    """返回 (是否在售, 分类ID)；字段被 defer 时返回 None，避免触发额外查询"""
+    if 'status' not in instance.__dict__ or 'category_id' not in instance.__dict__:
+        return None
+    return instance.status == 'active', instance.category_id
+
+
+def _shift_counter(field, category_id, delta):
+    if category_id:
+        Category.objects.filter(pk=category_id).update(**{field: F(field) + delta})
+
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=VerifiedProduct)
+def remember_counter_state(sender, instance, **kwargs):
+    instance._counter_state = _counter_state(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=VerifiedProduct)
+def update_category_counter(sender, instance, created, **kwargs):
+    field = CATEGORY_COUNTER_FIELDS[sender]
+    old = (False, None) if created else getattr(instance, '_counter_state', None)
+    new = _counter_state(instance)
+    if old is None or new is None:
+        # 加载时状态未知：只能按商品表重算涉及的分类
+        Category.rebuild_product_counters([instance.category_id])
+    elif old != new:
+        if old[0]:
+            _shift_counter(field, old[1], -1)
+        if new[0]:
+            _shift_counter(field, new[1], 1)
+    instance._counter_state = new
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=VerifiedProduct)
+def release_category_counter(sender, instance, **kwargs):
+    state = getattr(instance, '_counter_state', None) or _counter_state(instance)
+    if state and state[0]:
+        _shift_counter(CATEGORY_COUNTER_FIELDS[sender], state[1], -1)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=VerifiedProductImage)
+def reference_image_blob(sender, instance, created, **kwargs):
+    if created and instance.blob_id:
+        ImageBlob.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') + 1)
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=VerifiedProductImage)
+def release_image_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        ImageBlob.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') - 1)
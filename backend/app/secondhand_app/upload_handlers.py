@@ -0,0 +1,164 @@
+"""
+图片上传的流式处理（upload_images、upload_avatar 使用）
+- 边接收边校验：根据文件开头几个字节判断图片类型，累计大小超过上限立即跳过该文件，不再写入磁盘
+- 请求总大小（Content-Length）超过上限时直接返回 413，不读取请求体
+- 接收时同时计算 SHA-256，临时文件与 MEDIA_ROOT 在同一磁盘，保存到图片存储时直接移动文件，不再复制和重新读取
+- 每个文件的处理结果记录在 request.upload_results，接口原样返回
+"""
+import hashlib
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser
+
+# 文件头 -> 图片类型
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+]
+IMAGE_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp', 'bmp': '.bmp'}
+SNIFF_BYTES = 12
+FORM_OVERHEAD = 64 * 1024  # 表单字段和分隔符占用的字节数
+
+
+def detect_image_type(head: bytes) -> Optional[str]:
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = '上传内容超过大小限制'
+    default_code = 'upload_too_large'
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    """接收时已计算好 SHA-256 的临时文件，image_store 直接使用 sha256"""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None, dir=None):
+        ext = os.path.splitext(name)[1]
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=dir)
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.sha256: Optional[str] = None
+        self.upload_result: Optional[Dict] = None
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """逐块接收图片：校验类型和大小，边写临时文件边计算哈希"""
+
+    def __init__(self, request, max_size: int, max_files: int, results: List[Dict]):
+        super().__init__(request)
+        self.max_size = max_size
+        self.max_files = max_files
+        self.results = results
+        self.accepted = 0
+        self.temp_dir = getattr(settings, 'UPLOAD_TEMP_DIR', None) or os.path.join(settings.MEDIA_ROOT, '.upload_tmp')
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if hasattr(self, 'file'):
+            del self.file  # 上一个文件已交给 request.FILES，拒绝本文件时不能关闭它
+        self.result = {'field': field_name, 'name': file_name, 'size': 0, 'status': 'receiving'}
+        self.results.append(self.result)
+        self.kind = None
+        self.head = b''
+        self.digest = hashlib.sha256()
+        if self.accepted >= self.max_files:
+            self._reject(f'单次最多上传 {self.max_files} 个文件')
+        if content_length and content_length > self.max_size:
+            self._reject(f'文件超过 {self.max_size // 1024 // 1024}MB')
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.file = HashedUploadedFile(file_name, content_type, 0, charset, content_type_extra, dir=self.temp_dir)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.result['size'] = start + len(raw_data)
+        if self.result['size'] > self.max_size:
+            self._reject(f'文件超过 {self.max_size // 1024 // 1024}MB')
+        if self.kind is None:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._check_type()
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.result['status'] != 'receiving':
+            return None
+        if self.kind is None and not self._check_type(raise_skip=False):
+            return None
+        self.accepted += 1
+        self.result['status'] = 'received'
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        self.file.upload_result = self.result
+        # 按实际图片类型修正扩展名，不信任客户端提供的文件名
+        self.file.name = os.path.splitext(self.file.name)[0] + IMAGE_EXTENSIONS[self.kind]
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+    def _check_type(self, raise_skip=True) -> bool:
+        self.kind = detect_image_type(self.head)
+        if self.kind is None:
+            self._reject('不是支持的图片格式（JPEG/PNG/GIF/WebP/BMP）', raise_skip)
+            return False
+        return True
+
+    def _reject(self, detail, raise_skip=True):
+        self.result['status'] = 'rejected'
+        self.result['detail'] = detail
+        if hasattr(self, 'file'):
+            self.file.close()  # 删除临时文件
+            del self.file
+        if raise_skip:
+            raise SkipFile(detail)
+
+
+class ImageUploadParser(MultiPartParser):
+    """只接受图片的 multipart 解析器，用于上传图片的接口（parser_classes=[ImageUploadParser]）"""
+
+    max_size_setting = 'UPLOAD_IMAGE_MAX_SIZE'
+    max_files_setting = 'UPLOAD_IMAGE_MAX_FILES'
+    default_max_size = 10 * 1024 * 1024
+    default_max_files = 9
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        max_size = getattr(settings, self.max_size_setting, self.default_max_size)
+        max_files = getattr(settings, self.max_files_setting, self.default_max_files) \
+            if self.max_files_setting else self.default_max_files
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_size * max_files + FORM_OVERHEAD:
+            raise UploadTooLarge(f'上传内容超过 {(max_size * max_files) // 1024 // 1024}MB')
+
+        request.upload_results = []
+        request.upload_handlers = [ImageUploadHandler(request, max_size, max_files, request.upload_results)]
+        return super().parse(stream, media_type, parser_context)
+
+
+class AvatarUploadParser(ImageUploadParser):
+    max_size_setting = 'UPLOAD_AVATAR_MAX_SIZE'
+    max_files_setting = None
+    default_max_size = 2 * 1024 * 1024
+    default_max_files = 1
@@ -0,0 +1,142 @@
+"""
+商品浏览次数统计（Product、VerifiedProduct 的 view_count）
+- 详情接口只在内存中计数，不写数据库；同一用户（未登录按 IP + User-Agent）在 VIEW_COUNT_DEDUP_SECONDS 内
+  重复浏览同一商品只计一次，去重标记存放在缓存中（cache.add，多进程共享时需配置 Redis 缓存）
+- 未登录用户的 IP 取 REMOTE_ADDR；只有请求来自 VIEW_COUNT_TRUSTED_PROXIES 中的反向代理时才读取 X-Forwarded-For，
+  否则客户端可以每次伪造不同的 X-Forwarded-For 刷浏览次数
+- 每隔 VIEW_COUNT_FLUSH_INTERVAL 秒把本进程的计数批量写入数据库：按增量分组，
+  每组一条 UPDATE ... SET view_count = view_count + n WHERE id IN (...)，避免热门商品每次浏览都锁同一行
+- 进程退出时写入剩余计数；进程异常退出会丢失最多一个写入间隔的计数，浏览次数只用于排序和展示，不要求精确
+"""
+import atexit
+import hashlib
+import ipaddress
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple, Type, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def _in_networks(ip: str, networks) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+class ViewCounter:
+    max_pending = 5000  # 内存中待写入的商品数超过该值时立即写入
+    batch_size = 500  # 每条 UPDATE 的最大 id 数
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def dedup_seconds(self) -> int:
+        return getattr(settings, 'VIEW_COUNT_DEDUP_SECONDS', 1800)
+
+    @property
+    def flush_interval(self) -> float:
+        return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 30)
+
+    @property
+    def trusted_proxies(self) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+        return [ipaddress.ip_network(proxy, strict=False)
+                for proxy in getattr(settings, 'VIEW_COUNT_TRUSTED_PROXIES', [])]
+
+    def client_ip(self, request) -> str:
+        """
+        客户端 IP：REMOTE_ADDR 是可信代理时，从 X-Forwarded-For 右侧跳过可信代理，取第一个不可信的地址；
+        左侧的地址由客户端自己填写，不能信任
+        """
+        remote = request.META.get('REMOTE_ADDR', '')
+        proxies = self.trusted_proxies
+        if not proxies or not _in_networks(remote, proxies):
+            return remote
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        for hop in reversed(hops):
+            if not _in_networks(hop, proxies):
+                return hop
+        return hops[0] if hops else remote
+
+    def viewer_key(self, request) -> str:
+        """登录用户按用户 id，未登录按 IP + User-Agent"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'u{user.pk}'
+        ip = self.client_ip(request)
+        agent = request.META.get('HTTP_USER_AGENT', '')
+        return 'a' + hashlib.sha1(f'{ip}|{agent}'.encode()).hexdigest()[:16]
+
+    def record(self, instance: models.Model, request) -> bool:
+        """记录一次浏览，返回是否计数（卖家本人浏览和去重时间内的重复浏览不计）"""
+        if getattr(instance, 'seller_id', None) and instance.seller_id == getattr(request.user, 'pk', None):
+            return False
+        model = type(instance)
+        key = f'viewed:{model._meta.label_lower}:{instance.pk}:{self.viewer_key(request)}'
+        if self.dedup_seconds and not cache.add(key, 1, self.dedup_seconds):
+            return False
+        with self._lock:
+            self._counts[(model, instance.pk)] += 1
+            due = (time.monotonic() - self._last_flush >= self.flush_interval
+                   or len(self._counts) >= self.max_pending)
+        if due:
+            self.flush()
+        return True
+
+    def pending(self, instance: models.Model) -> int:
+        """本进程中还未写入数据库的浏览次数"""
+        with self._lock:
+            return self._counts.get((type(instance), instance.pk), 0)
+
+    def flush(self) -> int:
+        """把本进程的计数写入数据库，返回更新的行数"""
+        # 同一时间只有一个线程写入，其余线程直接返回，不在请求中等待
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                self._last_flush = time.monotonic()
+            if not counts:
+                return 0
+            try:
+                return self._write(counts)
+            except Exception as e:
+                # 写入失败时放回内存，下次再写
+                logger.warning(f"写入浏览次数失败: {e}")
+                with self._lock:
+                    self._counts.update(counts)
+                return 0
+        finally:
+            self._flush_lock.release()
+
+    def _write(self, counts: Counter) -> int:
+        groups: Dict[Tuple[Type[models.Model], int], list] = defaultdict(list)
+        for (model, pk), delta in counts.items():
+            groups[(model, delta)].append(pk)
+        updated = 0
+        for (model, delta), pks in groups.items():
+            # 按主键顺序加锁，多个进程同时写入时不会互相死锁
+            pks.sort()
+            for start in range(0, len(pks), self.batch_size):
+                updated += model.objects.filter(pk__in=pks[start:start + self.batch_size]).update(
+                    view_count=F('view_count') + delta)
+        return updated
+
+
+# 全局实例
+view_counter = ViewCounter()
+atexit.register(view_counter.flush)
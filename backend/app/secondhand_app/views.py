@@ -1,21 +1,29 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from django.contrib.auth.models import User
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q
 import logging
 
 logger = logging.getLogger(__name__)
 from .models import (
-    Category, Product, ProductImage, Order, Message, Favorite, Address, UserProfile, RecycleOrder,
+    Category, Product, ProductImage, Order, Message, Conversation, Favorite, Address, UserProfile, RecycleOrder,
     VerifiedProduct, VerifiedProductImage, VerifiedOrder, VerifiedFavorite, Wallet, WalletTransaction
 )
+from .image_store import store_image
+from .image_variants import variant_pipeline
+from .upload_handlers import AvatarUploadParser, ImageUploadParser
+from .pagination import CursorPaginationOptInMixin, KeysetPagination
+from .search_service import search_index
+from .view_counter import view_counter
 from .serializers import (
     UserSerializer, UserRegisterSerializer, UserUpdateSerializer,
     CategorySerializer, ProductSerializer, OrderSerializer,
-    MessageSerializer, FavoriteSerializer, AddressSerializer, RecycleOrderSerializer,
+    MessageSerializer, ConversationSerializer, FavoriteSerializer, AddressSerializer, RecycleOrderSerializer,
     VerifiedProductSerializer, VerifiedProductImageSerializer, VerifiedOrderSerializer, VerifiedFavoriteSerializer
 )
 
@@ -57,20 +65,24 @@ class UserViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+            parser_classes=[AvatarUploadParser])
     def upload_avatar(self, request):
-        """上传头像"""
+        """上传头像（流式接收，类型或大小不符时返回每个文件的处理结果）"""
         user = request.user
         profile, created = UserProfile.objects.get_or_create(user=user)
         
         if 'avatar' not in request.FILES:
-            return Response({'detail': '未提供头像文件'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'detail': '未提供可用的头像文件', 'uploads': request.upload_results},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        profile.avatar = request.FILES['avatar']
+        avatar = request.FILES['avatar']
+        profile.avatar = avatar
         profile.save()
+        avatar.upload_result['status'] = 'stored'
         
         serializer = UserSerializer(user, context={'request': request})
-        return Response(serializer.data)
+        return Response({**serializer.data, 'uploads': request.upload_results})
     
     @action(detail=False, methods=['post'], permission_classes=[])
     def login(self, request):
@@ -264,13 +276,13 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly]
     
     def get_queryset(self):
-        """按商品数量（热度）排序分类"""
-        return Category.objects.annotate(
-            product_count=Count('products', filter=Q(products__status='active'))
-        ).order_by('-product_count', 'name')
+        """按商品数量（热度）排序分类，计数字段由信号增量维护"""
+        # 不为 active_product_count 建索引：分类只有几十行，排序在内存中完成；
+        # 该字段随每次商品上下架更新，建索引只会增加这些写入的开销
+        return Category.objects.order_by('-active_product_count', 'name')
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CursorPaginationOptInMixin, viewsets.ModelViewSet):
     """商品视图集"""
     queryset = Product.objects.filter(status='active')
     serializer_class = ProductSerializer
@@ -280,7 +292,9 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = Product.objects.filter(status='active').select_related('category', 'seller')
+        queryset = Product.objects.filter(status='active').select_related(
+            'category', 'seller', 'seller__profile', 'shop'
+        ).prefetch_related('images__blob')
         
         # 分类筛选（优先处理，确保分类筛选生效）
         category = self.request.query_params.get('category', None)
@@ -292,13 +306,6 @@ class ProductViewSet(viewsets.ModelViewSet):
                 # 如果category不是数字，尝试按名称查找
                 queryset = queryset.filter(category__name=category)
         
-        # 搜索功能
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(description__icontains=search)
-            )
-        
         # 成色筛选（支持多个成色，用逗号分隔）
         condition = self.request.query_params.get('condition', None)
         if condition:
@@ -323,8 +330,19 @@ class ProductViewSet(viewsets.ModelViewSet):
             except (ValueError, TypeError):
                 pass
         
+        # 搜索功能（全文索引，按相关度排序）；放在其他筛选之后，检索结果先按筛选条件过滤再截断
+        search = self.request.query_params.get('search', None)
+        if search:
+            queryset = search_index.filter_queryset(queryset, 'product', search)
+        
         return queryset
 
+    def retrieve(self, request, *args, **kwargs):
+        """商品详情（浏览次数在内存中累计，定期批量写入，见 view_counter）"""
+        instance = self.get_object()
+        view_counter.record(instance, request)
+        return Response(self.get_serializer(instance).data)
+
     def perform_create(self, serializer):
         """创建商品时设置卖家为当前用户"""
         serializer.save(seller=self.request.user)
@@ -345,33 +363,44 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = ProductSerializer(product, context={'request': request})
         return Response(serializer.data)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated],
+            parser_classes=[ImageUploadParser])
     def upload_images(self, request, pk=None):
-        """上传商品图片"""
+        """上传商品图片（流式接收，返回每个文件的处理结果 uploads）"""
         product = self.get_object()
         if product.seller != request.user:
             return Response({'detail': '无权限操作'}, status=status.HTTP_403_FORBIDDEN)
         
         images = request.FILES.getlist('images')
         if not images:
-            return Response({'detail': '未提供图片文件'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'detail': '未提供可用的图片文件', 'uploads': request.upload_results},
+                            status=status.HTTP_400_BAD_REQUEST)
         
         # 如果没有主图，则设置第一张图片为主图
         has_primary = ProductImage.objects.filter(product=product, is_primary=True).exists()
         
+        blob_ids = []
         for i, image in enumerate(images):
             is_primary = not has_primary and i == 0
-            ProductImage.objects.create(
-                product=product,
-                image=image,
-                is_primary=is_primary
-            )
+            # 相同内容的图片只存一份；和图片记录在同一事务里写入，清理命令不会删掉刚取得的共享文件
+            with transaction.atomic():
+                blob = store_image(image, image.name)
+                product_image = ProductImage.objects.create(
+                    product=product,
+                    image=blob.file.name,
+                    blob=blob,
+                    is_primary=is_primary
+                )
+            blob_ids.append(blob.pk)
+            image.upload_result.update(status='stored', image_id=product_image.pk)
             
             if is_primary:
                 has_primary = True
+        # 后台生成缩略图，生成前列表页使用原图
+        variant_pipeline.schedule(blob_ids)
                 
         serializer = ProductSerializer(product, context={'request': request})
-        return Response(serializer.data)
+        return Response({**serializer.data, 'uploads': request.upload_results})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -400,7 +429,9 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_products(self, request):
         """获取当前用户发布的商品（包括所有状态）"""
-        products = Product.objects.filter(seller=request.user).order_by('-created_at')
+        products = Product.objects.filter(seller=request.user).select_related(
+            'seller', 'seller__profile', 'category', 'shop'
+        ).prefetch_related('images__blob').order_by('-created_at')
         serializer = ProductSerializer(products, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -412,11 +443,13 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(CursorPaginationOptInMixin, viewsets.ModelViewSet):
     """订单视图集"""
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
 
     def get_queryset(self):
         """只显示当前用户的订单，并优化查询"""
@@ -427,12 +460,12 @@ class OrderViewSet(viewsets.ModelViewSet):
             queryset = Order.objects.filter(
                 buyer=self.request.user,
                 product__condition__in=['new', 'like_new', 'good']
-            ).select_related('buyer', 'product', 'product__seller', 'product__category').prefetch_related('product__images')
+            ).select_related('buyer', 'product', 'product__seller', 'product__category').prefetch_related('product__images__blob')
         else:
             # 普通模式：返回买家和卖家订单
             queryset = Order.objects.filter(
                 Q(buyer=self.request.user) | Q(product__seller=self.request.user)
-            ).select_related('buyer', 'product', 'product__seller', 'product__category').prefetch_related('product__images').distinct()
+            ).select_related('buyer', 'product', 'product__seller', 'product__category').prefetch_related('product__images__blob').distinct()
         
         return queryset
 
@@ -649,11 +682,15 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(CursorPaginationOptInMixin, viewsets.ModelViewSet):
     """消息视图集"""
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+    history_page_size = 50  # with_user 默认每页条数
+    history_max_page_size = 200
 
     def get_queryset(self):
         """只显示当前用户发送或接收的消息"""
@@ -661,47 +698,100 @@ class MessageViewSet(viewsets.ModelViewSet):
             Q(sender=self.request.user) | Q(receiver=self.request.user)
         )
 
+    def perform_create(self, serializer):
+        """保存消息并在同一事务中更新会话摘要"""
+        with transaction.atomic():
+            message = serializer.save()
+            Conversation.record_message(message)
+
+    def perform_update(self, serializer):
+        """只有接收方可以修改已读状态；已读状态变化后重算会话的未读数"""
+        message = serializer.instance
+        was_read = message.is_read
+        if 'is_read' in serializer.validated_data and message.receiver_id != self.request.user.id:
+            raise PermissionDenied('只有接收方可以修改已读状态')
+        with transaction.atomic():
+            message = serializer.save()
+            if message.is_read != was_read:
+                Conversation.refresh_unread(message.receiver_id, message.sender_id)
+
+    def perform_destroy(self, instance):
+        """删除未读消息后重算会话的未读数"""
+        with transaction.atomic():
+            instance.delete()
+            if not instance.is_read:
+                Conversation.refresh_unread(instance.receiver_id, instance.sender_id)
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def conversations(self, request):
-        """获取对话列表（与当前用户有过消息交流的用户）"""
-        # 获取与当前用户有消息往来的用户
-        sent_messages = Message.objects.filter(sender=request.user).select_related('receiver')
-        received_messages = Message.objects.filter(receiver=request.user).select_related('sender')
-        
-        # 提取用户列表
-        user_ids = set()
-        for msg in sent_messages:
-            user_ids.add(msg.receiver.id)
-        for msg in received_messages:
-            user_ids.add(msg.sender.id)
-            
-        # 排除自己
-        user_ids.discard(request.user.id)
-        
-        # 获取用户信息
-        users = User.objects.filter(id__in=user_ids)
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        """
+        获取对话列表（按最近活跃时间倒序，游标分页）
+        当前用户可能在会话的 user_a 或 user_b 一侧，两侧各按索引取一页后归并
+        发给自己的会话 user_a 与 user_b 相同，只从 user_a 一侧取，避免出现两次
+        """
+        related = ('user_a', 'user_a__profile', 'user_b', 'user_b__profile')
+        querysets = [
+            Conversation.objects.filter(user_a=request.user, last_message_at__isnull=False).select_related(*related),
+            Conversation.objects.filter(user_b=request.user, last_message_at__isnull=False)
+            .exclude(user_a=request.user).select_related(*related),
+        ]
+        paginator = KeysetPagination()
+        page = paginator.paginate_union(querysets, request, 'last_message_at', descending=True)
+        serializer = ConversationSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def with_user(self, request):
-        """获取与指定用户的消息记录"""
+        """
+        获取与指定用户的消息记录（分页，结果按时间正序）
+        - 默认返回最新的 page_size 条
+        - before_id: 加载比该消息更早的一页（向上翻历史）
+        - after_id: 只返回比该消息更新的消息（断线重连后增量同步）
+        has_more 表示当前方向上是否还有更多消息
+        游标和排序都只用 id（消息 id 按发送先后递增），两者不会不一致
+        """
         user_id = request.query_params.get('user_id')
         if not user_id:
             return Response({'detail': '缺少用户ID参数'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
             other_user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+        except (User.DoesNotExist, ValueError):
             return Response({'detail': '用户不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            page_size = int(request.query_params.get('page_size', self.history_page_size))
+            before_id = request.query_params.get('before_id')
+            after_id = request.query_params.get('after_id')
+            before_id = int(before_id) if before_id else None
+            after_id = int(after_id) if after_id else None
+        except (TypeError, ValueError):
+            return Response({'detail': '分页参数无效'}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, self.history_max_page_size))
         
         messages = Message.objects.filter(
             (Q(sender=request.user) & Q(receiver=other_user)) |
             (Q(sender=other_user) & Q(receiver=request.user))
-        ).order_by('created_at')
+        ).select_related(
+            'sender', 'sender__profile', 'receiver', 'receiver__profile',
+            'product', 'product__seller', 'product__category', 'product__shop'
+        ).prefetch_related('product__images__blob')
+
+        if after_id is not None:
+            # 增量同步：从 after_id 往后按 id 正序取
+            rows = list(messages.filter(id__gt=after_id).order_by('id')[:page_size + 1])
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+        else:
+            # 最新一页或更早的一页：倒序取再翻转成正序
+            if before_id is not None:
+                messages = messages.filter(id__lt=before_id)
+            rows = list(messages.order_by('-id')[:page_size + 1])
+            has_more = len(rows) > page_size
+            rows = rows[:page_size][::-1]
         
-        serializer = MessageSerializer(messages, many=True, context={'request': request})
-        return Response(serializer.data)
+        serializer = MessageSerializer(rows, many=True, context={'request': request})
+        return Response({'results': serializer.data, 'has_more': has_more})
 
 
 class FavoriteViewSet(viewsets.ModelViewSet):
@@ -712,7 +802,9 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """只显示当前用户的收藏"""
-        return Favorite.objects.filter(user=self.request.user)
+        return Favorite.objects.filter(user=self.request.user).select_related(
+            'user', 'product', 'product__seller', 'product__category'
+        ).prefetch_related('product__images__blob')
 
     def create(self, request, *args, **kwargs):
         """添加收藏"""
@@ -844,91 +936,76 @@ class RecycleOrderViewSet(viewsets.ModelViewSet):
             'unit': '元'
         })
 
+    ESTIMATE_BATCH_MAX = 500  # 单次批量估价的最大设备数
+
+    @action(detail=False, methods=['post'], permission_classes=[], url_path='estimate-batch')
+    def estimate_batch(self, request):
+        """
+        批量估价接口（回收自助机、后台批量调价）
+        请求体 {"items": [{device_type, brand, model, storage, condition, release_year}, ...]}，
+        每项单独返回价格、来源（api/model/local）和型号匹配置信度，单项失败不影响其他项；
+        不请求外部数据源，外部数据源的价格只在已缓存时使用
+        """
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'items 必须是非空数组'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.ESTIMATE_BATCH_MAX:
+            return Response({'detail': f'单次最多估价 {self.ESTIMATE_BATCH_MAX} 台设备'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        valid, positions, results = [], [], []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not all(item.get(field) for field in ('device_type', 'brand', 'model')):
+                results.append({'index': i, 'error': '缺少必要参数'})
+                continue
+            release_year = item.get('release_year')
+            if release_year:
+                try:
+                    release_year = int(release_year)
+                except (TypeError, ValueError):
+                    results.append({'index': i, 'error': 'release_year 格式错误'})
+                    continue
+            valid.append({
+                'device_type': str(item['device_type']),
+                'brand': str(item['brand']),
+                'model': str(item['model']),
+                'storage': str(item.get('storage') or ''),
+                'condition': str(item.get('condition') or 'good'),
+                'release_year': release_year or None,
+            })
+            positions.append(i)
+            results.append(None)
+
+        from .price_service import price_service
+        bonus = self._calculate_bonus()
+        for i, estimate in zip(positions, price_service.estimate_many(valid)):
+            if not estimate['price']:
+                results[i] = {'index': i, 'error': '无法估算价格，请检查设备信息是否正确'}
+                continue
+            price = float(estimate['price'])
+            results[i] = {
+                'index': i,
+                'estimated_price': price,
+                'bonus': float(bonus),
+                'total_price': price + bonus,
+                'source': estimate['source'],
+                'confidence': estimate['confidence'],
+                'matched_brand': estimate['brand'],
+                'matched_model': estimate['model'],
+            }
+
+        return Response({
+            'results': results,
+            'count': len(results),
+            'priced': sum(1 for result in results if 'error' not in result),
+            'currency': 'CNY',
+            'unit': '元'
+        })
+
     def _calculate_price(self, device_type, brand, model, storage, condition):
-        """计算基础价格"""
-        # 基础价格表（示例数据，实际应该从数据库或配置文件读取）
-        base_prices = {
-            '手机': {
-                '苹果': {
-                    'iPhone 15 Pro Max': {'128GB': 6500, '256GB': 7200, '512GB': 8500, '1TB': 10000},
-                    'iPhone 15 Pro': {'128GB': 5500, '256GB': 6200, '512GB': 7500},
-                    'iPhone 15': {'128GB': 4500, '256GB': 5200, '512GB': 6500},
-                    'iPhone 14 Pro Max': {'128GB': 5500, '256GB': 6200, '512GB': 7500, '1TB': 9000},
-                    'iPhone 14 Pro': {'128GB': 4800, '256GB': 5500, '512GB': 6800},
-                    'iPhone 14': {'128GB': 3800, '256GB': 4500, '512GB': 5800},
-                    'iPhone 13 Pro Max': {'128GB': 4500, '256GB': 5200, '512GB': 6500, '1TB': 8000},
-                    'iPhone 13 Pro': {'128GB': 4000, '256GB': 4700, '512GB': 6000},
-                    'iPhone 13': {'128GB': 3200, '256GB': 3900, '512GB': 5200},
-                },
-                '华为': {
-                    'Mate 60 Pro': {'256GB': 4500, '512GB': 5500, '1TB': 6500},
-                    'Mate 60': {'256GB': 3800, '512GB': 4800},
-                    'P60 Pro': {'256GB': 3500, '512GB': 4500},
-                    'P60': {'128GB': 2800, '256GB': 3500},
-                },
-                '小米': {
-                    '小米14 Pro': {'256GB': 2800, '512GB': 3500, '1TB': 4200},
-                    '小米14': {'256GB': 2200, '512GB': 2800},
-                    '小米13 Ultra': {'256GB': 3000, '512GB': 3800},
-                    '小米13': {'128GB': 1800, '256GB': 2400, '512GB': 3000},
-                },
-                'vivo': {
-                    'X100 Pro': {'256GB': 3200, '512GB': 4000},
-                    'X100': {'256GB': 2500, '512GB': 3200},
-                },
-                'OPPO': {
-                    'Find X6 Pro': {'256GB': 3000, '512GB': 3800},
-                    'Find X6': {'256GB': 2400, '512GB': 3000},
-                },
-            },
-            '平板': {
-                '苹果': {
-                    'iPad Pro 12.9': {'128GB': 4500, '256GB': 5500, '512GB': 7000, '1TB': 9000},
-                    'iPad Pro 11': {'128GB': 3500, '256GB': 4500, '512GB': 6000, '1TB': 8000},
-                    'iPad Air': {'64GB': 2500, '256GB': 3500},
-                    'iPad': {'64GB': 1800, '256GB': 2800},
-                },
-                '华为': {
-                    'MatePad Pro': {'128GB': 2500, '256GB': 3200},
-                    'MatePad': {'64GB': 1200, '128GB': 1800},
-                },
-            },
-            '笔记本': {
-                '苹果': {
-                    'MacBook Pro 16': {'512GB': 8000, '1TB': 10000, '2TB': 12000},
-                    'MacBook Pro 14': {'512GB': 7000, '1TB': 9000, '2TB': 11000},
-                    'MacBook Air': {'256GB': 5500, '512GB': 7000, '1TB': 9000},
-                },
-                '联想': {
-                    'ThinkPad X1': {'512GB': 4500, '1TB': 5500},
-                    '小新16': {'512GB': 3000, '1TB': 4000},
-                },
-            },
-        }
-
-        # 获取基础价格
-        try:
-            base_price = base_prices.get(device_type, {}).get(brand, {}).get(model, {}).get(storage, 0)
-            if base_price == 0:
-                # 如果没有找到精确匹配，尝试模糊匹配
-                for key, value in base_prices.get(device_type, {}).get(brand, {}).items():
-                    if key in model or model in key:
-                        base_price = value.get(storage, list(value.values())[0] if value else 0)
-                        break
-        except:
-            base_price = 1000  # 默认价格
-
-        # 根据成色调整价格
-        condition_multipliers = {
-            'new': 1.0,
-            'like_new': 0.85,
-            'good': 0.7,
-            'fair': 0.5,
-            'poor': 0.3
-        }
-        multiplier = condition_multipliers.get(condition, 0.7)
-
-        return base_price * multiplier
+        """计算基础价格（本地估价表）"""
+        from .price_table import local_price_table
+        return local_price_table.lookup(device_type, brand, model, storage, condition) or 0
 
     def _calculate_bonus(self):
         """计算加价（活动加价）"""
@@ -936,30 +1013,25 @@ class RecycleOrderViewSet(viewsets.ModelViewSet):
         return 150
 
 
-class VerifiedProductViewSet(viewsets.ModelViewSet):
+class VerifiedProductViewSet(CursorPaginationOptInMixin, viewsets.ModelViewSet):
     """官方验货商品视图集"""
     queryset = VerifiedProduct.objects.all()
     serializer_class = VerifiedProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    ordering_fields = ['price', 'created_at', 'view_count']
+    ordering = ['-created_at']
 
     def get_queryset(self):
         """获取商品列表，支持筛选"""
         queryset = VerifiedProduct.objects.filter(status='active').select_related(
             'seller', 'category'
-        ).prefetch_related('images').order_by('-created_at')
+        ).prefetch_related('images__blob').order_by('-created_at')
         
         # 分类筛选
         category_id = self.request.query_params.get('category')
         if category_id:
             queryset = queryset.filter(category_id=category_id)
         
-        # 搜索
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(description__icontains=search)
-            )
-        
         # 成色筛选
         condition = self.request.query_params.get('condition')
         if condition:
@@ -978,43 +1050,65 @@ class VerifiedProductViewSet(viewsets.ModelViewSet):
         if max_price:
             queryset = queryset.filter(price__lte=max_price)
         
-        # 排序
-        ordering = self.request.query_params.get('ordering', '-created_at')
+        # 搜索（全文索引，按相关度排序）；放在其他筛选之后，检索结果先按筛选条件过滤再截断
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = search_index.filter_queryset(queryset, 'verified_product', search)
+        
+        # 排序（搜索时未指定排序则保留相关度顺序）
+        ordering = self.request.query_params.get('ordering', None if search else '-created_at')
         if ordering:
             queryset = queryset.order_by(ordering)
         
         return queryset
 
+    def retrieve(self, request, *args, **kwargs):
+        """商品详情（浏览次数在内存中累计，定期批量写入，见 view_counter）"""
+        instance = self.get_object()
+        view_counter.record(instance, request)
+        return Response(self.get_serializer(instance).data)
+
     def perform_create(self, serializer):
         """创建商品"""
         serializer.save(seller=self.request.user)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated],
+            parser_classes=[ImageUploadParser])
     def upload_images(self, request, pk=None):
-        """上传商品图片"""
+        """上传商品图片（流式接收，返回每个文件的处理结果 uploads）"""
         product = self.get_object()
         if product.seller != request.user:
             return Response({'detail': '无权限操作'}, status=status.HTTP_403_FORBIDDEN)
         
         images = request.FILES.getlist('images')
         if not images:
-            return Response({'detail': '未提供图片文件'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'detail': '未提供可用的图片文件', 'uploads': request.upload_results},
+                            status=status.HTTP_400_BAD_REQUEST)
         
         has_primary = VerifiedProductImage.objects.filter(product=product, is_primary=True).exists()
         
+        blob_ids = []
         for i, image in enumerate(images):
             is_primary = not has_primary and i == 0
-            VerifiedProductImage.objects.create(
-                product=product,
-                image=image,
-                is_primary=is_primary
-            )
+            # 相同内容的图片只存一份；和图片记录在同一事务里写入，清理命令不会删掉刚取得的共享文件
+            with transaction.atomic():
+                blob = store_image(image, image.name)
+                product_image = VerifiedProductImage.objects.create(
+                    product=product,
+                    image=blob.file.name,
+                    blob=blob,
+                    is_primary=is_primary
+                )
+            blob_ids.append(blob.pk)
+            image.upload_result.update(status='stored', image_id=product_image.pk)
             
             if is_primary:
                 has_primary = True
+        # 后台生成缩略图，生成前列表页使用原图
+        variant_pipeline.schedule(blob_ids)
                 
         serializer = VerifiedProductSerializer(product, context={'request': request})
-        return Response(serializer.data)
+        return Response({**serializer.data, 'uploads': request.upload_results})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -1043,22 +1137,26 @@ class VerifiedProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_products(self, request):
         """获取当前用户发布的官方验货商品"""
-        products = VerifiedProduct.objects.filter(seller=request.user).order_by('-created_at')
+        products = VerifiedProduct.objects.filter(seller=request.user).select_related(
+            'seller', 'seller__profile', 'category', 'shop'
+        ).prefetch_related('images__blob').order_by('-created_at')
         serializer = VerifiedProductSerializer(products, many=True, context={'request': request})
         return Response(serializer.data)
 
 
-class VerifiedOrderViewSet(viewsets.ModelViewSet):
+class VerifiedOrderViewSet(CursorPaginationOptInMixin, viewsets.ModelViewSet):
     """官方验货订单视图集"""
     queryset = VerifiedOrder.objects.all()
     serializer_class = VerifiedOrderSerializer
     permission_classes = [IsAuthenticated]
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
 
     def get_queryset(self):
         """只显示当前用户的订单"""
         return VerifiedOrder.objects.filter(
             buyer=self.request.user
-        ).select_related('buyer', 'product', 'product__seller', 'product__category').prefetch_related('product__images')
+        ).select_related('buyer', 'product', 'product__seller', 'product__category').prefetch_related('product__images__blob')
 
     def perform_create(self, serializer):
         """创建订单"""
@@ -1171,4 +1269,4 @@ class VerifiedFavoriteViewSet(viewsets.ModelViewSet):
         """只显示当前用户的收藏"""
         return VerifiedFavorite.objects.filter(
             user=self.request.user
-        ).select_related('user', 'product', 'product__seller').prefetch_related('product__images').order_by('-created_at')
+        ).select_related('user', 'product', 'product__seller').prefetch_related('product__images__blob').order_by('-created_at')
@@ -135,6 +135,27 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 商品图片尺寸：上传后在后台进程池中按固定宽度生成 WebP/JPEG 图片，列表页使用小图
+# 已有图片用 python manage.py generate_image_variants 补生成
+IMAGE_VARIANTS = {
+    'thumb': 240,   # 缩略图宽度（像素）
+    'card': 480,    # 商品卡片宽度（像素）
+}
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_WORKERS = 2  # 生成图片的进程数
+
+# 图片上传（upload_images、upload_avatar）：流式接收，边收边校验类型和大小，超限的文件不写入磁盘
+UPLOAD_IMAGE_MAX_SIZE = 10 * 1024 * 1024   # 单张商品图片上限（字节）
+UPLOAD_IMAGE_MAX_FILES = 9                 # 单次最多上传的商品图片数
+UPLOAD_AVATAR_MAX_SIZE = 2 * 1024 * 1024   # 头像上限（字节）
+UPLOAD_TEMP_DIR = None  # 上传临时目录，默认 MEDIA_ROOT/.upload_tmp（与图片存储同一磁盘，保存时直接移动文件）
+
+# 商品浏览次数：详情接口在进程内累计，定期批量写入 view_count（见 app/secondhand_app/view_counter.py）
+VIEW_COUNT_DEDUP_SECONDS = 30 * 60  # 同一用户在该时间内重复浏览同一商品只计一次
+VIEW_COUNT_FLUSH_INTERVAL = 30      # 写入数据库的间隔（秒）
+# 反向代理的 IP 或网段（如 ['127.0.0.1', '10.0.0.0/8']），只有来自这些地址的请求才读取 X-Forwarded-For
+VIEW_COUNT_TRUSTED_PROXIES = []
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -177,15 +198,63 @@ CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins for development
 CORS_ALLOW_CREDENTIALS = True
 
 # Channel Layers (Redis configuration for WebSocket)
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# 设置环境变量 CHANNEL_REDIS_URL（如 redis://127.0.0.1:6379/1）后使用 Redis 通道层，
+# user_{id} 用户组由所有 ASGI 进程共享，可以启动多个 worker；未设置时使用进程内通道层（仅限单进程开发）
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL', '')
+CHANNEL_LAYER_OPTIONS = {
+    'capacity': 200,        # 每个通道最多积压的消息数，超出后发送方收到 ChannelFull（背压）
+    'expiry': 60,           # 未被消费的消息保留秒数
+    'group_expiry': 3600,   # 组成员过期秒数：进程崩溃后残留的成员自动清理，在线连接会定期续期
+    'channel_capacity': {
+        'http.request': 50,
+        'websocket.send*': 200,
     },
 }
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'prefix': 'secondhand',
+                **CHANNEL_LAYER_OPTIONS,
+            },
+        },
+    }
+else:
+    # 进程内通道层不会编译 channel_capacity 的通配符，只传入统一的 capacity
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {k: v for k, v in CHANNEL_LAYER_OPTIONS.items() if k != 'channel_capacity'},
+        },
+    }
+
+# Cache
+# 设置环境变量 CACHE_REDIS_URL（如 redis://127.0.0.1:6379/2）后使用 Redis 缓存，
+# 估价缓存、数据源熔断状态等由所有 worker 共享；未设置时使用 Django 默认的进程内缓存
+# （各进程各自缓存，warm_price_cache 预热命令无法使用，会直接报错）
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'secondhand',
+        },
+    }
 
 # User model
 AUTH_USER_MODEL = 'auth.User'
 
+# ========== 商品搜索配置 ==========
+# 搜索后端：'sqlite_fts'（SQLite FTS5 索引文件，多进程共享）或 'memory'（进程内索引，测试用）
+SEARCH_BACKEND = 'sqlite_fts'
+SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'data', 'search_index.sqlite3')  # 含 -wal/-shm 文件，已加入 .gitignore
+SEARCH_MAX_RESULTS = 1000  # 单次搜索最多返回的商品数
+SEARCH_MAX_CANDIDATES = 20000  # 带筛选条件时最多检查的检索结果数（先过滤再截断到 SEARCH_MAX_RESULTS）
+# 首次部署或切换后端后执行: python manage.py rebuild_search_index
+
 # Price API Settings
 # 优先顺序: CUSTOM > JUHE > RAPIDAPI > BAIDU > ALIYUN > APISPACE > SCRAPER
 PRICE_API_PROVIDER = 'SCRAPER'  # 默认使用爬取服务
@@ -230,6 +299,12 @@ APISPACE_PRICE_API_URL = ''  # 价格查询API地址
 # ⚠️ 爬取服务配置（仅供学习研究，不推荐用于生产环境）
 # 警告：爬取第三方平台可能违反服务条款和法律，请谨慎使用
 ENABLE_PRICE_SCRAPER = False  # 是否启用爬取服务
+# 爬取引擎：共用连接池，按主机限制并发和请求间隔（离线爬取命令 crawl_prices 同样适用）
+SCRAPER_ENGINE = {
+    'pool_size': 100,
+    'per_host_concurrency': 4,
+    'per_host_interval': 0.5,
+}
 
 # 手动配置的API端点（如果找到了实际的API地址，可以在这里配置）
 SCRAPER_API_URL = ''  # 例如: 'https://www.aihuishou.com/api/v1/estimate'
@@ -237,6 +312,31 @@ SCRAPER_API_METHOD = 'POST'  # GET 或 POST
 SCRAPER_API_KEY = ''  # API密钥（如果需要）
 SCRAPER_API_SECRET = ''  # API密钥（如果需要）
 
+# ========== 估价数据源并发查询 ==========
+# 第三方API、公开API、爬取服务同时查询，单次估价最多等待 PRICE_ESTIMATE_DEADLINE 秒
+PRICE_ESTIMATE_DEADLINE = 3.0
+PRICE_FANOUT_POLICY = 'first'  # 'first': 取最先返回的有效价格；'quorum': 取多个数据源的中位数
+PRICE_FANOUT_QUORUM = 2        # quorum 模式下需要的有效价格数
+PRICE_FANOUT_WORKERS = 16      # 每个进程用于查询数据源的线程数
+
+# 估价缓存：过期后先返回旧价格并在后台刷新（stale-while-revalidate），同一键只有一个请求访问数据源
+PRICE_CACHE_TIMEOUT = 3600        # 价格新鲜期（秒）
+PRICE_CACHE_STALE_TTL = 86400     # 过期后仍可返回旧值的时长（秒）
+PRICE_CACHE_NEGATIVE_TTL = 300    # 查不到价格时的缓存时长（秒）
+
+# 数据源熔断器：窗口内失败率超过阈值后暂停请求该数据源，状态可在管理后台 /admin-api/providers/health 查看
+PRICE_CIRCUIT_BREAKER = {
+    'window': 60,          # 失败率统计窗口（秒）
+    'min_requests': 5,     # 窗口内至少有这么多请求才判断失败率
+    'failure_rate': 0.5,   # 失败率阈值
+    'open_seconds': 30,    # 熔断持续时间，之后放行一个探测请求
+}
+
+# 价格表版本：update_price_database --file 发布新版本（或 --rollback）后，各 worker 最多 PRICE_DATA_POLL_INTERVAL 秒内切换，无需重启
+# 生效版本号通过共享缓存（CACHE_REDIS_URL）通知；使用进程内缓存时各 worker 每次检查都直接查询数据库
+PRICE_DATA_POLL_INTERVAL = 5     # 检查生效版本号的间隔（秒）
+PRICE_DATA_VERSION_TTL = 60      # 版本号在共享缓存中的有效期（秒），缓存过期后从数据库读取
+
 # ========== 支付宝支付配置 ==========
 # 文档：https://opendocs.alipay.com/common/02kkv7
 # 应用管理：https://open.alipay.com/
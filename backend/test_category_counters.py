@@ -0,0 +1,131 @@
+"""
+测试分类在售商品计数
+验证新建、上下架、更换分类、删除商品后，信号增量维护的计数与按商品表重算的结果一致，
+以及绕过信号的批量更新可由 rebuild_category_counters 命令修正
+"""
+import os
+import sys
+from io import StringIO
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Count, Q
+
+from app.secondhand_app.models import Category, Product, VerifiedProduct
+
+USERNAME = 'category_counter_test'
+CATEGORY_NAMES = ['计数测试-手机', '计数测试-电脑']
+
+
+def recount(category):
+    """按商品表实际统计的 (在售商品数, 在售验货商品数)"""
+    return (Product.objects.filter(category=category, status='active').count(),
+            VerifiedProduct.objects.filter(category=category, status='active').count())
+
+
+def counters(category):
+    category.refresh_from_db()
+    return category.active_product_count, category.active_verified_product_count
+
+
+def assert_consistent(step, *categories):
+    for category in categories:
+        assert counters(category) == recount(category), (step, category.name, counters(category), recount(category))
+
+
+def setup():
+    Product.objects.filter(seller__username=USERNAME).delete()
+    VerifiedProduct.objects.filter(seller__username=USERNAME).delete()
+    seller, _ = User.objects.get_or_create(username=USERNAME)
+    phones, laptops = (Category.objects.get_or_create(name=name)[0] for name in CATEGORY_NAMES)
+    Category.rebuild_product_counters([phones.pk, laptops.pk])
+    return seller, phones, laptops
+
+
+def create(model, seller, category, status='active'):
+    return model.objects.create(seller=seller, category=category, title='计数测试', description='计数测试',
+                                price=100, location='上海', status=status)
+
+
+def test_signal_counters():
+    seller, phones, laptops = setup()
+    products = [create(Product, seller, phones) for _ in range(3)] + [create(Product, seller, laptops, 'sold')]
+    verified = create(VerifiedProduct, seller, laptops)
+    assert counters(phones) == (3, 0) and counters(laptops) == (0, 1)
+    assert_consistent('新建', phones, laptops)
+
+    # 下架、重新上架、已下架商品再改状态
+    products[0].status = 'sold'
+    products[0].save()
+    assert counters(phones) == (2, 0)
+    products[0].status = 'active'
+    products[0].save(update_fields=['status'])
+    products[3].status = 'inactive'
+    products[3].save()
+    assert_consistent('状态变更', phones, laptops)
+
+    # 更换分类（在售）、更换分类同时下架、重新读取后修改
+    products[1].category = laptops
+    products[1].save()
+    assert counters(phones) == (2, 0) and counters(laptops) == (1, 1)
+    product = Product.objects.get(pk=products[2].pk)
+    product.category, product.status = laptops, 'sold'
+    product.save()
+    verified.category = phones
+    verified.save()
+    assert_consistent('更换分类', phones, laptops)
+
+    # 只读取部分字段后保存：状态未知，按商品表重算该分类
+    product = Product.objects.only('pk', 'title').get(pk=products[0].pk)
+    product.title = '计数测试-改名'
+    product.save(update_fields=['title'])
+    assert_consistent('部分字段', phones, laptops)
+
+    # 删除（在售、已下架、批量删除）
+    products[0].delete()
+    products[3].delete()
+    VerifiedProduct.objects.filter(seller=seller).delete()
+    assert_consistent('删除', phones, laptops)
+    Product.objects.filter(seller=seller).delete()
+    assert counters(phones) == (0, 0) and counters(laptops) == (0, 0)
+    print("✓ 新建、上下架、更换分类、删除后计数与按商品表重算的结果一致")
+
+
+def test_rebuild_command():
+    seller, phones, laptops = setup()
+    for _ in range(4):
+        create(Product, seller, phones)
+    create(VerifiedProduct, seller, laptops)
+    # queryset.update 不触发信号，计数与实际不一致
+    moved = list(Product.objects.filter(seller=seller).values_list('pk', flat=True)[:2])
+    Product.objects.filter(pk__in=moved).update(category=laptops)
+    assert counters(phones) == (4, 0) and recount(phones) == (2, 0)
+
+    out = StringIO()
+    call_command('rebuild_category_counters', stdout=out)
+    assert '已重算' in out.getvalue()
+    assert_consistent('重算', phones, laptops)
+    total = Category.objects.filter(pk__in=[phones.pk, laptops.pk]).aggregate(
+        n=Count('products', filter=Q(products__status='active')))['n']
+    assert counters(phones)[0] + counters(laptops)[0] == total == 4
+    print("✓ 绕过信号的批量更新由 rebuild_category_counters 修正")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("分类商品计数测试")
+    print("=" * 60)
+    try:
+        test_signal_counters()
+        test_rebuild_command()
+    finally:
+        Product.objects.filter(seller__username=USERNAME).delete()
+        VerifiedProduct.objects.filter(seller__username=USERNAME).delete()
+        Category.objects.filter(name__in=CATEGORY_NAMES).delete()
+    print("\n测试完成！")
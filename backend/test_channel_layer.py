@@ -0,0 +1,118 @@
+"""
+测试 Redis 通道层的跨进程分发、背压和组过期
+使用 fakeredis 提供的进程内 TCP 假服务（pip install -r requirements-dev.txt），无需真实 Redis；未安装时跳过
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.conf import settings
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+try:
+    import lupa  # noqa: F401  组过期等操作使用 Lua 脚本，需要 fakeredis[lua]
+    from fakeredis import TcpFakeServer
+except ImportError:  # 未安装 fakeredis[lua] 时跳过
+    TcpFakeServer = None
+
+
+def _start_fake_server():
+    server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f'redis://{host}:{port}/0'
+
+
+def _make_layer(url, **overrides):
+    """按 settings 中的通道层参数构造 Redis 通道层（每个实例相当于一个 ASGI 进程）"""
+    options = dict(settings.CHANNEL_LAYER_OPTIONS, **overrides)
+    return RedisChannelLayer(hosts=[url], prefix='secondhand-test', **options)
+
+
+async def _cross_worker_group_send(url):
+    worker_a, worker_b, worker_c = _make_layer(url), _make_layer(url), _make_layer(url)
+    # 同一用户在两个进程上各有一个连接
+    channel_b = await worker_b.new_channel()
+    channel_c = await worker_c.new_channel()
+    await worker_b.group_add('user_42', channel_b)
+    await worker_c.group_add('user_42', channel_c)
+
+    await worker_a.group_send('user_42', {'type': 'new_message', 'content': 'hello'})
+    received_b = await asyncio.wait_for(worker_b.receive(channel_b), 3)
+    received_c = await asyncio.wait_for(worker_c.receive(channel_c), 3)
+    assert received_b['content'] == received_c['content'] == 'hello'
+    for layer in (worker_a, worker_b, worker_c):
+        await layer.close_pools()
+    print("✓ 跨进程 group_send 到达所有连接")
+
+
+async def _back_pressure(url):
+    sender, receiver = _make_layer(url, capacity=5), _make_layer(url, capacity=5)
+    channel = await receiver.new_channel()
+    sent = 0
+    try:
+        for i in range(10):
+            await sender.send(channel, {'type': 'new_message', 'i': i})
+            sent += 1
+    except ChannelFull:
+        pass
+    assert sent == 5, sent
+    await sender.close_pools()
+    await receiver.close_pools()
+    print(f"✓ 通道积压达到 capacity={sent} 后抛出 ChannelFull")
+
+
+async def _group_expiry(url):
+    group_expiry = 2
+    layer = _make_layer(url, group_expiry=group_expiry)
+    stale = await layer.new_channel()
+    live = await layer.new_channel()
+    await layer.group_add('user_7', stale)
+    await layer.group_add('user_7', live)
+    # live 连接在过期前续期（ChatConsumer.refresh_group_membership 的行为），stale 模拟崩溃进程残留的成员
+    # channels_redis 按整秒清理（int(time.time()) - group_expiry），stale 至少要等 group_expiry + 1 秒才一定被清理
+    for _ in range(4):
+        await asyncio.sleep((group_expiry + 1.4) / 4)
+        await layer.group_add('user_7', live)
+
+    await layer.group_send('user_7', {'type': 'new_message'})
+    await asyncio.wait_for(layer.receive(live), 3)
+    try:
+        await asyncio.wait_for(layer.receive(stale), 0.5)
+        raise AssertionError('过期的组成员仍然收到了消息')
+    except asyncio.TimeoutError:
+        pass
+    await layer.close_pools()
+    print("✓ 未续期的组成员超过 group_expiry 后被移除，续期的连接不受影响")
+
+
+def test_redis_channel_layer():
+    if TcpFakeServer is None:
+        print("⚠ 跳过通道层测试：未安装 fakeredis[lua]，请执行 pip install -r requirements-dev.txt")
+        return
+    server, url = _start_fake_server()
+    try:
+        start = time.time()
+        asyncio.run(_cross_worker_group_send(url))
+        asyncio.run(_back_pressure(url))
+        asyncio.run(_group_expiry(url))
+        print(f"耗时 {time.time() - start:.1f}s")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("Redis 通道层测试（fakeredis 进程内服务）")
+    print("=" * 70)
+    test_redis_channel_layer()
+    print("测试完成！")
@@ -0,0 +1,182 @@
+"""
+测试聊天 WebSocket 连接（ChatConsumer）
+验证令牌校验、消息写库和会话摘要、不带 type 的消息按聊天消息处理、已读请求合并写库，
+以及在线状态只能订阅有过会话的用户、输入提示只能发给有过会话的用户
+使用进程内通道层，无需 Redis
+"""
+import asyncio
+import json
+import os
+import sys
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from app.consumers import ChatConsumer
+from app.secondhand_app.models import Conversation, Message
+
+USERNAMES = ['ws_alice', 'ws_bob', 'ws_carol', 'ws_inactive']
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def setup_users():
+    users = []
+    for name in USERNAMES:
+        user, _ = User.objects.get_or_create(username=name)
+        user.is_active = name != 'ws_inactive'
+        user.save(update_fields=['is_active'])
+        users.append(user)
+    Message.objects.filter(sender__in=users).delete()
+    Conversation.objects.filter(user_a__in=users).delete()
+    Conversation.objects.filter(user_b__in=users).delete()
+    return users
+
+
+async def connect(token):
+    path = '/ws/chat/' + (f'?token={token}' if token else '')
+    communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), path)
+    connected, _ = await communicator.connect()
+    return communicator if connected else None
+
+
+async def receive(communicator, timeout=2):
+    return json.loads(await communicator.receive_from(timeout))
+
+
+async def receive_until(communicator, event_type, timeout=2):
+    """跳过其他事件（在线状态等），返回第一条指定类型的事件"""
+    while True:
+        event = await receive(communicator, timeout)
+        if event['type'] == event_type:
+            return event
+
+
+async def assert_silent(communicator, timeout=0.3):
+    assert await communicator.receive_nothing(timeout), await communicator.receive_from()
+
+
+async def check_authentication(alice, inactive):
+    assert await connect(None) is None
+    assert await connect('not-a-jwt') is None
+    assert await connect(str(AccessToken.for_user(inactive))) is None
+    communicator = await connect(str(AccessToken.for_user(alice)))
+    assert communicator is not None
+    await communicator.disconnect()
+    print("✓ 缺少令牌、令牌无效、用户已停用时拒绝连接，JWT 访问令牌可以连接")
+
+
+async def check_messages_and_reads(alice, bob):
+    alice_ws = await connect(str(AccessToken.for_user(alice)))
+    bob_ws = await connect(str(AccessToken.for_user(bob)))
+
+    # 不带 type 的消息按 chat_message 处理
+    ids = []
+    for i in range(3):
+        await alice_ws.send_to(text_data=json.dumps({'receiver_id': bob.pk, 'content': f'在吗 {i}'}))
+        sent = await receive_until(alice_ws, 'new_message')
+        received = await receive_until(bob_ws, 'new_message')
+        assert sent == received and received['sender_id'] == alice.pk and received['content'] == f'在吗 {i}'
+        ids.append(received['id'])
+
+    @database_sync_to_async
+    def stored():
+        conversation = Conversation.objects.get(user_a_id=min(alice.pk, bob.pk), user_b_id=max(alice.pk, bob.pk))
+        unread = Message.objects.filter(pk__in=ids, is_read=False).count()
+        return (set(Message.objects.filter(pk__in=ids).values_list('sender_id', 'receiver_id')),
+                conversation.unread_count_for(bob.pk), conversation.last_message_id, unread)
+
+    pairs, unread_count, last_id, unread = await stored()
+    assert pairs == {(alice.pk, bob.pk)} and unread_count == 3 and last_id == ids[-1] and unread == 3
+    print("✓ 不带 type 的消息写入数据库并更新会话摘要，双方都收到 new_message")
+
+    await alice_ws.send_to(text_data=json.dumps({'receiver_id': 999999999, 'content': '查无此人'}))
+    assert (await receive(alice_ws))['message'] == 'Receiver not found'
+
+    # 延迟内的多次已读请求合并为一次写库和一条回执
+    await bob_ws.send_to(text_data=json.dumps({'type': 'mark_read', 'partner_id': alice.pk, 'up_to_id': ids[0]}))
+    await bob_ws.send_to(text_data=json.dumps({'type': 'mark_read', 'partner_id': alice.pk, 'up_to_id': ids[2]}))
+    await bob_ws.send_to(text_data=json.dumps({'type': 'mark_read', 'partner_id': alice.pk, 'up_to_id': ids[1]}))
+    await asyncio.sleep(ChatConsumer.read_flush_delay / 3)
+    assert (await stored())[3] == 3  # 尚未写库
+    receipt = await receive_until(alice_ws, 'read_receipt')
+    assert receipt['reader_id'] == bob.pk and receipt['up_to_id'] == ids[2], receipt
+    await assert_silent(alice_ws)  # 只有一条回执
+    _, unread_count, _, unread = await stored()
+    assert unread_count == 0 and unread == 0
+    print("✓ 多次 mark_read 合并为一次写库，只发送一条已读回执，未读数清零")
+
+    await alice_ws.disconnect()
+    await bob_ws.disconnect()
+
+
+async def check_presence(alice, bob, carol):
+    alice_ws = await connect(str(AccessToken.for_user(alice)))
+    bob_ws = await connect(str(AccessToken.for_user(bob)))
+    carol_ws = await connect(str(AccessToken.for_user(carol)))
+
+    # carol 与 alice 没有会话：订阅被忽略，收不到在线状态
+    await carol_ws.send_to(text_data=json.dumps({'type': 'presence_subscribe', 'user_ids': [alice.pk]}))
+    await assert_silent(carol_ws)
+
+    # bob 与 alice 有会话：订阅后收到在线探测的回复，alice 断开后收到下线通知
+    await bob_ws.send_to(text_data=json.dumps({'type': 'presence_subscribe', 'user_ids': [alice.pk, carol.pk]}))
+    event = await receive_until(bob_ws, 'presence')
+    assert event == {'type': 'presence', 'user_id': alice.pk, 'online': True}, event
+    await assert_silent(bob_ws)  # carol 不在 bob 的会话中
+
+    await alice_ws.disconnect()
+    event = await receive_until(bob_ws, 'presence')
+    assert event == {'type': 'presence', 'user_id': alice.pk, 'online': False}, event
+    await assert_silent(carol_ws)
+    print("✓ 在线状态只能订阅有过会话的用户，上线探测和下线通知正确送达")
+
+    await bob_ws.disconnect()
+    await carol_ws.disconnect()
+
+
+async def check_typing(alice, bob, carol):
+    alice_ws = await connect(str(AccessToken.for_user(alice)))
+    bob_ws = await connect(str(AccessToken.for_user(bob)))
+    carol_ws = await connect(str(AccessToken.for_user(carol)))
+
+    # carol 与 alice 没有会话：输入提示不转发
+    await carol_ws.send_to(text_data=json.dumps({'type': 'typing', 'receiver_id': alice.pk}))
+    await assert_silent(alice_ws)
+
+    await bob_ws.send_to(text_data=json.dumps({'type': 'typing', 'receiver_id': alice.pk}))
+    event = await receive_until(alice_ws, 'typing')
+    assert event['sender_id'] == bob.pk and event['is_typing'] is True, event
+    print("✓ 输入提示只转发给有过会话的用户")
+
+    for communicator in (alice_ws, bob_ws, carol_ws):
+        await communicator.disconnect()
+
+
+async def main(alice, bob, carol, inactive):
+    await check_authentication(alice, inactive)
+    await check_messages_and_reads(alice, bob)
+    await check_presence(alice, bob, carol)
+    await check_typing(alice, bob, carol)
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("聊天 WebSocket 测试")
+    print("=" * 60)
+    alice, bob, carol, inactive = setup_users()
+    ChatConsumer.read_flush_delay = 0.5
+    try:
+        with override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER):
+            asyncio.run(main(alice, bob, carol, inactive))
+    finally:
+        setup_users()
+    print("\n测试完成！")
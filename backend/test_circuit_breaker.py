@@ -0,0 +1,157 @@
+"""
+测试估价数据源熔断器
+用本地桩HTTP服务模拟故障和恢复，验证失败率熔断、半开探测、跨实例共享状态和并发查询时跳过熔断数据源
+"""
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from app.admin_api.jwt import encode as jwt_encode
+from app.admin_api.models import AdminAuditLog, AdminRole, AdminUser
+from app.secondhand_app.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, circuit_breakers
+)
+from app.secondhand_app.price_fanout import PriceFanout
+
+CONFIG = {'window': 10, 'buckets': 5, 'min_requests': 3, 'failure_rate': 0.5, 'open_seconds': 1}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    status = 500
+    hits = 0
+
+    def do_GET(self):
+        StubHandler.hits += 1
+        self.send_response(StubHandler.status)
+        self.end_headers()
+        self.wfile.write(b'{"price": 1000}')
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def test_trip_and_recover(url):
+    cache.clear()
+    StubHandler.status = 500
+    breaker = CircuitBreaker('test_provider', CONFIG)
+    for _ in range(3):
+        breaker.request('GET', url, timeout=1)
+    assert breaker.state() == OPEN, breaker.state()
+    print("✓ 失败率超过阈值后熔断")
+
+    hits = StubHandler.hits
+    try:
+        breaker.request('GET', url, timeout=1)
+        raise AssertionError('熔断状态下不应发出请求')
+    except CircuitOpenError:
+        pass
+    assert StubHandler.hits == hits
+    # 另一个实例（模拟另一个 worker）通过缓存看到同样的状态
+    assert CircuitBreaker('test_provider', CONFIG).state() == OPEN
+    print("✓ 熔断期间请求直接拒绝，状态通过缓存共享")
+
+    time.sleep(1.1)
+    assert breaker.state() == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow(), '半开状态只允许一个探测请求'
+    cache.delete('circuit:test_provider:probe')
+    print("✓ 熔断时间结束后进入半开，只放行一个探测")
+
+    StubHandler.status = 200
+    breaker.request('GET', url, timeout=1)
+    assert breaker.state() == CLOSED
+    snapshot = breaker.snapshot()
+    assert snapshot['failures'] == 0 and snapshot['latency_ewma_ms'] is not None, snapshot
+    print(f"✓ 探测成功后关闭熔断器: {snapshot}")
+
+
+def test_failed_probe_reopens(url):
+    cache.clear()
+    StubHandler.status = 503
+    breaker = CircuitBreaker('test_probe', CONFIG)
+    for _ in range(3):
+        breaker.request('GET', url, timeout=1)
+    time.sleep(1.1)
+    breaker.request('GET', url, timeout=1)
+    assert breaker.state() == OPEN
+    print("✓ 探测失败后重新熔断")
+
+
+def test_fanout_skips_open_provider():
+    cache.clear()
+    calls = []
+    breaker = CircuitBreaker('dead_provider', CONFIG)
+    breaker._trip('测试')
+
+    def dead():
+        calls.append('dead')
+        return 1.0
+
+    result = PriceFanout(max_workers=2).run([('dead_provider', dead), ('alive', lambda: 2000)], deadline=1)
+    assert result == ('alive', 2000.0), result
+    assert not calls
+    print("✓ 并发查询时跳过熔断中的数据源")
+
+
+def admin_client(username, permissions):
+    role, _ = AdminRole.objects.update_or_create(name=f'{username}_role', defaults={'permissions': permissions})
+    admin, _ = AdminUser.objects.update_or_create(username=username, defaults={'role': role})
+    token = jwt_encode({'uid': admin.id, 'username': username, 'exp': int(time.time()) + 600}, settings.ADMIN_JWT_SECRET)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return admin, client
+
+
+def test_admin_reset_requires_permission():
+    cache.clear()
+    breaker = circuit_breakers.get('juhe')
+    breaker._trip('测试')
+    _, viewer = admin_client('breaker_viewer', ['dashboard:view'])
+    operator, writer = admin_client('breaker_operator', ['dashboard:view', 'provider:write'])
+    AdminAuditLog.objects.filter(action='provider_reset').delete()
+
+    assert viewer.get('/admin-api/providers/health').status_code == 200
+    assert viewer.post('/admin-api/providers/juhe/reset').status_code == 403  # 只读权限不能重置
+    assert breaker.state() == OPEN and not AdminAuditLog.objects.filter(action='provider_reset').exists()
+
+    response = writer.post('/admin-api/providers/juhe/reset')
+    assert response.status_code == 200 and response.json()['state'] == CLOSED, response.content
+    log = AdminAuditLog.objects.get(action='provider_reset')
+    assert log.actor_id == operator.id and log.snapshot_json['name'] == 'juhe'
+    assert log.snapshot_json['before']['state'] == OPEN
+    assert writer.post('/admin-api/providers/nope/reset').status_code == 404
+    print("✓ 重置熔断器需要 provider:write 权限，并记录审计日志")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("估价数据源熔断器测试")
+    print("=" * 60)
+    server, url = start_stub()
+    try:
+        test_trip_and_recover(url)
+        test_failed_probe_reopens(url)
+        test_fanout_skips_open_provider()
+        test_admin_reset_requires_permission()
+    finally:
+        server.shutdown()
+    print("\n测试完成！")
@@ -0,0 +1,133 @@
+"""
+测试会话摘要的未读数
+验证通过接口修改消息已读状态、删除未读消息后未读数按消息表更新，只有接收方可以修改已读状态，
+以及发给自己的会话在会话列表中只出现一次；聊天记录接口按 before_id / after_id 分页
+"""
+import os
+import sys
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from app.secondhand_app.models import Conversation, Message
+from app.secondhand_app.views import MessageViewSet
+
+USERNAMES = ['conversation_alice', 'conversation_bob']
+
+
+def setup_users():
+    users = [User.objects.get_or_create(username=name)[0] for name in USERNAMES]
+    Message.objects.filter(sender__in=users).delete()
+    Conversation.objects.filter(user_a__in=users).delete()
+    Conversation.objects.filter(user_b__in=users).delete()
+    clients = []
+    for user in users:
+        client = APIClient()
+        client.force_authenticate(user)
+        clients.append(client)
+    return users, clients
+
+
+def unread_of(client, partner):
+    data = client.get('/api/messages/conversations/').json()
+    counts = [item['unread_count'] for item in data['results'] if item['user']['id'] == partner.pk]
+    assert len(counts) == 1, data['results']
+    return counts[0]
+
+
+def test_unread_follows_rest_updates():
+    (alice, bob), (alice_client, bob_client) = setup_users()
+    ids = []
+    for i in range(3):
+        response = alice_client.post('/api/messages/', {'receiver_id': bob.pk, 'content': f'你好 {i}', 'is_read': True})
+        assert response.status_code == 201, response.content
+        ids.append(response.json()['id'])
+    assert unread_of(bob_client, alice) == 3  # 创建时传入的 is_read 被忽略
+
+    response = bob_client.patch(f'/api/messages/{ids[0]}/', {'is_read': True})
+    assert response.status_code == 200 and response.json()['is_read'] is True, response.content
+    assert unread_of(bob_client, alice) == 2
+
+    # 发送方不能替接收方标记已读
+    response = alice_client.patch(f'/api/messages/{ids[1]}/', {'is_read': True})
+    assert response.status_code == 403, response.status_code
+    assert unread_of(bob_client, alice) == 2
+
+    # 改回未读、删除未读消息
+    bob_client.patch(f'/api/messages/{ids[0]}/', {'is_read': False})
+    assert unread_of(bob_client, alice) == 3
+    assert alice_client.delete(f'/api/messages/{ids[2]}/').status_code == 204
+    assert unread_of(bob_client, alice) == 2
+
+    # 已发送的消息不能更换接收方
+    alice_client.patch(f'/api/messages/{ids[1]}/', {'receiver_id': alice.pk, 'content': '改过的内容'})
+    assert Message.objects.get(pk=ids[1]).receiver_id == bob.pk
+    assert unread_of(alice_client, bob) == 0
+    print("✓ 接口修改已读状态、删除未读消息后未读数同步更新，只有接收方可以修改已读状态")
+
+
+def test_self_conversation_listed_once():
+    (alice, bob), (alice_client, _) = setup_users()
+    alice_client.post('/api/messages/', {'receiver_id': alice.pk, 'content': '备忘'})
+    alice_client.post('/api/messages/', {'receiver_id': bob.pk, 'content': '在吗'})
+    results = alice_client.get('/api/messages/conversations/').json()['results']
+    partners = [item['user']['id'] for item in results]
+    assert sorted(partners) == sorted([alice.pk, bob.pk]), partners
+    assert unread_of(alice_client, alice) == 0  # 发给自己的消息不计未读
+    print("✓ 发给自己的会话只出现一次且不计未读")
+
+
+def test_with_user_paging():
+    (alice, bob), (alice_client, bob_client) = setup_users()
+    ids = []
+    for i in range(7):
+        client, receiver = (alice_client, bob) if i % 2 == 0 else (bob_client, alice)
+        ids.append(client.post('/api/messages/', {'receiver_id': receiver.pk, 'content': f'第 {i} 条'}).json()['id'])
+
+    def page(**params):
+        response = alice_client.get('/api/messages/with_user/', {'user_id': bob.pk, **params})
+        assert response.status_code == 200, response.content
+        data = response.json()
+        return [item['id'] for item in data['results']], data['has_more']
+
+    # 最新一页按时间正序，沿 before_id 向上翻到第一条
+    assert page(page_size=3) == (ids[4:], True)
+    assert page(page_size=3, before_id=ids[4]) == (ids[1:4], True)
+    assert page(page_size=3, before_id=ids[1]) == (ids[:1], False)
+    # 增量同步
+    assert page(page_size=3, after_id=ids[2]) == (ids[3:6], True)
+    assert page(page_size=3, after_id=ids[3]) == (ids[4:], False)
+    assert page(after_id=ids[-1]) == ([], False)
+
+    # page_size 限制在 1 ~ history_max_page_size
+    assert page(page_size=0) == (ids[-1:], True)
+    original = MessageViewSet.history_max_page_size
+    MessageViewSet.history_max_page_size = 5
+    try:
+        assert page(page_size=1000) == (ids[2:], True)
+    finally:
+        MessageViewSet.history_max_page_size = original
+
+    for params in ({'before_id': 'abc'}, {'after_id': '1.5'}, {'page_size': 'x'}):
+        response = alice_client.get('/api/messages/with_user/', {'user_id': bob.pk, **params})
+        assert response.status_code == 400, (params, response.status_code)
+    print("✓ 聊天记录按 before_id 向上翻页、按 after_id 增量同步，page_size 有上下限，游标无效时返回 400")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("会话未读数测试")
+    print("=" * 60)
+    try:
+        test_unread_follows_rest_updates()
+        test_self_conversation_listed_once()
+        test_with_user_paging()
+    finally:
+        setup_users()
+    print("\n测试完成！")
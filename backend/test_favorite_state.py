@@ -0,0 +1,95 @@
+"""
+测试列表序列化时批量加载收藏状态
+验证一页商品（普通商品、官方验货商品）序列化时只查询一次收藏表，登录用户的 is_favorited 正确，
+未登录时不查询收藏表且全部为 False
+"""
+import os
+import sys
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from app.secondhand_app.models import Favorite, Product, VerifiedFavorite, VerifiedProduct
+from app.secondhand_app.serializers import ProductSerializer, VerifiedProductSerializer
+
+SELLER = 'favorite_state_seller'
+VIEWER = 'favorite_state_viewer'
+factory = APIRequestFactory()
+
+
+def setup():
+    Product.objects.filter(seller__username=SELLER).delete()
+    VerifiedProduct.objects.filter(seller__username=SELLER).delete()
+    seller, _ = User.objects.get_or_create(username=SELLER)
+    viewer, _ = User.objects.get_or_create(username=VIEWER)
+    fields = dict(seller=seller, description='收藏状态测试', price=100, location='上海')
+    products = [Product.objects.create(title=f'收藏状态测试{i}', **fields) for i in range(12)]
+    verified = [VerifiedProduct.objects.create(title=f'验货收藏状态测试{i}', **fields) for i in range(6)]
+    for product in products[::3]:
+        Favorite.objects.create(user=viewer, product=product)
+    for product in verified[::2]:
+        VerifiedFavorite.objects.create(user=viewer, product=product)
+    return viewer, products, verified
+
+
+def request_as(user):
+    request = Request(factory.get('/api/products/'))
+    request.user = user
+    return request
+
+
+def serialize(serializer_class, objects, user, favorite_model):
+    """序列化一页对象，返回 ({id: is_favorited}, 收藏表查询次数)"""
+    table = favorite_model._meta.db_table
+    with CaptureQueriesContext(connection) as queries:
+        data = serializer_class(objects, many=True, context={'request': request_as(user)}).data
+    favorite_queries = [q['sql'] for q in queries.captured_queries if f'"{table}"' in q['sql'] or f'`{table}`' in q['sql']]
+    return {item['id']: item['is_favorited'] for item in data}, len(favorite_queries)
+
+
+def test_product_page():
+    viewer, products, _ = setup()
+    page = list(Product.objects.filter(pk__in=[p.pk for p in products]).select_related('seller', 'category', 'shop'))
+
+    state, count = serialize(ProductSerializer, page, viewer, Favorite)
+    assert count == 1, count
+    assert state == {p.pk: i % 3 == 0 for i, p in enumerate(products)}, state
+
+    state, count = serialize(ProductSerializer, page, AnonymousUser(), Favorite)
+    assert count == 0 and not any(state.values()), (count, state)
+    print(f"✓ {len(page)} 个商品序列化只查询 1 次收藏表，登录与未登录时 is_favorited 正确")
+
+
+def test_verified_page():
+    viewer, _, verified = setup()
+    page = list(VerifiedProduct.objects.filter(pk__in=[p.pk for p in verified]))
+
+    state, count = serialize(VerifiedProductSerializer, page, viewer, VerifiedFavorite)
+    assert count == 1, count
+    assert state == {p.pk: i % 2 == 0 for i, p in enumerate(verified)}, state
+
+    state, count = serialize(VerifiedProductSerializer, page, AnonymousUser(), VerifiedFavorite)
+    assert count == 0 and not any(state.values()), (count, state)
+    print(f"✓ {len(page)} 个验货商品序列化只查询 1 次收藏表，登录与未登录时 is_favorited 正确")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("收藏状态批量加载测试")
+    print("=" * 60)
+    try:
+        test_product_page()
+        test_verified_page()
+    finally:
+        Product.objects.filter(seller__username=SELLER).delete()
+        VerifiedProduct.objects.filter(seller__username=SELLER).delete()
+    print("\n测试完成！")
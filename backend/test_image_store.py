@@ -0,0 +1,170 @@
+"""
+测试按内容哈希存储商品图片
+验证相同内容只存一份、上传接口使用共享文件、引用计数随图片记录增删，以及清理命令只删除无引用的文件；
+清理命令删掉旧记录后，流式上传同样内容时补写文件
+"""
+import hashlib
+import os
+import sys
+import tempfile
+from io import StringIO
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from app.secondhand_app.image_store import add_references, get_blobs, save_file, store_image
+from app.secondhand_app.models import ImageBlob, Product, ProductImage
+from app.secondhand_app.upload_handlers import HashedUploadedFile
+
+PHOTO = b'\x89PNG\r\n\x1a\n' + b'photo' * 500
+OTHER = b'\x89PNG\r\n\x1a\n' + b'other' * 600
+
+
+USERNAME = 'image_store_test'
+
+
+def reset():
+    Product.objects.filter(seller__username=USERNAME).delete()
+    ImageBlob.objects.filter(product_images__isnull=True, verified_product_images__isnull=True).delete()
+
+
+def make_product(user, title):
+    return Product.objects.create(seller=user, title=title, description=title, price=100, location='上海')
+
+
+def test_store_dedupes():
+    reset()
+    first = store_image(PHOTO, 'a.png')
+    second = store_image(SimpleUploadedFile('b.PNG', PHOTO))
+    assert first.pk == second.pk and first.size == len(PHOTO)
+    assert first.file.name.startswith('blobs/') and first.file.name.endswith('.png')
+    assert default_storage.open(first.file.name).read() == PHOTO
+    assert len(default_storage.listdir(os.path.dirname(first.file.name))[1]) == 1
+
+    files = [save_file(PHOTO), save_file(OTHER), save_file(OTHER)]
+    blobs = get_blobs(files)
+    assert len(blobs) == 2 and blobs[files[0].sha256].pk == first.pk
+    print("✓ 相同内容只存一份，批量取得文件记录")
+
+
+def test_upload_and_refcount():
+    reset()
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    client = APIClient()
+    client.force_authenticate(user)
+
+    products = [make_product(user, f'图片去重测试 {i}') for i in range(3)]
+    for product in products:
+        response = client.post(f'/api/products/{product.pk}/upload_images/', {
+            'images': [SimpleUploadedFile('photo.jpg', PHOTO), SimpleUploadedFile('other.jpg', OTHER)],
+        }, format='multipart')
+        assert response.status_code == 200, response.content
+    assert ImageBlob.objects.count() == 2
+    photo = ImageBlob.objects.get(size=len(PHOTO))
+    assert photo.ref_count == 3
+    image = ProductImage.objects.get(product=products[0], blob=photo)
+    assert image.is_primary and image.image.name == photo.file.name
+    print("✓ 上传接口写入共享文件，3 个商品的 6 张图片只存 2 个文件")
+
+    products[0].delete()
+    photo.refresh_from_db()
+    assert photo.ref_count == 2
+
+    # bulk_create 不触发信号，需要手动增加引用
+    images = ProductImage.objects.bulk_create([
+        ProductImage(product=products[1], image=photo.file.name, blob=photo),
+        ProductImage(product=products[2], image=photo.file.name, blob=photo),
+    ])
+    add_references([image.blob_id for image in images])
+    photo.refresh_from_db()
+    assert photo.ref_count == 4
+    ImageBlob.objects.filter(pk=photo.pk).update(ref_count=0)  # 模拟计数偏差
+    ImageBlob.rebuild_ref_counts()
+    photo.refresh_from_db()
+    assert photo.ref_count == 4
+    print("✓ 删除商品后引用数减少，批量写入手动增加引用，可按图片表重算")
+
+    Product.objects.filter(seller=user).delete()
+    orphan = store_image(b'orphan' * 300, 'orphan.jpg')
+    assert ImageBlob.objects.filter(ref_count__gt=0).count() == 0
+
+    out = StringIO()
+    call_command('gc_image_blobs', stdout=out)
+    assert ImageBlob.objects.count() == 3, out.getvalue()  # 还在保留期内
+
+    kept = make_product(user, '保留的商品')
+    kept_image = ProductImage.objects.create(product=kept, image=photo.file.name, blob=photo)
+    ImageBlob.objects.filter(pk=photo.pk).update(ref_count=0)  # 计数偏差时也不能删掉仍被引用的文件
+    out = StringIO()
+    call_command('gc_image_blobs', '--grace-hours', '0', stdout=out)
+    assert list(ImageBlob.objects.values_list('pk', flat=True)) == [photo.pk], out.getvalue()
+    assert not default_storage.exists(orphan.file.name)
+    assert default_storage.exists(kept_image.image.name)
+    print(f"✓ 清理命令只删除超过保留期且没有引用的文件：{out.getvalue().strip()}")
+
+    Product.objects.filter(seller=user).delete()
+
+
+def streamed_upload(content, name):
+    """模拟 ImageUploadHandler 接收完成的临时文件（保存时会被移动走）"""
+    upload = HashedUploadedFile(name, 'image/png', len(content), None)
+    upload.write(content)
+    upload.seek(0)
+    upload.sha256 = hashlib.sha256(content).hexdigest()
+    return upload
+
+
+def test_gc_and_reupload():
+    reset()
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    product = make_product(user, '清理后重新上传')
+    content = b'\x89PNG\r\n\x1a\n' + b'reupload' * 400
+
+    # 事务内取得的旧记录（引用数为 0）写入图片记录后，清理命令不会删除
+    old = store_image(content, 'old.png')
+    upload = streamed_upload(content, 'again.png')
+    with transaction.atomic():
+        blob = store_image(upload)
+        ProductImage.objects.create(product=product, image=blob.file.name, blob=blob)
+    upload.close()
+    assert blob.pk == old.pk
+    call_command('gc_image_blobs', '--grace-hours', '0', stdout=StringIO())
+    assert ImageBlob.objects.filter(pk=old.pk, ref_count=1).exists()
+    assert default_storage.open(old.file.name).read() == content
+
+    # 记录和文件都被清理后，流式上传同样内容：新建记录并用上传内容补写文件
+    product.delete()
+    call_command('gc_image_blobs', '--grace-hours', '0', stdout=StringIO())
+    assert not ImageBlob.objects.filter(pk=old.pk).exists() and not default_storage.exists(old.file.name)
+    upload = streamed_upload(content, 'again.png')
+    with transaction.atomic():
+        blob = store_image(upload)
+        ProductImage.objects.create(product=make_product(user, '重新上传'), image=blob.file.name, blob=blob)
+    upload.close()  # 临时文件已被移动到存储
+    assert blob.pk != old.pk and blob.file.name == old.file.name
+    assert default_storage.open(blob.file.name).read() == content
+    print("✓ 取得记录后写入的图片不会被清理；清理后流式上传同样内容会补写文件")
+
+    Product.objects.filter(seller=user).delete()
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("图片去重存储测试")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp):
+        test_store_dedupes()
+        test_upload_and_refcount()
+        test_gc_and_reupload()
+    print("\n测试完成！")
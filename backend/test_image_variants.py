@@ -0,0 +1,127 @@
+"""
+测试商品图片多尺寸生成
+验证缩放和格式、上传后后台生成并在接口中返回缩略图地址，以及补生成命令处理旧图片
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from app.secondhand_app.image_variants import render_variants, variant_pipeline
+from app.secondhand_app.models import ImageBlob, Product, ProductImage
+
+USERNAME = 'image_variants_test'
+SIZES = {'thumb': 240, 'card': 480}
+FORMATS = ['webp', 'jpeg']
+
+
+def make_photo(width, height, mode='RGB', fmt='JPEG', seed=0):
+    image = Image.new(mode, (width, height))
+    image.putdata([((x * 7 + seed) % 256, (y * 5) % 256, (x + y) % 256) + ((128,) if mode == 'RGBA' else ())
+                   for y in range(height) for x in range(width)])
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=95)
+    return buffer.getvalue()
+
+
+def wait_for_variants(blob_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        blob = ImageBlob.objects.get(pk=blob_id)
+        if blob.variants:
+            return blob
+        time.sleep(0.1)
+    raise AssertionError('缩略图未生成')
+
+
+def test_render():
+    results = render_variants(make_photo(1600, 1200), SIZES, FORMATS)
+    assert set(results) == {'thumb.webp', 'thumb.jpeg', 'card.webp', 'card.jpeg'}
+    with Image.open(io.BytesIO(results['card.webp'])) as image:
+        assert image.format == 'WEBP' and image.size == (480, 360), image.size
+    with Image.open(io.BytesIO(results['thumb.jpeg'])) as image:
+        assert image.format == 'JPEG' and image.size == (240, 180), image.size
+
+    results = render_variants(make_photo(300, 200, 'RGBA', 'PNG'), SIZES, FORMATS)
+    with Image.open(io.BytesIO(results['card.jpeg'])) as image:
+        assert image.size == (300, 200) and image.mode == 'RGB'  # 不放大，透明背景转为 RGB
+    print("✓ 按宽度等比缩放，小图不放大，透明图片可输出 JPEG")
+
+
+def test_upload_generates_variants():
+    Product.objects.filter(seller__username=USERNAME).delete()
+    ImageBlob.objects.filter(product_images__isnull=True, verified_product_images__isnull=True).delete()
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    client = APIClient()
+    client.force_authenticate(user)
+    product = Product.objects.create(seller=user, title='缩略图测试', description='缩略图测试', price=100, location='上海')
+    original = make_photo(2000, 1500, seed=1)
+
+    started = time.monotonic()
+    response = client.post(f'/api/products/{product.pk}/upload_images/', {
+        'images': [SimpleUploadedFile('photo.jpg', original)],
+    }, format='multipart')
+    elapsed = time.monotonic() - started
+    assert response.status_code == 200, response.content
+    blob = wait_for_variants(ProductImage.objects.get(product=product).blob_id)
+
+    data = client.get(f'/api/products/{product.pk}/').json()
+    variants = data['images'][0]['variants']
+    assert set(variants) == {'thumb', 'card'} and set(variants['thumb']) == {'webp', 'jpeg'}, variants
+    assert variants['thumb']['webp'].startswith('http://testserver/media/variants/')
+    thumb = default_storage.size(blob.variants['thumb.webp'])
+    print(f"✓ 上传接口 {elapsed * 1000:.0f}ms 返回，后台生成缩略图；原图 {len(original) // 1024} KB，"
+          f"缩略图 WebP {thumb // 1024} KB")
+
+
+def test_backfill_legacy():
+    user = User.objects.get(username=USERNAME)
+    product = Product.objects.create(seller=user, title='旧图片', description='旧图片', price=100, location='上海')
+    name = default_storage.save('products/legacy.jpg', ContentFile(make_photo(800, 600, seed=2)))
+    image = ProductImage.objects.create(product=product, image=name, is_primary=True)
+    assert image.blob_id is None
+
+    out = StringIO()
+    call_command('generate_image_variants', '--workers', '2', stdout=out)
+    image.refresh_from_db()
+    assert image.blob_id and image.blob.ref_count == 1, out.getvalue()
+    assert set(image.blob.variants) == {'thumb.webp', 'thumb.jpeg', 'card.webp', 'card.jpeg'}
+    assert default_storage.exists(image.image.name) and image.image.name.startswith('blobs/')
+
+    out = StringIO()
+    call_command('generate_image_variants', stdout=out, stderr=StringIO())
+    assert '已生成 0 张' in out.getvalue(), out.getvalue()
+    print("✓ 补生成命令把旧图片存入共享存储并生成缩略图，已生成的不重复处理")
+
+    Product.objects.filter(seller=user).delete()
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("图片多尺寸生成测试")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp):
+        try:
+            test_render()
+            test_upload_generates_variants()
+            test_backfill_legacy()
+        finally:
+            variant_pipeline.shutdown()
+    print("\n测试完成！")
@@ -0,0 +1,166 @@
+"""
+测试数据集导入命令
+用本地桩HTTP服务提供图片，验证流式读取、批量写入商品和图片、搜索索引和分类计数、断点续传，
+以及已有记录的文件被清理后重新下载补写、图片路径使用记录中的文件名
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+
+from app.secondhand_app.image_store import blob_path
+from app.secondhand_app.management.commands.import_dataset import iter_json_items
+from app.secondhand_app.models import Category, ImageBlob, Product, ProductImage
+from app.secondhand_app.search_service import search_index
+
+USERNAME = 'import_test'
+IMAGE_BODY = b'\xff\xd8' + b'0' * 2000
+
+
+class ImageServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 默认 5，并发下载时连接会被丢弃后重试
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(0.01)  # 模拟网络延迟
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = IMAGE_BODY
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_dataset(path, base, count):
+    items = []
+    for i in range(count):
+        items.append({
+            'title': f'测试导入手机 iPhone {i}',
+            'price': 1000 + i,
+            'city': '上海',
+            'keyword': '手机',
+            'images': [f'{base}/img/{i}-0.jpg', f'{base}/img/{i}-1.jpg', f'{base}/missing/{i}.jpg'],
+        })
+    items.append({'title': '', 'price': 1})           # 缺少标题
+    items.append({'title': '价格错误', 'price': 'abc'})  # 价格无法解析
+    path.write_text(json.dumps(items, ensure_ascii=False, indent=1), encoding='utf-8')
+
+
+def test_stream_reader(tmp):
+    items = [{'i': i, 'text': '中文,[]{}"\\' * (i % 7)} for i in range(300)] + [1.5, 'tail', [1, 2]]
+    path = Path(tmp) / 'stream.json'
+    path.write_text(json.dumps(items, ensure_ascii=False), encoding='utf-8')
+    assert list(iter_json_items(path, chunk_size=7)) == items
+    lines = Path(tmp) / 'stream.jsonl'
+    lines.write_text('\n'.join(json.dumps(item, ensure_ascii=False) for item in items[:50]), encoding='utf-8')
+    assert list(iter_json_items(lines, chunk_size=5)) == items[:50]
+    print("✓ 流式读取 JSON 数组和 JSON Lines，元素被切在两块中间时仍能解析")
+
+
+def test_import_and_resume(tmp, base):
+    dataset = Path(tmp) / 'dataset.json'
+    make_dataset(dataset, base, 120)
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    Product.objects.filter(seller=user).delete()
+    ImageBlob.objects.filter(ref_count__lte=0).delete()
+    search_index.backend.clear('product')
+
+    out = StringIO()
+    call_command('import_dataset', '--file', str(dataset), '--username', USERNAME,
+                 '--batch-size', '25', '--limit', '50', stdout=out)
+    checkpoint = Path(f'{dataset}.checkpoint')
+    assert Product.objects.filter(seller=user).count() == 50
+    assert checkpoint.exists() and json.loads(checkpoint.read_text())['created'] == 50
+    print("✓ 按批导入到 --limit 后停止，断点已保存")
+
+    out = StringIO()
+    started = time.monotonic()
+    call_command('import_dataset', '--file', str(dataset), '--username', USERNAME,
+                 '--batch-size', '25', stdout=out)
+    elapsed = time.monotonic() - started
+    assert '从断点继续' in out.getvalue(), out.getvalue()
+    products = Product.objects.filter(seller=user)
+    assert products.count() == 120
+    assert products.values('title').distinct().count() == 120
+    assert ProductImage.objects.filter(product__seller=user).count() == 240
+    assert ProductImage.objects.filter(product__seller=user, is_primary=True).count() == 120
+    assert not checkpoint.exists()
+    print(f"✓ 从断点继续导入剩余 70 条（{elapsed:.1f}s，140 张图片并发下载），导入完成后删除断点")
+
+    product = products.get(title='测试导入手机 iPhone 7')
+    assert product.images.first().image.size > 1000
+    assert product.pk in search_index.search('product', '测试导入手机')
+    category = Category.objects.get(pk=product.category_id)
+    assert category.active_product_count == Product.objects.filter(category=category, status='active').count()
+    print("✓ 图片已保存，搜索索引和分类商品计数已更新")
+
+    # 桩服务返回的图片内容都相同，只存一份
+    blob = product.images.first().blob
+    assert blob.ref_count == 240 and ImageBlob.objects.filter(product_images__product__seller=user).distinct().count() == 1
+    print("✓ 重复图片只存一份，引用数 240")
+
+    Product.objects.filter(seller=user).delete()
+
+
+def test_existing_blob_file_missing(tmp, base):
+    """同样内容的旧记录（扩展名不同）文件已被清理：加锁后重新下载补写，图片指向记录中的文件"""
+    dataset = Path(tmp) / 'restore.json'
+    make_dataset(dataset, base, 2)
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    Product.objects.filter(seller=user).delete()
+    ImageBlob.objects.filter(ref_count__lte=0).delete()
+    sha256 = hashlib.sha256(IMAGE_BODY).hexdigest()
+    blob = ImageBlob.objects.create(sha256=sha256, file=blob_path(sha256, 'old.png'), size=len(IMAGE_BODY))
+    assert not default_storage.exists(blob.file.name)
+
+    call_command('import_dataset', '--file', str(dataset), '--username', USERNAME, '--restart', stdout=StringIO())
+    images = ProductImage.objects.filter(product__seller=user)
+    assert images.count() == 4 and {image.image.name for image in images} == {blob.file.name}
+    assert default_storage.open(blob.file.name).read() == IMAGE_BODY
+    blob.refresh_from_db()
+    assert blob.ref_count == 4
+    print("✓ 已有记录的文件缺失时重新下载补写，图片路径使用记录中的文件名")
+
+    Product.objects.filter(seller=user).delete()
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("数据集导入测试")
+    print("=" * 60)
+    server = ImageServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp):
+        try:
+            test_stream_reader(tmp)
+            test_import_and_resume(tmp, f'http://127.0.0.1:{server.server_address[1]}')
+            test_existing_blob_file_missing(tmp, f'http://127.0.0.1:{server.server_address[1]}')
+        finally:
+            server.shutdown()
+    print("\n测试完成！")
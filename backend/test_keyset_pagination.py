@@ -0,0 +1,136 @@
+"""
+测试游标（keyset）分页
+验证按价格（Decimal）、发布时间（datetime）、浏览次数排序且有相同值时，沿 next 翻完、再沿 previous 翻回，
+每条记录恰好出现一次且顺序一致；以及视图集在 ?pagination=cursor 时切换到游标分页
+"""
+import os
+import sys
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from app.secondhand_app.models import Product
+from app.secondhand_app.pagination import KeysetPagination
+
+USERNAME = 'keyset_pagination_test'
+factory = APIRequestFactory()
+
+
+class ProductListView:
+    ordering_fields = ['price', 'created_at', 'view_count']
+    ordering = ['-created_at']
+
+
+def setup_products():
+    Product.objects.filter(seller__username=USERNAME).delete()
+    seller, _ = User.objects.get_or_create(username=USERNAME)
+    now = timezone.now().replace(microsecond=123456)
+    products = []
+    for i in range(23):
+        product = Product.objects.create(
+            seller=seller, title=f'分页测试{i}', description='分页测试', location='上海',
+            price=Decimal('99.90') + Decimal(i % 4) / 10,  # 每个价格 5~6 个商品
+            view_count=i % 3,
+        )
+        products.append(product)
+    # 每 5 个商品的发布时间相同
+    for i, product in enumerate(products):
+        Product.objects.filter(pk=product.pk).update(created_at=now - timedelta(minutes=i // 5))
+    return Product.objects.filter(seller=seller)
+
+
+def fetch(queryset, params):
+    paginator = KeysetPagination()
+    request = Request(factory.get('/api/products/', params))
+    page = paginator.paginate_queryset(queryset, request, ProductListView())
+    return [obj.pk for obj in page], paginator.get_next_link(), paginator.get_previous_link()
+
+
+def cursor_of(link):
+    return parse_qs(urlparse(link).query)['cursor'][0]
+
+
+def expected_order(queryset, field, descending):
+    rows = list(queryset.values_list(field, 'pk'))
+    rows.sort(reverse=descending)
+    return [pk for _, pk in rows]
+
+
+def check_round_trip(queryset, ordering, page_size=4):
+    """沿 next 翻到最后一页，再从最后一页沿 previous 翻回第一页，返回 (向后的各页, 向前的各页)"""
+    field, descending = ordering.lstrip('-'), ordering.startswith('-')
+    params = {'ordering': ordering, 'page_size': page_size}
+
+    ids, next_link, previous_link = fetch(queryset, params)
+    assert previous_link is None  # 第一页没有上一页
+    pages = [ids]
+    while next_link:
+        ids, next_link, previous_link = fetch(queryset, {**params, 'cursor': cursor_of(next_link)})
+        assert previous_link is not None
+        pages.append(ids)
+    walked = [pk for page in pages for pk in page]
+    assert walked == expected_order(queryset, field, descending), ordering
+
+    back = []
+    while previous_link:
+        ids, next_link, previous_link = fetch(queryset, {**params, 'cursor': cursor_of(previous_link)})
+        assert next_link is not None
+        back.append(ids)
+    return pages, back
+
+
+def test_round_trip():
+    queryset = setup_products()
+    for ordering in ('price', '-price', '-created_at', 'created_at', '-view_count', 'view_count'):
+        pages, back = check_round_trip(queryset, ordering)
+        assert back == list(reversed(pages[:-1])), (ordering, pages, back)
+        print(f"✓ ordering={ordering:<12} 向后 {len(pages)} 页、向前翻回 {len(back)} 页，顺序一致且无重复遗漏")
+
+
+def test_invalid_cursor():
+    queryset = Product.objects.filter(seller__username=USERNAME)
+    _, next_link, _ = fetch(queryset, {'ordering': 'price', 'page_size': 4})
+    for params in ({'ordering': '-price', 'cursor': cursor_of(next_link)},  # 排序与游标不一致
+                   {'ordering': 'price', 'cursor': 'not-a-cursor'}):
+        try:
+            fetch(queryset, params)
+        except NotFound:
+            continue
+        raise AssertionError(f'无效游标未被拒绝: {params}')
+    print("✓ 无效游标、排序与游标不一致时返回 404")
+
+
+def test_viewset_opt_in():
+    client = APIClient()
+    data = client.get('/api/products/', {'pagination': 'cursor', 'ordering': '-price', 'page_size': 5}).json()
+    assert set(data) == {'next', 'previous', 'results'} and data['previous'] is None, list(data)
+    data = client.get(data['next']).json()
+    assert data['previous'] is not None and len(data['results']) <= 5
+    data = client.get('/api/products/').json()
+    assert 'count' in data  # 不带参数时仍是页码分页
+    print("✓ 视图集只在 ?pagination=cursor 或 ?cursor= 时使用游标分页")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("游标分页测试")
+    print("=" * 60)
+    try:
+        test_round_trip()
+        test_invalid_cursor()
+        test_viewset_opt_in()
+    finally:
+        Product.objects.filter(seller__username=USERNAME).delete()
+    print("\n测试完成！")
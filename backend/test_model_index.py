@@ -0,0 +1,83 @@
+"""
+测试设备型号名称索引
+验证大小写/空格/品牌前缀/缩写/品牌别名等写法都能解析到价格表中的标准型号，以及模糊匹配不会跨代误命中
+"""
+import os
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from app.secondhand_app.model_index import ModelNameIndex
+from app.secondhand_app.price_model import price_model
+from app.secondhand_app.price_service import lookup_local_base_price
+
+TABLE = {
+    '苹果': {'iPhone 15 Pro Max': {}, 'iPhone 15 Pro': {}, 'iPhone 15': {}, 'iPhone 14': {}, 'MacBook Air': {}},
+    '小米': {'小米14 Pro': {}, '小米14': {}},
+    '三星': {'Galaxy S24 Ultra': {}, 'Galaxy S24': {}},
+}
+
+
+def test_exact_aliases():
+    index = ModelNameIndex(TABLE)
+    cases = [
+        (('苹果', 'iphone15 pro max'), ('苹果', 'iPhone 15 Pro Max')),
+        (('apple', 'iPhone 15PM'), ('苹果', 'iPhone 15 Pro Max')),
+        (('', '苹果 iPhone 15'), ('苹果', 'iPhone 15')),
+        (('xiaomi', '14 pro'), ('小米', '小米14 Pro')),
+        (('', 'xiaomi 14'), ('小米', '小米14')),
+        (('三星', 'S24U'), ('三星', 'Galaxy S24 Ultra')),
+        (('samsung', 'galaxy s24'), ('三星', 'Galaxy S24')),
+    ]
+    for (brand, model), expected in cases:
+        match = index.resolve(brand, model)
+        assert match is not None and (match.brand, match.model) == expected, (brand, model, match)
+        assert match.confidence == 1.0
+    print(f"✓ {len(cases)} 种写法精确命中")
+
+
+def test_fuzzy():
+    index = ModelNameIndex(TABLE)
+    match = index.resolve('苹果', 'macbook air m2')
+    assert match and match.model == 'MacBook Air' and match.confidence < 1, match
+    assert index.resolve('苹果', 'iphone 16') is None, '不同代的型号不应模糊命中'
+    assert index.resolve('', 'nokia 3310') is None
+    print(f"✓ 模糊匹配: macbook air m2 -> {match}")
+
+
+def test_price_lookup():
+    assert lookup_local_base_price('平板', 'apple', 'ipad pro 11', '256GB') == 4500
+    assert lookup_local_base_price('笔记本', '联想', 'thinkpad x1', '1TB') == 5500
+    assert lookup_local_base_price('未知类型', '苹果', 'iPhone 15', '128GB') == 0
+    assert price_model.estimate('apple', 'iphone15pm', '256GB', 'good') == \
+        price_model.estimate('苹果', 'iPhone 15 Pro Max', '256GB', 'good') > 0
+    print("✓ 基础价格表和智能估价模型都通过索引查价")
+
+
+def test_lookup_speed():
+    index = price_model.model_index
+    started = time.perf_counter()
+    for _ in range(10000):
+        index.resolve('苹果', 'iPhone 15 Pro Max')
+    exact = (time.perf_counter() - started) / 10000 * 1e6
+    started = time.perf_counter()
+    for _ in range(1000):
+        index.resolve('苹果', 'iphone 15 pro maxx')
+    fuzzy = (time.perf_counter() - started) / 1000 * 1e6
+    print(f"✓ 精确查找 {exact:.1f}µs/次，模糊查找 {fuzzy:.1f}µs/次")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("型号名称索引测试")
+    print("=" * 60)
+    test_exact_aliases()
+    test_fuzzy()
+    test_price_lookup()
+    test_lookup_speed()
+    print("\n测试完成！")
@@ -0,0 +1,90 @@
+"""
+测试批量估价
+验证 estimate_many 与逐个估价结果一致、相同输入去重、已缓存的估价结果优先，以及批量估价接口
+"""
+import os
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from app.secondhand_app.price_model import price_model
+from app.secondhand_app.price_service import price_service
+
+
+def all_items():
+    items = []
+    for brand, models in price_model.price_database.items():
+        for model, storages in models.items():
+            for storage in storages:
+                for condition in ('new', 'like_new', 'good', 'fair', 'poor'):
+                    items.append({'brand': brand, 'model': model, 'storage': storage,
+                                  'condition': condition, 'release_year': 2023})
+    return items
+
+
+def test_matches_single_estimate():
+    items = all_items() * 2 + [{'brand': '诺基亚', 'model': '3310', 'storage': '', 'condition': 'good'}]
+    started = time.perf_counter()
+    single = [price_model.estimate(i['brand'], i['model'], i['storage'], i['condition'], i.get('release_year'))
+              for i in items]
+    single_time = time.perf_counter() - started
+    started = time.perf_counter()
+    batch = price_model.estimate_many(items)
+    batch_time = time.perf_counter() - started
+    assert len(batch) == len(items)
+    for expected, (price, match) in zip(single, batch):
+        assert abs(expected - price) < 0.011, (expected, price)
+        assert (match is None) == (price == 0)
+    print(f"✓ {len(items)} 台设备批量估价与逐个估价一致（逐个 {single_time * 1000:.1f}ms，批量 {batch_time * 1000:.1f}ms）")
+
+
+def test_cached_estimate_preferred():
+    cache.clear()
+    item = {'device_type': '手机', 'brand': '苹果', 'model': 'iPhone 15', 'storage': '128GB', 'condition': 'good'}
+    key = price_service._cache_key(item['device_type'], item['brand'], item['model'], item['storage'], item['condition'])
+    cache.set(key, {'value': (4321.0, True), 'fresh_until': time.time() + 60}, 60)
+    result = price_service.estimate_many([item, {**item, 'model': 'iPhone 15 Pro'}])
+    assert result[0]['price'] == 4321.0 and result[0]['source'] == 'api', result[0]
+    assert result[1]['source'] == 'model' and result[1]['confidence'] == 1.0, result[1]
+    cache.clear()
+    print("✓ 已缓存的外部数据源价格优先使用")
+
+
+def test_batch_endpoint():
+    client = APIClient()
+    items = [
+        {'device_type': '手机', 'brand': 'apple', 'model': 'iphone15pm', 'storage': '256GB', 'condition': 'good'},
+        {'device_type': '笔记本', 'brand': '联想', 'model': 'ThinkPad X1', 'storage': '1TB', 'condition': 'fair'},
+        {'device_type': '手机', 'brand': '诺基亚', 'model': '3310'},
+        {'brand': '苹果'},
+    ]
+    response = client.post('/api/recycle-orders/estimate-batch/', {'items': items}, format='json', SERVER_NAME='localhost')
+    assert response.status_code == 200, response.content
+    data = response.json()
+    assert data['count'] == 4 and data['priced'] == 2, data
+    first = data['results'][0]
+    assert first['matched_model'] == 'iPhone 15 Pro Max' and first['source'] in ('api', 'model'), first
+    assert data['results'][1]['source'] == 'local'
+    assert 'error' in data['results'][2] and 'error' in data['results'][3]
+
+    response = client.post('/api/recycle-orders/estimate-batch/', {'items': []}, format='json', SERVER_NAME='localhost')
+    assert response.status_code == 400
+    print("✓ 批量估价接口逐项返回价格、来源和置信度")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("批量估价测试")
+    print("=" * 60)
+    test_matches_single_estimate()
+    test_cached_estimate_preferred()
+    test_batch_endpoint()
+    print("\n测试完成！")
@@ -0,0 +1,97 @@
+"""
+测试估价缓存
+验证负缓存、过期后返回旧值并后台刷新、以及冷启动时同一键只计算一次
+"""
+import os
+import sys
+import threading
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.core.cache import cache
+
+from app.secondhand_app.price_cache import PriceCache
+
+
+class Counter:
+    def __init__(self, value, delay=0.0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self.value
+
+
+def test_negative_cache():
+    cache.clear()
+    price_cache = PriceCache()
+    compute = Counter(None)
+    assert price_cache.get_or_compute('test:unknown', compute) == (None, False)
+    assert price_cache.get_or_compute('test:unknown', compute) == (None, True)
+    compute.value = 0
+    price_cache.get_or_compute('test:zero', compute)
+    price_cache.get_or_compute('test:zero', compute)
+    assert compute.calls == 2, compute.calls
+    print("✓ 查不到价格（None/0）也会缓存，不会反复请求数据源")
+
+
+def test_stale_while_revalidate():
+    cache.clear()
+    price_cache = PriceCache()
+    compute = Counter(1000, delay=0.5)
+    assert price_cache.get_or_compute('test:swr', compute, fresh_ttl=1) == (1000, False)
+    time.sleep(1.1)
+
+    compute.value = 1200
+    started = time.monotonic()
+    value, cached = price_cache.get_or_compute('test:swr', compute, fresh_ttl=1)
+    elapsed = time.monotonic() - started
+    assert (value, cached) == (1000, True)
+    assert elapsed < 0.1, elapsed
+    print(f"✓ 过期后立即返回旧值（{elapsed * 1000:.0f}ms），后台刷新")
+
+    # 刷新进行中的其他请求不会重复触发刷新
+    price_cache.get_or_compute('test:swr', compute, fresh_ttl=1)
+    time.sleep(0.7)
+    assert price_cache.get_or_compute('test:swr', compute, fresh_ttl=1) == (1200, True)
+    assert compute.calls == 2, compute.calls
+    print("✓ 后台刷新完成后返回新值，刷新只执行一次")
+
+
+def test_single_flight():
+    cache.clear()
+    price_cache = PriceCache()
+    compute = Counter(3000, delay=0.3)
+    results = []
+
+    def worker():
+        results.append(price_cache.get_or_compute('test:cold', compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert compute.calls == 1, compute.calls
+    assert all(value == 3000 for value, _ in results), results
+    print("✓ 冷启动时10个并发请求只访问一次数据源")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("估价缓存测试")
+    print("=" * 60)
+    test_negative_cache()
+    test_stale_while_revalidate()
+    test_single_flight()
+    print("\n测试完成！")
@@ -0,0 +1,131 @@
+"""
+测试估价系数校准
+按已知的"真实"系数生成已完成回收订单，验证校准命令能拟合出这些系数、发布后估价生效，并可以回滚；未安装 numpy 时命令报错
+"""
+import math
+import os
+import random
+import sys
+from decimal import Decimal
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+
+from app.secondhand_app import price_calibration
+from app.secondhand_app.models import PriceDataVersion, RecycleOrder
+from app.secondhand_app.price_calibration import CoefficientFitter
+from app.secondhand_app.price_data import price_data_store
+from app.secondhand_app.price_model import price_model
+
+NOTE = 'calibration-test'
+# 与默认系数不同的"真实"系数
+TRUE_BRAND = {'华为': 0.95, '小米': 0.65}
+TRUE_CONDITION = {'fair': 0.55}
+
+
+def reset():
+    RecycleOrder.objects.filter(note=NOTE).delete()
+    PriceDataVersion.objects.filter(kind='coefficients').delete()
+    cache.delete('price_data:coefficients:version')
+    price_data_store.activate('coefficients', 0)
+
+
+def true_price(brand, model, storage, condition):
+    storage_mult, brand_mult, condition_mult, _ = price_model.multipliers(brand, model, storage, condition)
+    base = price_model._get_base_price(brand, model, storage)
+    return base * storage_mult * TRUE_BRAND.get(brand, brand_mult) * TRUE_CONDITION.get(condition, condition_mult)
+
+
+def create_orders(count=1500):
+    random.seed(7)
+    user = User.objects.first() or User.objects.create_user('calibration_test', password='x')
+    devices = [(brand, model, storage)
+               for brand, models in price_model.price_database.items()
+               for model, storages in models.items()
+               for storage in storages]
+    conditions = list(price_model.condition_multipliers)
+    orders = []
+    for _ in range(count):
+        brand, model, storage = random.choice(devices)
+        condition = random.choice(conditions)
+        price = true_price(brand, model, storage, condition) * math.exp(random.gauss(0, 0.05))
+        orders.append(RecycleOrder(
+            user=user, device_type='手机', brand=brand, model=model, storage=storage, condition=condition,
+            final_price=Decimal(f'{price:.2f}'), status='completed',
+            contact_name='测试', contact_phone='13800000000', address='测试', note=NOTE,
+        ))
+    # 型号不在价格表中的订单会被跳过
+    orders.append(RecycleOrder(
+        user=user, device_type='手机', brand='诺基亚', model='3310', condition='good',
+        final_price=Decimal('100'), status='completed',
+        contact_name='测试', contact_phone='13800000000', address='测试', note=NOTE,
+    ))
+    RecycleOrder.objects.bulk_create(orders)
+
+
+def test_fit_recovers_multipliers():
+    fitter = CoefficientFitter(price_model, ridge=1.0, model_ridge=20.0)
+    rows = RecycleOrder.objects.filter(note=NOTE).values_list('brand', 'model', 'storage', 'condition', 'final_price')
+    rows = [(b, m, s, c, float(p)) for b, m, s, c, p in rows]
+    for start in range(0, len(rows), 500):
+        fitter.add(rows[start:start + 500])
+    result = fitter.solve()
+    assert fitter.skipped >= 1
+    assert result.rmse_after < result.rmse_before, result
+    coefficients = result.coefficients
+    # 品牌与成色系数是相乘的，只比较相对比例
+    ratio = coefficients['brand']['华为'] / coefficients['brand']['苹果']
+    assert abs(ratio - 0.95) < 0.05, ratio
+    ratio = coefficients['condition']['fair'] / coefficients['condition']['good']
+    assert abs(ratio - 0.55 / 0.70) < 0.05, ratio
+    print(f"✓ 拟合出真实系数，RMSE {result.rmse_before:.3f} -> {result.rmse_after:.3f}")
+
+
+def test_command_publishes_and_rolls_back():
+    before = price_model.estimate('华为', 'Mate 60 Pro', '256GB', 'good')
+    call_command('calibrate_price_model', '--chunk-size', '300', stdout=open(os.devnull, 'w'))
+    assert price_model.coefficients_version == 1
+    after = price_model.estimate('华为', 'Mate 60 Pro', '256GB', 'good')
+    expected = true_price('华为', 'Mate 60 Pro', '256GB', 'good')
+    assert abs(after - expected) < abs(before - expected), (before, after, expected)
+    print(f"✓ 发布校准系数后估价更接近成交价：{before} -> {after}（成交价约 {expected:.0f}）")
+
+    call_command('calibrate_price_model', '--rollback', stdout=open(os.devnull, 'w'))
+    assert price_model.coefficients_version == 0
+    assert price_model.estimate('华为', 'Mate 60 Pro', '256GB', 'good') == before
+    print("✓ 回滚后恢复默认系数")
+
+
+def test_command_without_numpy():
+    np, price_calibration.np = price_calibration.np, None
+    try:
+        call_command('calibrate_price_model', '--dry-run', stdout=open(os.devnull, 'w'))
+    except CommandError as e:
+        assert 'numpy' in str(e)
+    else:
+        raise AssertionError('未安装 numpy 时应报错')
+    finally:
+        price_calibration.np = np
+    print("✓ 未安装 numpy 时校准命令给出安装提示")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("估价系数校准测试")
+    print("=" * 60)
+    reset()
+    try:
+        create_orders()
+        test_fit_recovers_multipliers()
+        test_command_publishes_and_rolls_back()
+        test_command_without_numpy()
+    finally:
+        reset()
+    print("\n测试完成！")
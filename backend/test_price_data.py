@@ -0,0 +1,129 @@
+"""
+测试价格表版本管理
+验证发布新版本后立即生效、其他进程通过版本号切换、切换时读取方不受影响，以及回滚；
+进程内缓存时其他进程直接查询数据库得到生效版本
+"""
+import os
+import sys
+import threading
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.core.cache import cache
+from django.test.utils import override_settings
+
+from app.secondhand_app.model_index import ModelNameIndex
+from app.secondhand_app.models import PriceDataVersion
+from app.secondhand_app.price_data import PriceDataStore, price_data_store, thaw
+from app.secondhand_app.price_model import PriceEstimateModel, price_model
+
+KIND = 'price_database'
+
+
+def reset():
+    PriceDataVersion.objects.filter(kind=KIND).delete()
+    cache.delete(f'price_data:{KIND}:version')
+    price_data_store.activate(KIND, 0)
+
+
+def new_table(price):
+    data = thaw(PriceEstimateModel.default_price_database)
+    data['苹果']['iPhone 16'] = {'128GB': price, '256GB': price + 800}
+    return data
+
+
+def test_publish_and_rollback():
+    reset()
+    assert price_model.data_version == 0
+    assert price_model.estimate('苹果', 'iPhone 16', '128GB', 'new') == 0
+
+    record = price_data_store.publish(KIND, new_table(7000), note='测试')
+    assert record.version == 1 and price_model.data_version == 1
+    assert price_model.estimate('苹果', 'iPhone 16', '128GB', 'new') == 7000
+    print("✓ 发布新版本后本进程立即生效，型号索引同步更新")
+
+    price_data_store.publish(KIND, new_table(7500))
+    assert price_model.estimate('苹果', 'iphone16', '128GB', 'new') == 7500
+    price_data_store.activate(KIND, price_data_store.previous_version(KIND))
+    assert price_model.data_version == 1
+    assert price_model.estimate('苹果', 'iPhone 16', '128GB', 'new') == 7000
+    price_data_store.activate(KIND, 0)
+    assert price_model.estimate('苹果', 'iPhone 16', '128GB', 'new') == 0
+    print("✓ 回滚到上一个版本和内置价格表")
+
+    try:
+        price_model.price_database['苹果'] = {}
+        raise AssertionError('快照应为只读')
+    except TypeError:
+        pass
+    print("✓ 价格表快照只读")
+
+
+@override_settings(PRICE_DATA_POLL_INTERVAL=0)
+def test_other_worker_switches():
+    reset()
+    # 另一个 worker 的数据副本
+    worker = PriceDataStore()
+    worker.register(KIND, lambda: PriceEstimateModel.default_price_database, ModelNameIndex)
+    assert worker.get(KIND).version == 0
+
+    price_data_store.publish(KIND, new_table(7000))
+    snapshot = worker.get(KIND)
+    assert snapshot.version == 1 and snapshot.derived.resolve('苹果', 'iPhone 16').model == 'iPhone 16'
+    print("✓ 其他进程检查版本号后切换到新版本")
+
+
+@override_settings(PRICE_DATA_POLL_INTERVAL=0)
+def test_local_cache_polls_database():
+    reset()
+    worker = PriceDataStore()
+    worker.register(KIND, lambda: PriceEstimateModel.default_price_database, ModelNameIndex)
+    price_data_store.publish(KIND, new_table(7000))
+    # 模拟另一个进程：进程内缓存中仍是旧版本号，数据库中的生效版本已经变化
+    cache.set(f'price_data:{KIND}:version', 0, 60)
+    assert worker.get(KIND).version == 1
+    PriceDataVersion.objects.filter(kind=KIND).update(is_active=False)
+    assert worker.get(KIND).version == 0
+    print("✓ 进程内缓存时各进程直接查询数据库中的生效版本，发布和回滚都能切换")
+
+
+@override_settings(PRICE_DATA_POLL_INTERVAL=0)
+def test_readers_during_swap():
+    reset()
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            price = price_model.estimate('苹果', 'iPhone 15 Pro Max', '256GB', 'good')
+            if price <= 0:
+                errors.append(price)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(10):
+        price_data_store.publish(KIND, new_table(7000 + i))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors[:5]
+    print("✓ 连续发布 10 个版本期间估价读取不受影响")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("价格表版本管理测试")
+    print("=" * 60)
+    try:
+        test_publish_and_rollback()
+        test_other_worker_switches()
+        test_local_cache_polls_database()
+        test_readers_during_swap()
+    finally:
+        reset()
+    print("\n测试完成！")
@@ -0,0 +1,138 @@
+"""
+测试估价数据源并发查询
+使用本地桩HTTP服务模拟快/慢/故障的数据源，验证截止时间、first/quorum 选择和慢数据源的放弃
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+import requests
+from django.core.cache import cache
+from django.test import override_settings
+
+from app.secondhand_app.price_fanout import PriceFanout, request_timeout
+from app.secondhand_app.public_api_service import PublicAPIService
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/?delay=秒&price=价格&status=状态码"""
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        time.sleep(float(query.get('delay', 0)))
+        status = int(query.get('status', 200))
+        body = json.dumps({'error_code': 0, 'price': query.get('price'), 'result': {'price': query.get('price')}})
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def stub_provider(base_url, delay, price, status=200):
+    def call():
+        response = requests.get(
+            base_url, params={'delay': delay, 'price': price, 'status': status}, timeout=request_timeout(10)
+        )
+        if response.status_code != 200:
+            return None
+        return float(response.json()['price'])
+    return call
+
+
+def test_first_answer_wins(base_url):
+    fanout = PriceFanout(max_workers=8)
+    started = time.monotonic()
+    result = fanout.run([
+        ('slow', stub_provider(base_url, 3, 5000)),
+        ('broken', stub_provider(base_url, 0, 0, status=500)),
+        ('fast', stub_provider(base_url, 0.1, 3000)),
+    ], deadline=2, policy='first')
+    elapsed = time.monotonic() - started
+    assert result == ('fast', 3000.0), result
+    assert elapsed < 1, elapsed
+    print(f"✓ first 模式返回最快的有效价格，耗时 {elapsed:.2f}s")
+
+
+def test_deadline_bounds_latency(base_url):
+    fanout = PriceFanout(max_workers=2)
+    started = time.monotonic()
+    result = fanout.run([
+        ('slow_a', stub_provider(base_url, 3, 5000)),
+        ('slow_b', stub_provider(base_url, 4, 6000)),
+    ], deadline=0.5)
+    elapsed = time.monotonic() - started
+    assert result is None, result
+    assert elapsed < 0.8, elapsed
+    print(f"✓ 所有数据源超时时在截止时间返回，耗时 {elapsed:.2f}s")
+
+    # 两个线程都被慢数据源占用过；请求超时受截止时间限制，线程很快释放，后续估价不会排队
+    time.sleep(0.3)
+    result = fanout.run([('fast', stub_provider(base_url, 0, 2000))], deadline=0.5)
+    assert result == ('fast', 2000.0), result
+    print("✓ 慢数据源在截止时间后放弃请求，线程及时释放")
+
+
+def test_quorum_median(base_url):
+    fanout = PriceFanout(max_workers=8)
+    source, price = fanout.run([
+        ('a', stub_provider(base_url, 0.05, 1000)),
+        ('b', stub_provider(base_url, 0.1, 1200)),
+        ('c', stub_provider(base_url, 0.15, 9000)),
+        ('slow', stub_provider(base_url, 3, 1)),
+    ], deadline=1, policy='quorum', quorum=3)
+    assert price == 1200.0, (source, price)
+    assert source.startswith('quorum(')
+    print(f"✓ quorum 模式取中位数: {source} = {price}")
+
+
+def test_public_api_fanout(base_url):
+    cache.clear()
+    with override_settings(
+        JUHE_API_KEY='k', JUHE_PRICE_API_URL=f'{base_url}?delay=3&price=5000',
+        BAIDU_API_KEY='k', BAIDU_PRICE_API_URL=f'{base_url}?delay=0.1&price=3500',
+        ALIYUN_API_KEY='', PRICE_ESTIMATE_DEADLINE=1,
+    ):
+        started = time.monotonic()
+        price = PublicAPIService().estimate('手机', '测试品牌', '测试型号', '128GB', 'good')
+        elapsed = time.monotonic() - started
+    assert price == 3500.0, price
+    assert elapsed < 1, elapsed
+    print(f"✓ 公开API服务并发查询，慢接口不拖慢估价: ¥{price}，耗时 {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("估价数据源并发查询测试")
+    print("=" * 60)
+    server, url = start_stub()
+    try:
+        test_first_answer_wins(url)
+        test_deadline_bounds_latency(url)
+        test_quorum_median(url)
+        test_public_api_fanout(url)
+    finally:
+        server.shutdown()
+    print("\n测试完成！")
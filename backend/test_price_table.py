@@ -0,0 +1,83 @@
+"""
+测试本地估价表
+验证估价表与智能估价模型、基础价格表的计算结果一致，别名输入可以命中，发布新价格表后自动重建
+"""
+import os
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.core.cache import cache
+
+from app.secondhand_app.models import PriceDataVersion
+from app.secondhand_app.price_data import price_data_store, thaw
+from app.secondhand_app.price_model import price_model
+from app.secondhand_app.price_service import lookup_local_base_price, price_service
+from app.secondhand_app.price_table import local_price_table
+
+
+def test_matches_model():
+    checked = 0
+    for brand, models in price_model.price_database.items():
+        for model in models:
+            for storage in list(price_model.storage_multipliers) + ['']:
+                for condition in price_model.condition_multipliers:
+                    expected = price_model.estimate(brand, model, storage, condition)
+                    assert local_price_table.lookup('手机', brand, model, storage, condition) == expected, \
+                        (brand, model, storage, condition)
+                    checked += 1
+    print(f"✓ {checked} 项手机估价与智能估价模型一致")
+
+
+def test_local_table_and_aliases():
+    expected = price_service._adjust_by_condition(lookup_local_base_price('平板', '苹果', 'iPad Air', '256GB'), 'fair')
+    assert local_price_table.lookup('平板', '苹果', 'iPad Air', '256GB', 'fair') == expected
+    assert local_price_table.lookup('平板', 'apple', 'ipad air', '256GB', 'fair') == expected
+    assert local_price_table.lookup('手机', 'apple', 'iphone15pm', '256GB', 'good') == \
+        price_model.estimate('苹果', 'iPhone 15 Pro Max', '256GB', 'good')
+    assert local_price_table.lookup('手机', '诺基亚', '3310', '', 'good') is None
+    assert local_price_table.lookup('手机', '苹果', 'iPhone 15', '3GB', 'good') is None  # 交给原有计算方式
+    print("✓ 基础价格表和别名输入命中")
+
+
+def test_rebuild_on_new_version():
+    PriceDataVersion.objects.filter(kind='price_database').delete()
+    cache.delete('price_data:price_database:version')
+    price_data_store.activate('price_database', 0)
+    before = local_price_table.stats()
+    data = thaw(price_model.price_database)
+    data['苹果']['iPhone 16'] = {'128GB': 7000}
+    price_data_store.publish('price_database', data)
+    try:
+        assert local_price_table.lookup('手机', '苹果', 'iPhone 16', '128GB', 'new') == \
+            price_model.estimate('苹果', 'iPhone 16', '128GB', 'new') > 0
+        assert local_price_table.stats().entries > before.entries
+    finally:
+        PriceDataVersion.objects.filter(kind='price_database').delete()
+        price_data_store.activate('price_database', 0)
+    print("✓ 发布新价格表后估价表自动重建")
+
+
+def test_stats():
+    stats = local_price_table.stats()
+    started = time.perf_counter()
+    for _ in range(100000):
+        local_price_table.lookup('手机', '苹果', 'iPhone 15 Pro Max', '256GB', 'good')
+    elapsed = (time.perf_counter() - started) / 100000 * 1e6
+    print(f"✓ 估价表 {stats.entries} 项，约 {stats.bytes / 1024:.0f} KB，查找 {elapsed:.1f}µs/次")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("本地估价表测试")
+    print("=" * 60)
+    test_matches_model()
+    test_local_table_and_aliases()
+    test_rebuild_on_new_version()
+    test_stats()
+    print("\n测试完成！")
@@ -0,0 +1,130 @@
+"""
+测试估价缓存预热
+验证估价请求热度统计、与回收订单合并排序、只刷新快过期的缓存，以及预热后用户请求直接命中缓存；
+默认缓存不能跨进程共享时预热命令报错
+"""
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+
+from app.secondhand_app.models import RecycleOrder
+from app.secondhand_app.price_cache import price_cache
+from app.secondhand_app.price_popularity import PopularityTracker, popular_estimates, price_popularity
+from app.secondhand_app.price_service import price_service
+
+
+def test_tracker():
+    cache.clear()
+    tracker = PopularityTracker()
+    for _ in range(3):
+        tracker.record('手机', '苹果', 'iPhone 15', '128GB', 'good')
+    tracker.record('手机', '华为', 'Mate 60', '256GB', 'good')
+    other = PopularityTracker()  # 另一个进程
+    other.record('手机', '华为', 'Mate 60', '256GB', 'good')
+    other.flush()
+    top = tracker.top(24)
+    assert top[('手机', '苹果', 'iPhone 15', '128GB', 'good')] == 3
+    assert top[('手机', '华为', 'Mate 60', '256GB', 'good')] == 2
+    print("✓ 多个进程的估价请求次数合并到缓存")
+
+
+def test_merge_orders():
+    cache.clear()
+    user, _ = User.objects.get_or_create(username='warmer_test')
+    RecycleOrder.objects.filter(user=user).delete()
+    for _ in range(2):
+        RecycleOrder.objects.create(user=user, device_type='手机', brand='小米', model='小米14', storage='256GB',
+                                    condition='good', contact_name='测试', contact_phone='13800000000', address='测试地址')
+    try:
+        for _ in range(4):
+            price_popularity.record('手机', '苹果', 'iPhone 15', '128GB', 'good')
+        keys = [key for key, _ in popular_estimates(limit=10, order_weight=5)]
+        assert keys[0] == ('手机', '小米', '小米14', '256GB', 'good'), keys
+        assert ('手机', '苹果', 'iPhone 15', '128GB', 'good') in keys
+        keys = [key for key, _ in popular_estimates(limit=10, days=0)]
+        assert keys == [('手机', '苹果', 'iPhone 15', '128GB', 'good')], keys
+    finally:
+        RecycleOrder.objects.filter(user=user).delete()
+    print("✓ 估价请求与回收订单合并排序")
+
+
+def test_refresh_if_expiring():
+    cache.clear()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 1000
+
+    assert price_cache.refresh_if_expiring('test:warm', compute, fresh_ttl=3600, ahead=900)
+    assert not price_cache.refresh_if_expiring('test:warm', compute, fresh_ttl=3600, ahead=900)
+    assert price_cache.refresh_if_expiring('test:warm', compute, fresh_ttl=3600, ahead=4000)
+    cache.add('test:warm:refreshing', 1, 30)  # 用户请求正在刷新
+    assert not price_cache.refresh_if_expiring('test:warm', compute, fresh_ttl=3600, ahead=4000)
+    assert len(calls) == 2
+    print("✓ 只刷新缺失或快过期的缓存，正在刷新的键跳过")
+
+
+def test_command_requires_shared_cache():
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+        try:
+            call_command('warm_price_cache', '--days', '0', stdout=StringIO())
+        except CommandError as e:
+            assert 'CACHE_REDIS_URL' in str(e)
+        else:
+            raise AssertionError('进程内缓存时预热命令应报错')
+    print("✓ 默认缓存是进程内缓存时预热命令报错退出")
+
+
+def test_command_warms_cache():
+    cache.clear()
+    args = ('手机', '苹果', 'iPhone 15 Pro', '256GB', 'good')
+    for _ in range(3):
+        price_popularity.record(*args)
+    out = StringIO()
+    call_command('warm_price_cache', '--days', '0', stdout=out)
+    assert '刷新 1' in out.getvalue(), out.getvalue()
+
+    calls = []
+    original = price_service._estimate_uncached
+    price_service._estimate_uncached = lambda *a: calls.append(a) or original(*a)
+    try:
+        started = time.perf_counter()
+        price, _ = price_service.estimate(*args)
+        elapsed = (time.perf_counter() - started) * 1000
+    finally:
+        del price_service._estimate_uncached
+    assert price > 0 and not calls
+    out = StringIO()
+    call_command('warm_price_cache', '--days', '0', stdout=out)
+    assert '未到期 1' in out.getvalue(), out.getvalue()
+    print(f"✓ 预热后用户请求直接命中缓存（{elapsed:.2f}ms），未到期的缓存不重复刷新")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("估价缓存预热测试")
+    print("=" * 60)
+    test_tracker()
+    test_merge_orders()
+    test_refresh_if_expiring()
+    test_command_requires_shared_cache()
+    # 文件缓存可以跨进程共享
+    with tempfile.TemporaryDirectory() as tmp, override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmp,
+    }}):
+        test_command_warms_cache()
+    print("\n测试完成！")
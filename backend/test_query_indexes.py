@@ -0,0 +1,124 @@
+"""
+测试主要列表接口的查询是否命中索引
+使用内存 SQLite 执行迁移，再通过 EXPLAIN QUERY PLAN 检查执行计划
+"""
+import os
+import sys
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+from django.conf import settings
+
+# 不依赖 MySQL：改用内存 SQLite，搜索索引也使用内存后端
+settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
+settings.SEARCH_BACKEND = 'memory'
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Q
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from app.admin_api.models import AdminAuditLog
+from app.secondhand_app.models import Message, Order, Product, VerifiedProduct
+from app.secondhand_app.views import ProductViewSet, RecycleOrderViewSet, VerifiedProductViewSet
+
+call_command('migrate', verbosity=0)
+factory = APIRequestFactory()
+USER = User.objects.create(username='index_test_user')
+OTHER = User.objects.create(username='index_test_other')
+
+
+def _viewset_queryset(viewset_class, url):
+    """按真实请求参数构造视图集的查询集"""
+    django_request = factory.get(url)
+    django_request.user = USER
+    view = viewset_class()
+    view.request = Request(django_request)
+    view.request.user = USER
+    view.format_kwarg = None
+    return view.get_queryset()
+
+
+def _assert_uses_index(label, queryset, index_name):
+    # 列表接口都是分页读取，按一页的 LIMIT 检查执行计划
+    plan = queryset[:20].explain()
+    assert (f'USING INDEX {index_name}' in plan or f'USING COVERING INDEX {index_name}' in plan), (
+        f'{label} 未命中索引 {index_name}:\n{plan}'
+    )
+    print(f"✓ {label:<36} -> {index_name}")
+
+
+def test_product_list():
+    _assert_uses_index('GET /api/products/', _viewset_queryset(ProductViewSet, '/api/products/'),
+                       'product_status_created')
+    _assert_uses_index('GET /api/products/?category=1',
+                       _viewset_queryset(ProductViewSet, '/api/products/?category=1'),
+                       'product_status_cat_created')
+    _assert_uses_index('GET /api/products/my_products/',
+                       Product.objects.filter(seller=USER).order_by('-created_at'),
+                       'product_seller_created')
+    _assert_uses_index('admin 商品列表', Product.objects.all().order_by('-created_at'), 'product_created')
+
+
+def test_verified_product_list():
+    _assert_uses_index('GET /api/verified-products/',
+                       _viewset_queryset(VerifiedProductViewSet, '/api/verified-products/'),
+                       'vproduct_status_created')
+    _assert_uses_index('GET /api/verified-products/?category=1',
+                       _viewset_queryset(VerifiedProductViewSet, '/api/verified-products/?category=1'),
+                       'vproduct_status_cat_created')
+    _assert_uses_index('GET /api/verified-products/my_products/',
+                       VerifiedProduct.objects.filter(seller=USER).order_by('-created_at'),
+                       'vproduct_seller_created')
+
+
+def test_order_list():
+    _assert_uses_index('GET /api/orders/?verified=true',
+                       Order.objects.filter(buyer=USER).order_by('-created_at'),
+                       'order_buyer_created')
+    _assert_uses_index('admin 订单列表（结算状态筛选）',
+                       Order.objects.filter(settlement_status='failed').order_by('-created_at'),
+                       'order_settlement_status')
+
+
+def test_recycle_order_list():
+    _assert_uses_index('GET /api/recycle-orders/',
+                       _viewset_queryset(RecycleOrderViewSet, '/api/recycle-orders/'),
+                       'recycle_user_created')
+    _assert_uses_index('GET /api/recycle-orders/?status=',
+                       _viewset_queryset(RecycleOrderViewSet, '/api/recycle-orders/').filter(status='pending'),
+                       'recycle_user_status_created')
+
+
+def test_message_history():
+    pair = Message.objects.filter(
+        (Q(sender=USER) & Q(receiver=OTHER)) | (Q(sender=OTHER) & Q(receiver=USER))
+    ).order_by('created_at')
+    _assert_uses_index('GET /api/messages/with_user/', pair, 'message_pair_created')
+    _assert_uses_index('收件箱', Message.objects.filter(receiver=USER).order_by('-created_at'),
+                       'message_receiver_created')
+
+
+def test_audit_log_lookup():
+    logs = AdminAuditLog.objects.filter(
+        target_type__in=['Order', 'VerifiedOrder'], target_id=1,
+        action__in=['settlement_auto', 'settlement_retry'],
+    ).order_by('created_at')
+    _assert_uses_index('admin 结算日志', logs, 'auditlog_target_action')
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("列表查询索引检查（SQLite EXPLAIN QUERY PLAN）")
+    print("=" * 70)
+    test_product_list()
+    test_verified_product_list()
+    test_order_list()
+    test_recycle_order_list()
+    test_message_history()
+    test_audit_log_lookup()
+    print("测试完成！")
@@ -0,0 +1,203 @@
+"""
+测试异步爬取引擎
+用本地桩HTTP服务模拟平台页面，验证流式解析（找到价格后停止读取）、跨块价格、每个主机的并发和请求间隔限制，
+离线批量爬取、API 端点经过引擎请求，以及请求被取消时释放半开探测名额
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.core.cache import cache
+
+from app.secondhand_app.circuit_breaker import HALF_OPEN, circuit_breakers
+from app.secondhand_app.scraper_engine import PriceExtractor, ScrapeEngine, ScrapeJob
+from app.secondhand_app.scraper_service import scraper_service
+
+FILLER = b'<div class="item">' + b'x' * 4000 + b'</div>\n'
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    active = 0
+    max_active = 0
+    starts = []
+    bytes_sent = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = FixtureHandler
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            cls.starts.append(time.monotonic())
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            if self.path.startswith('/list'):
+                # 列表页：10 个价格
+                self._chunk(''.join(f'<span class="item-price">¥{1000 + i * 100}</span>' for i in range(10)).encode())
+            elif self.path.startswith('/api'):
+                self._chunk(b'{"data": {"price": 1888}}')
+            elif self.path.startswith('/hang'):
+                time.sleep(1)
+                self._chunk(b'<b class="price">1999</b>')
+            elif self.path.startswith('/slow'):
+                time.sleep(0.05)
+                self._chunk('<b class="price">¥2,999</b>'.encode())
+            else:
+                # 搜索页：价格在第 3 块，后面还有 200 块无关内容
+                self._chunk(FILLER)
+                self._chunk(FILLER + '<div class="estimated-price"><span>￥</span>3,4'.encode())
+                self._chunk('56</div>'.encode())
+                for _ in range(200):
+                    time.sleep(0.002)
+                    self._chunk(FILLER)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:  # 客户端读到价格后提前关闭连接
+            pass
+
+    def _chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+        FixtureHandler.bytes_sent += len(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fixture():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def test_extractor_across_chunks():
+    extractor = PriceExtractor()
+    page = b'<html>' + b'a' * 3000 + b'<script>var d = {"estimatePrice": "4,321.5"}</script>' + b'b' * 3000
+    for i in range(0, len(page), 7):
+        if extractor.feed(page[i:i + 7]):
+            break
+    else:
+        extractor.feed(b'', final=True)
+    assert extractor.first() == 4321.5, extractor.prices
+    extractor = PriceExtractor()
+    extractor.feed(b'<i class="price">12</i>', final=True)  # 不合理的价格被忽略
+    assert extractor.first() is None
+    print("✓ 价格被切在两块中间时仍能解析，不合理价格被忽略")
+
+
+def test_stream_stops_early(base):
+    cache.clear()
+    engine = ScrapeEngine({'per_host_interval': 0})
+    FixtureHandler.bytes_sent = 0
+    price = engine.fetch_price_sync(ScrapeJob('test_scrape', f'{base}/search', {'q': 'iPhone 15'}))
+    assert price == 3456.0, price
+    time.sleep(0.2)
+    assert FixtureHandler.bytes_sent < 150 * len(FILLER), FixtureHandler.bytes_sent
+    print(f"✓ 流式解析：找到价格后停止读取（服务端只发出 {FixtureHandler.bytes_sent // 1024} KB，整页约 {203 * len(FILLER) // 1024} KB）")
+
+    price = engine.fetch_price_sync(ScrapeJob('test_scrape', f'{base}/list', limit=10, average=True))
+    assert price == 1450.0, price
+    print("✓ 列表页取去掉最高最低价后的平均价")
+
+
+def test_per_host_limits(base):
+    cache.clear()
+    engine = ScrapeEngine({'per_host_concurrency': 2, 'per_host_interval': 0.05})
+    FixtureHandler.max_active = 0
+    FixtureHandler.starts = []
+    jobs = [ScrapeJob('test_scrape', f'{base}/slow', {'i': i}, key=i) for i in range(20)]
+    results = list(engine.crawl(jobs, concurrency=10))
+    assert len(results) == 20 and all(price == 2999.0 for _, price in results)
+    assert FixtureHandler.max_active <= 2, FixtureHandler.max_active
+    starts = sorted(FixtureHandler.starts)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert min(gaps) >= 0.035, min(gaps)  # 服务端记录的时间有线程调度误差
+    print(f"✓ 同一主机最多 {FixtureHandler.max_active} 个并发请求，请求间隔不小于 {min(gaps) * 1000:.0f}ms")
+
+
+def test_offline_crawl_throughput(base):
+    cache.clear()
+    engine = ScrapeEngine({'per_host_concurrency': 50, 'per_host_interval': 0})
+    jobs = (ScrapeJob('test_scrape', f'{base}/search', {'q': f'model {i}'}, key=i) for i in range(500))
+    started = time.monotonic()
+    results = list(engine.crawl(jobs, concurrency=50))
+    elapsed = time.monotonic() - started
+    assert len(results) == 500 and sum(1 for _, price in results if price) == 500
+    print(f"✓ 离线爬取 500 个页面 {elapsed:.1f}s（{500 / elapsed:.0f} 页/秒）")
+
+
+def test_service_uses_engine(base):
+    cache.clear()
+    platforms = dict(scraper_service.platforms)
+    scraper_service.platforms['scrape_aihuishou'] = (f'{base}/search', 'q', {}, 1)
+    try:
+        assert scraper_service._scrape_aihuishou('手机', '苹果', 'iPhone 15', '128GB', 'good') == 3456.0
+    finally:
+        scraper_service.platforms = platforms
+    print("✓ PriceScraperService 通过爬取引擎获取价格")
+
+
+def test_api_endpoint_uses_engine(base):
+    cache.clear()
+    assert scraper_service._scrape_api_endpoint(f'{base}/api', {'q': 'iPhone 15'}) == {'data': {'price': 1888}}
+    assert circuit_breakers.get('scrape_api').snapshot()['requests'] == 1
+    print("✓ API 端点通过爬取引擎请求并计入 scrape_api 熔断器")
+
+
+def test_cancel_releases_probe(base):
+    cache.clear()
+    engine = ScrapeEngine({'per_host_interval': 0})
+    breaker = circuit_breakers.get('test_scrape')
+    breaker._trip('测试')
+    cache.delete(breaker._key('open'))  # 打开时间结束，进入半开
+    assert breaker.state() == HALF_OPEN
+    try:
+        engine.run(engine.fetch_price(ScrapeJob('test_scrape', f'{base}/hang')), timeout=0.2)
+    except FutureTimeoutError:
+        pass
+    else:
+        raise AssertionError('请求应超时')
+    time.sleep(0.1)  # 取消在引擎的事件循环中执行
+    assert breaker.state() == HALF_OPEN and breaker.allow(), '被取消的探测应释放名额'
+    breaker.reset()
+    print("✓ 探测请求被取消时释放半开探测名额，不用等 probe_timeout")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("异步爬取引擎测试")
+    print("=" * 60)
+    server, base = start_fixture()
+    try:
+        test_extractor_across_chunks()
+        test_stream_stops_early(base)
+        test_per_host_limits(base)
+        test_offline_crawl_throughput(base)
+        test_service_uses_engine(base)
+        test_api_endpoint_uses_engine(base)
+        test_cancel_releases_probe(base)
+    finally:
+        server.shutdown()
+    print("\n测试完成！")
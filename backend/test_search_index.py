@@ -0,0 +1,176 @@
+"""
+测试商品全文搜索索引（内存后端与 SQLite FTS5 后端）
+以及商品保存、删除的事务提交后才更新索引，回滚时索引不变
+"""
+import os
+import sys
+import tempfile
+import time
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import override_settings
+
+from app.secondhand_app.models import Category, Product
+from app.secondhand_app.search_service import (
+    MemorySearchBackend, SQLiteFTSSearchBackend, ProductSearchIndex, build_document, search_index, tokenize
+)
+
+DOCUMENTS = {
+    1: {'title': '苹果 iPhone15 Pro 256GB 国行', 'brand': '苹果', 'model': 'iPhone 15 Pro', 'description': '电池健康95%'},
+    2: {'title': '华为Mate60 Pro 手机', 'brand': '华为', 'model': 'Mate 60 Pro', 'description': '屏幕完好，无划痕'},
+    3: {'title': '九成新笔记本电脑', 'brand': '', 'model': '', 'description': '适合办公，附送苹果鼠标'},
+    4: {'title': '小米14 徕卡影像', 'brand': '小米', 'model': '小米14', 'description': '99新'},
+}
+
+
+def _check_backend(name, backend):
+    index = ProductSearchIndex(backend)
+    for doc_id, document in DOCUMENTS.items():
+        backend.upsert('product', doc_id, document)
+
+    # 标题命中排在描述命中之前
+    assert index.search('product', '苹果') == [1, 3], index.search('product', '苹果')
+    # 英文大小写、字母数字连写
+    assert index.search('product', 'mate60') == [2]
+    assert index.search('product', 'IPHONE 15') == [1]
+    # 单字前缀、英文前缀
+    assert 4 in index.search('product', '米')
+    assert index.search('product', 'iph') == [1]
+    # 多词 AND 语义
+    assert index.search('product', '笔记本 鼠标') == [3]
+    assert index.search('product', '华为 鼠标') == []
+
+    # 增量更新与删除
+    backend.upsert('product', 2, {'title': '荣耀 Magic6', 'brand': '荣耀', 'model': 'Magic6', 'description': ''})
+    assert index.search('product', 'mate60') == []
+    assert index.search('product', '荣耀') == [2]
+    backend.delete('product', 2)
+    assert index.search('product', '荣耀') == []
+    print(f"✓ {name} 后端检索结果正确")
+
+
+def _benchmark(name, backend, count=20000):
+    for i in range(count):
+        backend.upsert('verified_product', i + 1, {
+            'title': f'二手手机 型号{i % 500} 编号{i}',
+            'brand': ['苹果', '华为', '小米', 'vivo'][i % 4],
+            'model': f'Model {i % 300}',
+            'description': '成色良好，功能正常',
+        })
+    index = ProductSearchIndex(backend)
+    start = time.perf_counter()
+    for _ in range(50):
+        ids = index.search('verified_product', '华为 model 42', limit=20)
+    elapsed = (time.perf_counter() - start) / 50 * 1000
+    print(f"  {name}: {count} 个商品，单次查询 {elapsed:.2f}ms，命中 {len(ids)} 条")
+
+
+def test_tokenize():
+    assert tokenize('iPhone15Pro') == ['iphone', '15', 'pro']
+    tokens = tokenize('苹果手机')
+    assert '苹果' in tokens and '手机' in tokens
+    print("✓ 分词正确:", tokens)
+
+
+def test_memory_backend():
+    _check_backend('memory', MemorySearchBackend())
+
+
+def test_sqlite_fts_backend():
+    with tempfile.TemporaryDirectory() as tmp:
+        _check_backend('sqlite_fts', SQLiteFTSSearchBackend(os.path.join(tmp, 'index.sqlite3')))
+
+
+def test_filter_before_truncate():
+    """相关度靠前的结果都不满足筛选条件时，仍能返回排在后面的匹配商品"""
+    seller, _ = User.objects.get_or_create(username='search_filter_test')
+    Product.objects.filter(seller=seller).delete()
+    phones, _ = Category.objects.get_or_create(name='搜索测试-手机')
+    cables, _ = Category.objects.get_or_create(name='搜索测试-配件')
+    # 标题命中的 30 个在手机分类，只有描述命中的 3 个在配件分类（相关度最低）
+    products = [
+        Product.objects.create(seller=seller, category=phones, title=f'zebraphone 旗舰 {i}', description='成色良好',
+                               price=1000 + i, location='上海')
+        for i in range(30)
+    ] + [
+        Product.objects.create(seller=seller, category=cables, title=f'数据线 {i}', description='适配 zebraphone',
+                               price=20 + i, location='上海')
+        for i in range(3)
+    ]
+    backend = MemorySearchBackend()
+    for product in products:
+        backend.upsert('product', product.pk, build_document('product', product))
+    index = ProductSearchIndex(backend)
+    queryset = Product.objects.filter(seller=seller)
+
+    with override_settings(SEARCH_MAX_RESULTS=5, SEARCH_MAX_CANDIDATES=100):
+        assert len(index.search('product', 'zebraphone')) == 5
+        found = list(index.filter_queryset(queryset.filter(category=cables), 'product', 'zebraphone'))
+        assert sorted(p.pk for p in found) == sorted(p.pk for p in products[30:]), found
+        found = list(index.filter_queryset(queryset.filter(price__lt=1003), 'product', 'zebraphone'))
+        assert {p.pk for p in found[:3]} == {p.pk for p in products[:3]} and len(found) == 5, found  # 标题命中排在前面
+        # 没有筛选条件时按相关度截断
+        found = list(index.filter_queryset(queryset, 'product', 'zebraphone'))
+        assert len(found) == 5 and all(p.category_id == phones.pk for p in found)
+    with override_settings(SEARCH_MAX_RESULTS=5, SEARCH_MAX_CANDIDATES=10):
+        # 达到候选上限后不再扩大检索范围
+        assert list(index.filter_queryset(queryset.filter(category=cables), 'product', 'zebraphone')) == []
+
+    Product.objects.filter(seller=seller).delete()
+    Category.objects.filter(pk__in=[phones.pk, cables.pk]).delete()
+    print("✓ 检索结果先按分类、价格筛选再截断，宽泛关键词加筛选条件不会漏掉匹配的商品")
+
+
+def test_index_after_commit():
+    """信号在事务提交后才写索引：回滚的新建、删除不会留在索引里"""
+    seller, _ = User.objects.get_or_create(username='search_commit_test')
+    Product.objects.filter(seller=seller).delete()
+    original, search_index._backend = search_index._backend, MemorySearchBackend()
+    fields = dict(seller=seller, description='事务测试', price=100, location='上海')
+    try:
+        try:
+            with transaction.atomic():
+                Product.objects.create(title='quokkaphone 回滚', **fields)
+                assert search_index.search('product', 'quokkaphone') == []  # 提交前不写索引
+                raise RuntimeError('rollback')
+        except RuntimeError:
+            pass
+        assert search_index.search('product', 'quokkaphone') == []
+
+        with transaction.atomic():
+            kept = Product.objects.create(title='quokkaphone 保留', **fields)
+        assert search_index.search('product', 'quokkaphone') == [kept.pk]
+
+        try:
+            with transaction.atomic():
+                Product.objects.filter(pk=kept.pk).delete()
+                raise RuntimeError('rollback')
+        except RuntimeError:
+            pass
+        assert search_index.search('product', 'quokkaphone') == [kept.pk]
+        kept.delete()
+        assert search_index.search('product', 'quokkaphone') == []
+    finally:
+        search_index._backend = original
+        Product.objects.filter(seller=seller).delete()
+    print("✓ 事务提交后才更新索引，回滚的新建和删除不影响索引")
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("商品全文搜索索引测试")
+    print("=" * 70)
+    test_tokenize()
+    test_memory_backend()
+    test_sqlite_fts_backend()
+    test_filter_before_truncate()
+    test_index_after_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        _benchmark('sqlite_fts', SQLiteFTSSearchBackend(os.path.join(tmp, 'bench.sqlite3')))
+    print("测试完成！")
@@ -0,0 +1,130 @@
+"""
+测试图片流式上传
+验证按文件头识别图片类型、超过大小或数量的文件被跳过、请求过大直接返回 413，
+接收时计算的哈希直接用于图片存储，以及头像上传
+"""
+import hashlib
+import io
+import os
+import sys
+import tempfile
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from app.secondhand_app.image_variants import variant_pipeline
+from app.secondhand_app.models import ImageBlob, Product, ProductImage, UserProfile
+from app.secondhand_app.upload_handlers import detect_image_type
+
+USERNAME = 'upload_test'
+
+
+def make_image(fmt, size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def test_detect_type():
+    assert detect_image_type(make_image('JPEG')[:12]) == 'jpeg'
+    assert detect_image_type(make_image('PNG')[:12]) == 'png'
+    assert detect_image_type(make_image('WEBP')[:12]) == 'webp'
+    assert detect_image_type(make_image('GIF')[:12]) == 'gif'
+    assert detect_image_type(b'<?php echo 1;') is None
+    print("✓ 按文件头识别 JPEG/PNG/WebP/GIF，拒绝伪装成图片的文件")
+
+
+def test_upload_images():
+    Product.objects.filter(seller__username=USERNAME).delete()
+    user, _ = User.objects.get_or_create(username=USERNAME)
+    client = APIClient()
+    client.force_authenticate(user)
+    product = Product.objects.create(seller=user, title='上传测试', description='上传测试', price=100, location='上海')
+
+    jpeg = make_image('JPEG')
+    webp = make_image('WEBP')
+    big = make_image('JPEG') + b'\0' * (2 * 1024 * 1024)
+    with override_settings(UPLOAD_IMAGE_MAX_SIZE=1024 * 1024, UPLOAD_IMAGE_MAX_FILES=4):
+        response = client.post(f'/api/products/{product.pk}/upload_images/', {'images': [
+            SimpleUploadedFile('a.jpg', jpeg),
+            SimpleUploadedFile('shell.jpg', b'<?php system($_GET["c"]); ?>' * 10),
+            SimpleUploadedFile('big.jpg', big),
+            SimpleUploadedFile('b.png', webp),  # 扩展名与内容不符，按内容保存为 .webp
+            SimpleUploadedFile('tiny.jpg', b'\xff\xd8'),
+        ]}, format='multipart')
+    assert response.status_code == 200, response.content
+    uploads = response.json()['uploads']
+    assert [u['status'] for u in uploads] == ['stored', 'rejected', 'rejected', 'stored', 'rejected'], uploads
+    assert '图片格式' in uploads[1]['detail'] and '1MB' in uploads[2]['detail']
+    assert uploads[2]['size'] < len(big)  # 超过上限后不再接收
+    print(f"✓ 逐个文件返回处理结果：{[(u['name'], u['status'], u.get('detail', '')) for u in uploads]}")
+
+    images = ProductImage.objects.filter(product=product).order_by('pk')
+    assert images.count() == 2 and images[0].is_primary
+    blob = images[1].blob
+    assert blob.sha256 == hashlib.sha256(webp).hexdigest() and blob.file.name.endswith('.webp')
+    assert default_storage.open(blob.file.name).read() == webp
+    assert not os.listdir(os.path.join(default_storage.location, '.upload_tmp'))  # 临时文件已移动或删除
+    print("✓ 接收时计算的哈希直接用于图片存储，临时文件被移动到存储路径")
+
+    with override_settings(UPLOAD_IMAGE_MAX_SIZE=1024 * 1024, UPLOAD_IMAGE_MAX_FILES=1):
+        response = client.post(f'/api/products/{product.pk}/upload_images/', {'images': [
+            SimpleUploadedFile('a.jpg', jpeg), SimpleUploadedFile('c.jpg', make_image('JPEG', (10, 10))),
+        ]}, format='multipart')
+        assert [u['status'] for u in response.json()['uploads']] == ['stored', 'rejected']
+
+        response = client.post(f'/api/products/{product.pk}/upload_images/', {'images': [
+            SimpleUploadedFile('huge.jpg', b'\xff\xd8\xff' + b'\0' * (3 * 1024 * 1024)),
+        ]}, format='multipart')
+        assert response.status_code == 413, response.status_code
+    print("✓ 超过单次数量的文件被跳过，请求体超过总上限直接返回 413")
+
+    response = client.post(f'/api/products/{product.pk}/upload_images/', {'images': [
+        SimpleUploadedFile('x.txt', b'not an image at all'),
+    ]}, format='multipart')
+    assert response.status_code == 400 and response.json()['uploads'][0]['status'] == 'rejected'
+    Product.objects.filter(seller=user).delete()
+
+
+def test_upload_avatar():
+    user = User.objects.get(username=USERNAME)
+    client = APIClient()
+    client.force_authenticate(user)
+    response = client.post('/api/users/upload_avatar/', {'avatar': SimpleUploadedFile('me.png', make_image('PNG'))},
+                           format='multipart')
+    assert response.status_code == 200, response.content
+    assert response.json()['uploads'][0]['status'] == 'stored'
+    profile = UserProfile.objects.get(user=user)
+    assert profile.avatar.name.startswith('avatars/') and profile.avatar.name.endswith('.png')
+
+    with override_settings(UPLOAD_AVATAR_MAX_SIZE=1024):
+        response = client.post('/api/users/upload_avatar/', {
+            'avatar': SimpleUploadedFile('me.jpg', make_image('JPEG', (400, 400)) + b'\0' * 2048),
+        }, format='multipart')
+    assert response.status_code == 400 and response.json()['uploads'][0]['status'] == 'rejected', response.content
+    print("✓ 头像上传校验类型和大小")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("图片流式上传测试")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp):
+        try:
+            test_detect_type()
+            test_upload_images()
+            test_upload_avatar()
+        finally:
+            variant_pipeline.shutdown()
+            ImageBlob.objects.filter(product_images__isnull=True, verified_product_images__isnull=True).delete()
+    print("\n测试完成！")
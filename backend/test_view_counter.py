@@ -0,0 +1,172 @@
+"""
+测试商品浏览次数统计
+验证详情接口不直接写数据库、同一用户重复浏览只计一次、批量写入 view_count 以及按浏览次数排序，
+只有来自可信代理的请求才读取 X-Forwarded-For
+"""
+import os
+import sys
+import threading
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from app.secondhand_app.models import Product, VerifiedProduct
+from app.secondhand_app.view_counter import ViewCounter, view_counter
+
+SELLER = 'view_counter_seller'
+VIEWERS = ['view_counter_a', 'view_counter_b', 'view_counter_c']
+
+
+def setup_products():
+    Product.objects.filter(seller__username=SELLER).delete()
+    VerifiedProduct.objects.filter(seller__username=SELLER).delete()
+    seller, _ = User.objects.get_or_create(username=SELLER)
+    products = [
+        Product.objects.create(seller=seller, title=f'浏览测试{i}', description='浏览测试', price=100, location='上海')
+        for i in range(3)
+    ]
+    verified = VerifiedProduct.objects.create(seller=seller, title='验货浏览测试', description='浏览测试',
+                                              price=100, location='上海')
+    return seller, products, verified
+
+
+def client_for(username=None, **headers):
+    client = APIClient(**headers)
+    if username:
+        user, _ = User.objects.get_or_create(username=username)
+        client.force_authenticate(user)
+    return client
+
+
+def test_detail_does_not_write():
+    cache.clear()
+    view_counter.flush()
+    _, products, _ = setup_products()
+    product = products[0]
+    client = client_for(VIEWERS[0])
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(5):
+            assert client.get(f'/api/products/{product.pk}/').status_code == 200
+    assert not [q for q in queries.captured_queries if q['sql'].lstrip().upper().startswith('UPDATE')]
+    assert view_counter.pending(product) == 1  # 同一用户重复浏览只计一次
+    product.refresh_from_db()
+    assert product.view_count == 0
+    print("✓ 详情接口只在内存中计数，不写数据库；同一用户重复浏览只计一次")
+
+
+def test_dedup_and_flush():
+    cache.clear()
+    view_counter.flush()
+    seller, products, verified = setup_products()
+    hot, warm, cold = products
+
+    for name in VIEWERS:
+        client_for(name).get(f'/api/products/{hot.pk}/')
+    client_for(VIEWERS[0]).get(f'/api/products/{warm.pk}/')
+    client_for(SELLER).get(f'/api/products/{warm.pk}/')  # 卖家本人不计
+    # 未登录按 IP + User-Agent 区分
+    client_for(REMOTE_ADDR='10.0.0.1').get(f'/api/products/{warm.pk}/')
+    client_for(REMOTE_ADDR='10.0.0.1').get(f'/api/products/{warm.pk}/')
+    client_for(REMOTE_ADDR='10.0.0.2').get(f'/api/products/{warm.pk}/')
+    client_for(VIEWERS[1]).get(f'/api/verified-products/{verified.pk}/')
+
+    with CaptureQueriesContext(connection) as queries:
+        updated = view_counter.flush()
+    updates = [q for q in queries.captured_queries if q['sql'].lstrip().upper().startswith('UPDATE')]
+    # 按增量分组：hot、warm 都 +3 合并为一条，验货商品 +1 一条
+    assert updated == 3 and len(updates) == 2, (updated, [q['sql'] for q in updates])
+    for obj, expected in ((hot, 3), (warm, 3), (cold, 0), (verified, 1)):
+        obj.refresh_from_db()
+        assert obj.view_count == expected, (obj, obj.view_count)
+    assert view_counter.flush() == 0
+    print(f"✓ 去重后批量写入：{len(updates)} 条 UPDATE 更新 {updated} 个商品")
+
+    with override_settings(VIEW_COUNT_DEDUP_SECONDS=0):
+        client = client_for(VIEWERS[0])
+        for _ in range(5):
+            client.get(f'/api/products/{cold.pk}/')
+    view_counter.flush()
+    cold.refresh_from_db()
+    assert cold.view_count == 5, cold.view_count
+
+    data = client_for().get('/api/products/', {'ordering': '-view_count'}).json()
+    results = data['results'] if isinstance(data, dict) else data
+    ours = [item['id'] for item in results if item['id'] in {p.pk for p in products}]
+    assert ours[0] == cold.pk, ours
+    print("✓ 按浏览次数排序返回")
+
+
+def test_concurrent_records():
+    cache.clear()
+    _, products, _ = setup_products()
+    product = products[0]
+    counter = ViewCounter()
+    users = [User.objects.get_or_create(username=f'view_counter_u{i}')[0] for i in range(40)]
+
+    class FakeRequest:
+        META = {}
+
+        def __init__(self, user):
+            self.user = user
+
+    with override_settings(VIEW_COUNT_FLUSH_INTERVAL=0):
+        threads = [threading.Thread(target=counter.record, args=(product, FakeRequest(user))) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    counter.flush()
+    product.refresh_from_db()
+    assert product.view_count == 40, product.view_count
+    print("✓ 多线程同时浏览和写入不丢计数")
+
+
+def test_forwarded_for_needs_trusted_proxy():
+    cache.clear()
+    view_counter.flush()
+    _, products, _ = setup_products()
+    product = products[0]
+
+    # 直连的客户端每次伪造不同的 X-Forwarded-For 只计一次
+    for i in range(5):
+        client_for(REMOTE_ADDR='203.0.113.9', HTTP_X_FORWARDED_FOR=f'198.51.100.{i}').get(f'/api/products/{product.pk}/')
+    assert view_counter.pending(product) == 1
+
+    with override_settings(VIEW_COUNT_TRUSTED_PROXIES=['10.0.0.0/8']):
+        # 经可信代理转发：取代理左侧第一个不可信地址，客户端自己在左侧填写的地址不影响计数
+        for i in range(3):
+            client_for(REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR=f'198.51.100.{i}, 192.0.2.7, 10.0.0.4').get(
+                f'/api/products/{product.pk}/')
+        assert view_counter.pending(product) == 2
+        client_for(REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR='192.0.2.8').get(f'/api/products/{product.pk}/')
+        assert view_counter.pending(product) == 3
+        # 不是可信代理时忽略 X-Forwarded-For
+        client_for(REMOTE_ADDR='203.0.113.9', HTTP_X_FORWARDED_FOR='192.0.2.9').get(f'/api/products/{product.pk}/')
+        assert view_counter.pending(product) == 3
+    print("✓ 只有来自可信代理的请求才读取 X-Forwarded-For，伪造的地址不能重复计数")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("商品浏览次数统计测试")
+    print("=" * 60)
+    try:
+        test_detail_does_not_write()
+        test_dedup_and_flush()
+        test_concurrent_records()
+        test_forwarded_for_needs_trusted_proxy()
+    finally:
+        view_counter.flush()
+        Product.objects.filter(seller__username=SELLER).delete()
+        VerifiedProduct.objects.filter(seller__username=SELLER).delete()
+    print("\n测试完成！")
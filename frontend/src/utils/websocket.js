@@ -74,6 +74,24 @@ class WebSocketManager {
     return false
   }
 
+  // 把对方发来的、ID 不超过 upToId 的消息标记为已读（服务端合并写库）
+  markRead(partnerId, upToId) {
+    return this.send({ type: 'mark_read', partner_id: partnerId, up_to_id: upToId })
+  }
+
+  sendTyping(receiverId, isTyping = true) {
+    return this.send({ type: 'typing', receiver_id: receiverId, is_typing: isTyping })
+  }
+
+  // 订阅用户在线状态，变化时收到 type 为 presence 的消息
+  subscribePresence(userIds) {
+    return this.send({ type: 'presence_subscribe', user_ids: userIds })
+  }
+
+  unsubscribePresence(userIds) {
+    return this.send({ type: 'presence_unsubscribe', user_ids: userIds })
+  }
+
   disconnect() {
     if (this.ws) {
       this.ws.close()